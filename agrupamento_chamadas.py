@@ -0,0 +1,246 @@
+"""
+Agrupamento de Chamadas Idênticas em Andamento (Single-Flight)
+==============================================================
+
+Em picos de acesso, muitos usuários pedem a mesma coisa ao mesmo tempo
+(ex.: {"interesse": "praias"} nas cadeias das aulas 003 e 004). O cache
+de respostas só ajuda depois que a primeira resposta chega: até lá, cada
+pedido faz a sua própria chamada ao provedor.
+
+Com o agrupamento, a primeira chamada para um prompt (a "líder") vai ao
+provedor e as chamadas idênticas que chegam enquanto ela está em andamento
+esperam o mesmo resultado, sem nova requisição. Terminada a líder, a
+próxima chamada com o mesmo prompt volta a ir ao provedor (ou ao cache).
+
+Conceitos abordados:
+- Chave da chamada: mensagens renderizadas + parâmetros do modelo (a
+  mesma llm_string usada pelo cache do LangChain), em um hash SHA-256
+- concurrent.futures.Future como resultado compartilhado: threads esperam
+  com .result() e corrotinas com asyncio.wrap_future, então chamadas
+  síncronas e assíncronas se agrupam entre si
+- asyncio.shield: cancelar uma chamada que espera não cancela a líder;
+  se a líder for cancelada, uma das que esperam assume a chamada
+- Erros da líder são repassados a todas as chamadas agrupadas
+- Contadores de chamadas líderes e agrupadas
+
+O agrupamento atua em _generate/_agenerate, depois da consulta ao cache;
+o streaming (stream/astream) não é agrupado.
+
+Configuração por variáveis de ambiente (lidas por `agrupamento_para_temperatura()`):
+- LLM_AGRUPAR=0                     desativa o agrupamento em criar_modelo
+- LLM_AGRUPAR_TEMPERATURA_MAXIMA    modelos com temperature acima deste valor
+                                    não agrupam chamadas (padrão: 1.0)
+
+Uso:
+    from agrupamento_chamadas import classe_agrupada
+
+    ModeloAgrupado = classe_agrupada(ModeloChatFake)
+    modelo = ModeloAgrupado(latencia_s=0.5)
+
+    python agrupamento_chamadas.py --usuarios 200   # rajada no servidor fake
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+
+from instrumentacao import METRICAS, Metricas
+
+
+class _LiderCancelada(Exception):
+    """A chamada líder foi cancelada: quem esperava por ela tenta de novo."""
+
+
+class AgrupadorChamadas:
+    """
+    Executa no máximo uma chamada por chave de cada vez; chamadas com a
+    mesma chave feitas enquanto ela está em andamento recebem o mesmo
+    resultado (ou a mesma exceção).
+    """
+
+    def __init__(self, metricas: Metricas = METRICAS):
+        self.metricas = metricas
+        self._em_andamento: Dict[str, Future] = {}
+        self._trava = threading.Lock()
+        # Contadores do processo atual
+        self.lideres = 0
+        self.agrupadas = 0
+
+    def _entrar(self, chave: str) -> Tuple[Future, bool]:
+        """Retorna (futuro da chave, True se esta chamada é a líder)."""
+        with self._trava:
+            futuro = self._em_andamento.get(chave)
+            if futuro is not None:
+                self.agrupadas += 1
+                lider = False
+            else:
+                futuro = self._em_andamento[chave] = Future()
+                self.lideres += 1
+                lider = True
+        self.metricas.incrementar("llm_agrupamento_total", papel="lider" if lider else "agrupada")
+        return futuro, lider
+
+    def _sair(self, chave: str, futuro: Future) -> None:
+        with self._trava:
+            if self._em_andamento.get(chave) is futuro:
+                del self._em_andamento[chave]
+
+    def executar(self, chave: str, funcao: Callable[[], Any]) -> Any:
+        """Executa `funcao()` ou espera a chamada idêntica em andamento (threads)."""
+        while True:
+            futuro, lider = self._entrar(chave)
+            if not lider:
+                try:
+                    return futuro.result()
+                except _LiderCancelada:
+                    continue
+            try:
+                resultado = funcao()
+            except BaseException as erro:
+                self._sair(chave, futuro)
+                futuro.set_exception(erro)
+                raise
+            self._sair(chave, futuro)
+            futuro.set_result(resultado)
+            return resultado
+
+    async def aexecutar(self, chave: str, funcao: Callable[[], Awaitable[Any]]) -> Any:
+        """Versão assíncrona de executar(); agrupa-se também com chamadas síncronas."""
+        while True:
+            futuro, lider = self._entrar(chave)
+            if not lider:
+                try:
+                    # shield: cancelar esta espera não cancela o futuro compartilhado
+                    return await asyncio.shield(asyncio.wrap_future(futuro))
+                except _LiderCancelada:
+                    continue
+            try:
+                resultado = await funcao()
+            except asyncio.CancelledError:
+                self._sair(chave, futuro)
+                futuro.set_exception(_LiderCancelada())
+                raise
+            except BaseException as erro:
+                self._sair(chave, futuro)
+                futuro.set_exception(erro)
+                raise
+            self._sair(chave, futuro)
+            futuro.set_result(resultado)
+            return resultado
+
+    def estatisticas(self) -> dict:
+        chamadas = self.lideres + self.agrupadas
+        return {
+            "chamadas": chamadas,
+            "lideres": self.lideres,
+            "agrupadas": self.agrupadas,
+            "em_andamento": len(self._em_andamento),
+            "taxa_agrupamento": self.agrupadas / chamadas if chamadas else 0.0,
+        }
+
+
+# Agrupador padrão do processo
+AGRUPADOR = AgrupadorChamadas()
+
+
+class AgrupamentoMixin:
+    """
+    Mixin para modelos de chat do LangChain: agrupa chamadas idênticas de
+    _generate/_agenerate no AGRUPADOR do processo.
+    """
+
+    def _chave_agrupamento(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        texto = self._get_llm_string(stop=stop, **kwargs) + "\n" + dumps(messages)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        chave = self._chave_agrupamento(messages, stop, kwargs)
+        return AGRUPADOR.executar(
+            chave, lambda: super(AgrupamentoMixin, self)._generate(messages, stop, run_manager, **kwargs)
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        chave = self._chave_agrupamento(messages, stop, kwargs)
+        return await AGRUPADOR.aexecutar(
+            chave, lambda: super(AgrupamentoMixin, self)._agenerate(messages, stop, run_manager, **kwargs)
+        )
+
+
+@lru_cache(maxsize=None)
+def classe_agrupada(classe: type) -> type:
+    """
+    Subclasse de `classe` (ex.: ChatOpenAI) com agrupamento de chamadas.
+
+    A subclasse mantém o nome da original: o id de serialização do
+    LangChain, e com ele as chaves do cache de respostas, não mudam.
+    """
+    return type(classe.__name__, (AgrupamentoMixin, classe), {"__doc__": classe.__doc__})
+
+
+def agrupamento_para_temperatura(temperature: Optional[float]) -> bool:
+    """
+    True se criar_modelo deve agrupar chamadas: LLM_AGRUPAR não é 0 e a
+    temperature não excede LLM_AGRUPAR_TEMPERATURA_MAXIMA (com temperatures
+    altas, cada usuário deve receber a sua própria amostra).
+    """
+    if os.getenv("LLM_AGRUPAR", "1") == "0":
+        return False
+    limite = float(os.getenv("LLM_AGRUPAR_TEMPERATURA_MAXIMA", 1.0))
+    return temperature is None or temperature <= limite
+
+
+def main():
+    """Rajada de pedidos iguais nas aulas 003 e 004, com e sem agrupamento, no servidor fake."""
+    parser = argparse.ArgumentParser(description="Agrupamento de chamadas idênticas (single-flight)")
+    parser.add_argument("--usuarios", type=int, default=200, help="Pedidos simultâneos por rodada")
+    parser.add_argument("--interesses", type=int, default=3, help="Interesses distintos entre os pedidos")
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import aula003
+    import aula004
+    from fabrica_modelo import criar_modelo
+    from servidor_fake import ServidorFake
+
+    entradas = [{"interesse": f"praias {i % args.interesses}"} for i in range(args.usuarios)]
+
+    with ServidorFake(latencia_s=0.3) as servidor:
+        for agrupar in (False, True):
+            modelo = criar_modelo(
+                model_name="gpt-fake", openai_api_key="fake", base_url=servidor.url, cache=False, agrupar=agrupar
+            )
+            for nome, cadeia in (("aula003", aula003.criar_cadeia(modelo)), ("aula004", aula004.criar_cadeia(modelo))):
+                antes = servidor.estatisticas["requisicoes"]
+                inicio = time.perf_counter()
+                # Metade dos pedidos em threads, metade em asyncio, ao mesmo tempo
+                with ThreadPoolExecutor(args.usuarios // 2) as executor:
+                    sincronos = executor.map(cadeia.invoke, entradas[::2])
+
+                    async def assincronos():
+                        return await asyncio.gather(*(cadeia.ainvoke(entrada) for entrada in entradas[1::2]))
+
+                    asyncio.run(assincronos())
+                    list(sincronos)
+                print(
+                    f"{nome} {'com' if agrupar else 'sem'} agrupamento: {len(entradas)} pedidos, "
+                    f"{servidor.estatisticas['requisicoes'] - antes} chamadas ao servidor "
+                    f"em {time.perf_counter() - inicio:.2f}s"
+                )
+    # Os modelos usam o módulo importado pela fabrica_modelo, não este __main__
+    from agrupamento_chamadas import AGRUPADOR as agrupador
+
+    print("Agrupador:", agrupador.estatisticas())
+
+
+if __name__ == "__main__":
+    main()
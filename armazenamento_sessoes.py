@@ -0,0 +1,317 @@
+"""
+Armazenamento Persistente de Sessões de Conversa (SQLite)
+=========================================================
+
+O dicionário `memoria = {}` da aula006 perde todas as sessões ao reiniciar
+e mantém o histórico completo de todas elas na RAM. Este módulo guarda as
+mensagens em um log SQLite (apenas inserções) e carrega cada sessão sob
+demanda, mantendo na memória apenas as sessões usadas recentemente.
+
+Conceitos abordados:
+- BaseChatMessageHistory persistente para o RunnableWithMessageHistory
+- Carga preguiçosa: nada é lido na inicialização; a sessão é carregada
+  (consulta indexada por sessao_id) no primeiro acesso
+- Cache LRU de sessões ativas com tamanho máximo
+- Gravação em grupo (group commit): uma thread de fundo agrupa as
+  mensagens de várias sessões em uma única transação
+- Falhas de gravação não param a thread: o lote é repetido e, se ainda
+  falhar, gravado operação por operação; as que não entram vão para
+  `falhas` e para a métrica `sessoes_gravacao_descartadas_total`
+- Compactação em segundo plano: remove mensagens excedentes, faz o
+  checkpoint do WAL e devolve páginas livres ao sistema de arquivos
+
+Uso:
+    armazenamento = ArmazenamentoSessoes("dados/sessoes.sqlite")
+
+    cadeia_com_memoria = RunnableWithMessageHistory(
+        runnable=cadeia,
+        get_session_history=armazenamento.obter,
+        ...
+    )
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from instrumentacao import METRICAS, Metricas
+
+logger = logging.getLogger(__name__)
+
+
+ARQUIVO_PADRAO = os.path.join("dados", "sessoes.sqlite")
+
+
+class HistoricoPersistente(BaseChatMessageHistory):
+    """Histórico de uma sessão: mensagens em memória, gravação delegada ao armazenamento."""
+
+    def __init__(self, armazenamento: "ArmazenamentoSessoes", sessao_id: str, mensagens: List[BaseMessage]):
+        self.armazenamento = armazenamento
+        self.sessao_id = sessao_id
+        self._mensagens = mensagens
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self._mensagens)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._mensagens.extend(messages)
+        self.armazenamento._enfileirar(("inserir", self.sessao_id, list(messages)))
+
+    def clear(self) -> None:
+        self._mensagens.clear()
+        self.armazenamento._enfileirar(("limpar", self.sessao_id, None))
+
+
+class ArmazenamentoSessoes:
+    """
+    Fábrica de históricos persistentes (use `obter` como get_session_history).
+
+    - arquivo: caminho do banco SQLite
+    - max_sessoes_em_memoria: tamanho do cache LRU de sessões carregadas
+    - max_lote: número máximo de operações por transação de gravação
+    - intervalo_gravacao_s: espera máxima para acumular um lote
+    - max_mensagens_por_sessao: retenção aplicada na compactação, no disco e nas
+      sessões em memória (None = sem limite)
+    - intervalo_compactacao_s: intervalo entre compactações (None = desativada)
+    """
+
+    def __init__(
+        self,
+        arquivo: str = ARQUIVO_PADRAO,
+        max_sessoes_em_memoria: int = 1000,
+        max_lote: int = 500,
+        intervalo_gravacao_s: float = 0.05,
+        max_mensagens_por_sessao: Optional[int] = None,
+        intervalo_compactacao_s: Optional[float] = 300.0,
+        tentativas_gravacao: int = 3,
+        metricas: Metricas = METRICAS,
+    ):
+        self.arquivo = arquivo
+        self.max_sessoes_em_memoria = max_sessoes_em_memoria
+        self.max_lote = max_lote
+        self.intervalo_gravacao_s = intervalo_gravacao_s
+        self.max_mensagens_por_sessao = max_mensagens_por_sessao
+        self.tentativas_gravacao = tentativas_gravacao
+        self.metricas = metricas
+        # Operações que não puderam ser gravadas: (operação, erro), as mais recentes
+        self.falhas: deque = deque(maxlen=1000)
+
+        diretorio = os.path.dirname(arquivo)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self._conexao = sqlite3.connect(arquivo, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mensagens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sessao_id TEXT NOT NULL,
+                mensagem TEXT NOT NULL
+            )
+            """
+        )
+        self._conexao.execute(
+            "CREATE INDEX IF NOT EXISTS idx_mensagens_sessao ON mensagens (sessao_id, id)"
+        )
+        self._trava_banco = threading.Lock()
+
+        # Cache LRU de sessões carregadas
+        self._sessoes: "OrderedDict[str, HistoricoPersistente]" = OrderedDict()
+        self._trava_sessoes = threading.Lock()
+
+        # Fila de gravação consumida pela thread de group commit
+        self._fila: queue.Queue = queue.Queue()
+        # Operações ainda não gravadas por sessão (evita ler do disco um estado desatualizado)
+        self._pendentes_por_sessao: Counter = Counter()
+        self._gravacao_concluida = threading.Condition()
+        self._encerrado = threading.Event()
+        self._gravador = threading.Thread(target=self._gravar_continuamente, name="gravador-sessoes", daemon=True)
+        self._gravador.start()
+
+        self._compactador = None
+        if intervalo_compactacao_s:
+            self._compactador = threading.Thread(
+                target=self._compactar_periodicamente,
+                args=(intervalo_compactacao_s,),
+                name="compactador-sessoes",
+                daemon=True,
+            )
+            self._compactador.start()
+
+    # ------------------------------------------------------------------
+    # Acesso às sessões
+    # ------------------------------------------------------------------
+
+    def obter(self, sessao_id: str) -> HistoricoPersistente:
+        """Retorna o histórico da sessão, carregando-o do disco no primeiro acesso."""
+        with self._trava_sessoes:
+            historico = self._sessoes.get(sessao_id)
+            if historico is not None:
+                self._sessoes.move_to_end(sessao_id)
+                return historico
+
+        # Sessão removida do LRU com gravações ainda na fila: espera que cheguem ao disco
+        with self._gravacao_concluida:
+            self._gravacao_concluida.wait_for(lambda: not self._pendentes_por_sessao[sessao_id])
+        with self._trava_banco:
+            linhas = self._conexao.execute(
+                "SELECT mensagem FROM mensagens WHERE sessao_id = ? ORDER BY id", (sessao_id,)
+            ).fetchall()
+        mensagens = messages_from_dict([json.loads(linha[0]) for linha in linhas])
+
+        with self._trava_sessoes:
+            # Outra thread pode ter carregado a mesma sessão enquanto líamos o disco
+            historico = self._sessoes.get(sessao_id)
+            if historico is None:
+                historico = HistoricoPersistente(self, sessao_id, mensagens)
+                self._sessoes[sessao_id] = historico
+            self._sessoes.move_to_end(sessao_id)
+            while len(self._sessoes) > self.max_sessoes_em_memoria:
+                self._sessoes.popitem(last=False)
+        return historico
+
+    def sessoes_em_memoria(self) -> int:
+        return len(self._sessoes)
+
+    # ------------------------------------------------------------------
+    # Gravação em grupo
+    # ------------------------------------------------------------------
+
+    def _enfileirar(self, operacao) -> None:
+        with self._gravacao_concluida:
+            self._pendentes_por_sessao[operacao[1]] += 1
+        self._fila.put(operacao)
+
+    def _gravar_continuamente(self) -> None:
+        while not self._encerrado.is_set() or not self._fila.empty():
+            try:
+                primeira = self._fila.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            lote = [primeira]
+            # Acumula o que chegar durante a janela de gravação, até max_lote operações
+            try:
+                while len(lote) < self.max_lote:
+                    lote.append(self._fila.get(timeout=self.intervalo_gravacao_s))
+            except queue.Empty:
+                pass
+            try:
+                self._gravar_com_recuperacao(lote)
+            finally:
+                with self._gravacao_concluida:
+                    for _, sessao_id, _ in lote:
+                        self._pendentes_por_sessao[sessao_id] -= 1
+                        if not self._pendentes_por_sessao[sessao_id]:
+                            del self._pendentes_por_sessao[sessao_id]
+                    self._gravacao_concluida.notify_all()
+                for _ in lote:
+                    self._fila.task_done()
+
+    def _gravar_com_recuperacao(self, lote) -> None:
+        """
+        Grava o lote sem nunca derrubar a thread de gravação: repete o lote
+        em falhas passageiras (banco travado, disco cheio) e, se continuar
+        falhando, grava operação por operação; as que falham sozinhas
+        (ex.: mensagem que não serializa) vão para `falhas`.
+        """
+        for tentativa in range(self.tentativas_gravacao):
+            try:
+                self._gravar_lote(lote)
+                return
+            except Exception as erro:
+                logger.warning("Falha ao gravar %d operações (tentativa %d): %s", len(lote), tentativa + 1, erro)
+                self.metricas.incrementar("sessoes_gravacao_erros_total")
+                time.sleep(self.intervalo_gravacao_s * 2 ** tentativa)
+        for operacao in lote:
+            try:
+                self._gravar_lote([operacao])
+            except Exception as erro:
+                logger.exception("Operação %r da sessão %s descartada", operacao[0], operacao[1])
+                self.metricas.incrementar("sessoes_gravacao_descartadas_total")
+                self.falhas.append((operacao, erro))
+
+    def _gravar_lote(self, lote) -> None:
+        with self._trava_banco:
+            self._conexao.execute("BEGIN")
+            try:
+                for tipo, sessao_id, mensagens in lote:
+                    if tipo == "inserir":
+                        self._conexao.executemany(
+                            "INSERT INTO mensagens (sessao_id, mensagem) VALUES (?, ?)",
+                            [
+                                (sessao_id, json.dumps(message_to_dict(mensagem), ensure_ascii=False))
+                                for mensagem in mensagens
+                            ],
+                        )
+                    elif tipo == "limpar":
+                        self._conexao.execute("DELETE FROM mensagens WHERE sessao_id = ?", (sessao_id,))
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+
+    def descarregar(self) -> None:
+        """Bloqueia até que todas as gravações enfileiradas estejam no disco."""
+        self._fila.join()
+
+    # ------------------------------------------------------------------
+    # Compactação
+    # ------------------------------------------------------------------
+
+    def compactar(self) -> None:
+        """Aplica a retenção por sessão, faz checkpoint do WAL e libera páginas livres."""
+        with self._trava_banco:
+            if self.max_mensagens_por_sessao:
+                self._conexao.execute(
+                    """
+                    DELETE FROM mensagens WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (
+                                PARTITION BY sessao_id ORDER BY id DESC
+                            ) AS posicao
+                            FROM mensagens
+                        ) WHERE posicao > ?
+                    )
+                    """,
+                    (self.max_mensagens_por_sessao,),
+                )
+            self._conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conexao.execute("PRAGMA incremental_vacuum")
+        if self.max_mensagens_por_sessao:
+            # Mesma retenção para as sessões em memória, senão o próximo turno
+            # ainda levaria ao prompt as mensagens apagadas do disco
+            with self._trava_sessoes:
+                for historico in self._sessoes.values():
+                    del historico._mensagens[: -self.max_mensagens_por_sessao]
+
+    def _compactar_periodicamente(self, intervalo_s: float) -> None:
+        while not self._encerrado.wait(intervalo_s):
+            try:
+                self.compactar()
+            except Exception:
+                # Uma falha (ex.: disco cheio) não pode encerrar a thread de compactação
+                logger.exception("Falha na compactação periódica")
+                self.metricas.incrementar("sessoes_compactacao_erros_total")
+
+    def fechar(self) -> None:
+        """Grava as operações pendentes e encerra as threads de fundo."""
+        self.descarregar()
+        self._encerrado.set()
+        self._gravador.join()
+        if self._compactador is not None:
+            self._compactador.join()
+        with self._trava_banco:
+            self._conexao.close()
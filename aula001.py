@@ -10,15 +10,35 @@ Conceitos abordados:
 - Inicialização do modelo ChatOpenAI
 - Criação de prompts simples com f-strings
 - Invocação direta do modelo e obtenção de resposta
+- Streaming (opcional): a resposta aparece conforme os tokens chegam
+
+Modo streaming (opcional):
+    python aula001.py --stream               # .stream(), com TTFT e tokens/s
+    python aula001.py --stream --assincrono  # .astream()
+    python aula001.py --stream --fake        # ModeloChatFake local, sem API
 
 Dependências:
-- langchain-openai: Integração do LangChain com OpenAI
+- langchain-openai: Integração do LangChain com OpenAI (via fabrica_modelo)
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from fabrica_modelo import criar_modelo
+from fluxo_tokens import exibir_fluxo
+from modelo_fake import ModeloChatFake
+
+
+def criar_prompt(numero_dias: int, numero_criancas: int, atividade: str) -> str:
+    """
+    Cria o prompt do plano de atividades usando f-string.
+
+    Este é o método mais simples, mas não permite reutilização fácil.
+    """
+    return (f"Crie um plano de atividades para {numero_dias} dias para {numero_criancas} crianças, "
+            f"focando em atividades relacionadas a {atividade}. "
+            "Cada dia deve incluir uma atividade principal e uma breve descrição.")
 
 
 def main():
@@ -32,7 +52,15 @@ def main():
     4. Cria um prompt usando f-string
     5. Inicializa o modelo ChatOpenAI
     6. Invoca o modelo e exibe a resposta
+
+    Com --stream, a resposta é exibida conforme os tokens chegam.
     """
+    parser = argparse.ArgumentParser(description="Aula 001 - Introdução ao LangChain")
+    parser.add_argument("--stream", action="store_true", help="Exibe a resposta conforme os tokens chegam")
+    parser.add_argument("--assincrono", action="store_true", help="Com --stream, usa .astream()")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    args = parser.parse_args()
+
     # Carrega as variáveis de ambiente do arquivo .env
     # O arquivo .env deve conter: OPENAI_API_KEY=sua-chave-aqui
     load_dotenv()
@@ -46,22 +74,31 @@ def main():
     numero_criancas = 2      # Número de crianças participantes
     atividade = "música"     # Tema principal das atividades
 
-    # Criação do prompt usando f-string
-    # Este é o método mais simples, mas não permite reutilização fácil
-    prompt = (f"Crie um plano de atividades para {numero_dias} dias para {numero_criancas} crianças, "
-              f"focando em atividades relacionadas a {atividade}. "
-              "Cada dia deve incluir uma atividade principal e uma breve descrição.")
+    # Criação do prompt usando f-string (ver criar_prompt)
+    prompt = criar_prompt(numero_dias, numero_criancas, atividade)
     
     # Inicialização do modelo ChatOpenAI
+    # criar_modelo (fabrica_modelo.py) aceita os mesmos argumentos do ChatOpenAI
+    # e ativa o cache persistente de respostas compartilhado por todas as aulas
     # - model_name: Modelo a ser utilizado (gpt-3.5-turbo é mais econômico)
     # - temperature: Controla a criatividade (0=determinístico, 1=criativo)
     # - max_tokens: Limita o tamanho da resposta
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
+    # Com --fake, o modelo local simula a latência e a geração token a token
+    if args.fake:
+        modelo = ModeloChatFake(latencia_s=0.3, tokens_por_segundo=40)
+    else:
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=api_key,
+            temperature=0.7,
+            max_tokens=500
+        )
+
+    if args.stream:
+        # Os tokens aparecem assim que chegam; o texto final é o mesmo do invoke()
+        print("Plano de Atividades:")
+        exibir_fluxo(modelo, prompt, "aula001", args.assincrono)
+        return
 
     # Invoca o modelo com o prompt e obtém a resposta
     # O método invoke() é a forma padrão de chamar o modelo no LangChain
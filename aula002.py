@@ -10,6 +10,12 @@ Conceitos abordados:
 - Mensagens de sistema vs usuário
 - Variáveis de template com placeholders {}
 - Formatação de prompts com .format()
+- Streaming (opcional): a resposta aparece conforme os tokens chegam
+
+Modo streaming (opcional):
+    python aula002.py --stream               # .stream(), com TTFT e tokens/s
+    python aula002.py --stream --assincrono  # .astream()
+    python aula002.py --stream --fake        # ModeloChatFake local, sem API
 
 Vantagens do ChatPromptTemplate:
 - Separa instruções de sistema do pedido do usuário
@@ -23,10 +29,27 @@ Dependências:
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from fabrica_modelo import criar_modelo
+from fluxo_tokens import exibir_fluxo
+from modelo_fake import ModeloChatFake
+from langchain_core.prompts import ChatPromptTemplate
+
+
+def criar_template() -> ChatPromptTemplate:
+    """
+    Cria o ChatPromptTemplate com mensagens estruturadas.
+
+    - "system": Define o comportamento/persona do assistente
+    - "user": Contém o pedido do usuário com variáveis entre {}
+    Isso permite maior controle sobre como o modelo responde.
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", "Você é um assistente criativo que ajuda a criar planos de atividades para crianças."),
+        ("user", "Crie um plano de atividades para {numero_dias} dias para {numero_criancas} crianças, focando em atividades relacionadas a {atividade}. Cada dia deve incluir uma atividade principal e uma breve descrição.")
+    ])
 
 
 def main():
@@ -39,7 +62,15 @@ def main():
     3. Cria um template de prompt com mensagens de sistema e usuário
     4. Formata o prompt com os valores das variáveis
     5. Invoca o modelo e exibe a resposta
+
+    Com --stream, a resposta é exibida conforme os tokens chegam.
     """
+    parser = argparse.ArgumentParser(description="Aula 002 - ChatPromptTemplate")
+    parser.add_argument("--stream", action="store_true", help="Exibe a resposta conforme os tokens chegam")
+    parser.add_argument("--assincrono", action="store_true", help="Com --stream, usa .astream()")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    args = parser.parse_args()
+
     # Carrega as variáveis de ambiente do arquivo .env
     load_dotenv()
     
@@ -51,14 +82,8 @@ def main():
     numero_criancas = 2
     atividade = "música"
 
-    # Criação do ChatPromptTemplate com mensagens estruturadas
-    # - "system": Define o comportamento/persona do assistente
-    # - "user": Contém o pedido do usuário com variáveis entre {}
-    # Isso permite maior controle sobre como o modelo responde
-    modelo_prompt = ChatPromptTemplate.from_messages([
-        ("system", "Você é um assistente criativo que ajuda a criar planos de atividades para crianças."),
-        ("user", "Crie um plano de atividades para {numero_dias} dias para {numero_criancas} crianças, focando em atividades relacionadas a {atividade}. Cada dia deve incluir uma atividade principal e uma breve descrição.")
-    ])
+    # Criação do ChatPromptTemplate com mensagens de sistema e usuário
+    modelo_prompt = criar_template()
 
     # Formata o template substituindo as variáveis pelos valores
     # O método .format() retorna uma string formatada
@@ -74,12 +99,21 @@ def main():
     print(prompt)
     
     # Inicialização do modelo ChatOpenAI
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
+    if args.fake:
+        modelo = ModeloChatFake(latencia_s=0.3, tokens_por_segundo=40)
+    else:
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=api_key,
+            temperature=0.7,
+            max_tokens=500
+        )
+
+    if args.stream:
+        # Os tokens aparecem assim que chegam; o texto final é o mesmo do invoke()
+        print("Plano de Atividades:")
+        exibir_fluxo(modelo, prompt, "aula002", args.assincrono)
+        return
 
     # Invoca o modelo e exibe a resposta
     resposta = modelo.invoke(prompt)
@@ -10,6 +10,8 @@ Conceitos abordados:
 - Operador pipe (|): Conecta componentes em uma cadeia
 - StrOutputParser: Extrai texto puro da resposta do modelo
 - LCEL (LangChain Expression Language): Sintaxe declarativa para cadeias
+- Modo lote: muitos interesses processados com concorrência limitada
+- Streaming: tempo até o primeiro token separado da latência total
 
 Vantagens do LCEL:
 - Sintaxe limpa e legível com operador |
@@ -20,17 +22,84 @@ Vantagens do LCEL:
 Fluxo da cadeia:
     prompt_cidade -> modelo -> StrOutputParser -> resposta (string)
 
+Modo lote (opcional):
+    python aula003.py --lote --fake --quantidade 200 --concorrencia 16
+
+    Compara o laço serial com as execuções concorrentes (threads e asyncio),
+    exibindo vazão e latências p50/p99. Com --fake, usa o ModeloChatFake local
+    em vez da API da OpenAI.
+
+Modo streaming (opcional):
+    python aula003.py --stream               # .stream(), com TTFT e tokens/s
+    python aula003.py --stream --assincrono  # .astream()
+    python aula003.py --stream --fake        # ModeloChatFake local, sem API
+
+    Cada pedaço de texto do StrOutputParser é exibido assim que chega.
+
 Dependências:
 - langchain-openai: Integração do LangChain com OpenAI
 - langchain-core: Componentes principais como output parsers
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
+import asyncio
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from fabrica_modelo import criar_modelo
+from fluxo_tokens import exibir_fluxo
+from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from modelo_fake import ModeloChatFake
+from processamento_lote import aexecutar_em_lote, executar_em_lote
+
+
+# Interesses usados para gerar entradas no modo lote
+INTERESSES = ["praias", "montanhas", "museus", "gastronomia", "história", "vida noturna"]
+
+
+def criar_cadeia(modelo):
+    """
+    Cria a cadeia de sugestão de cidades usando LCEL (operador pipe).
+
+    Fluxo: prompt -> modelo -> parser
+    - PromptTemplate formata a entrada
+    - ChatOpenAI processa e gera resposta
+    - StrOutputParser extrai apenas o texto da resposta
+    """
+    # Criação do PromptTemplate
+    # - template: String com placeholders {variavel}
+    # - input_variables: Lista de variáveis esperadas (validação)
+    prompt_cidade = PromptTemplate(
+        template="Sugira uma cidade dado o meu interesse por {interesse}.",
+        input_variables=["interesse"],
+    )
+    return prompt_cidade | modelo | StrOutputParser()
+
+
+def executar_lote(cadeia, quantidade: int, max_concorrencia: int):
+    """
+    Executa a cadeia para `quantidade` interesses de três formas e compara:
+    laço serial, lote com threads e lote com asyncio.
+    """
+    # Gerador: as entradas são produzidas sob demanda, sem montar uma lista
+    def entradas():
+        for i in range(quantidade):
+            yield {"interesse": INTERESSES[i % len(INTERESSES)]}
+
+    serial = executar_em_lote(cadeia, entradas(), max_concorrencia=1)
+    print("Serial:          ", serial.resumo())
+
+    concorrente = executar_em_lote(cadeia, entradas(), max_concorrencia=max_concorrencia)
+    print("Threads (x%d):   " % max_concorrencia, concorrente.resumo())
+
+    assincrono = asyncio.run(aexecutar_em_lote(cadeia, entradas(), max_concorrencia=max_concorrencia))
+    print("Asyncio (x%d):   " % max_concorrencia, assincrono.resumo())
+
+    # Erros são isolados por item: os demais resultados continuam válidos
+    for resultado in assincrono.resultados:
+        if not resultado.sucesso:
+            print(f"Item {resultado.indice} falhou: {resultado.erro}")
 
 
 def main():
@@ -43,35 +112,50 @@ def main():
     3. Inicializa o modelo ChatOpenAI
     4. Cria uma cadeia usando o operador pipe (|)
     5. Invoca a cadeia e exibe o resultado como string
+
+    Com --lote, executa a cadeia para vários interesses em paralelo.
+    Com --stream, exibe a resposta conforme os tokens chegam.
     """
+    parser = argparse.ArgumentParser(description="Aula 003 - Cadeias com LCEL")
+    parser.add_argument("--lote", action="store_true", help="Executa o modo lote")
+    parser.add_argument("--stream", action="store_true", help="Exibe a resposta conforme os tokens chegam")
+    parser.add_argument("--assincrono", action="store_true", help="Com --stream, usa .astream()")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    parser.add_argument("--quantidade", type=int, default=100, help="Número de entradas do lote")
+    parser.add_argument("--concorrencia", type=int, default=16, help="Chamadas simultâneas no lote")
+    args = parser.parse_args()
+
     # Carrega as variáveis de ambiente do arquivo .env
     load_dotenv()
     
     # Obtém a chave da API
     api_key = os.getenv('OPENAI_API_KEY')
 
-    # Criação do PromptTemplate
-    # - template: String com placeholders {variavel}
-    # - input_variables: Lista de variáveis esperadas (validação)
-    prompt_cidade = PromptTemplate(
-        template="Sugira uma cidade dado o meu interesse por {interesse}.",
-        input_variables=["interesse"],
-    )
-       
     # Inicialização do modelo
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
+    # Com --fake, o modelo local simula a latência da API sem acessar a rede;
+    # no streaming, também a geração token a token, como nas aulas 001 e 002
+    if args.fake and args.stream:
+        modelo = ModeloChatFake(latencia_s=0.3, tokens_por_segundo=40)
+    elif args.fake:
+        modelo = ModeloChatFake(latencia_s=0.05, desvio_latencia_s=0.05)
+    else:
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=api_key,
+            temperature=0.7,
+            max_tokens=500
+        )
+
+    # Criação da cadeia usando LCEL: prompt_cidade | modelo | StrOutputParser()
+    cadeia = criar_cadeia(modelo)
+
+    if args.lote:
+        executar_lote(cadeia, args.quantidade, args.concorrencia)
+        return
 
-    # Criação da cadeia usando LCEL (operador pipe)
-    # Fluxo: prompt -> modelo -> parser
-    # - PromptTemplate formata a entrada
-    # - ChatOpenAI processa e gera resposta
-    # - StrOutputParser extrai apenas o texto da resposta
-    cadeia = prompt_cidade | modelo | StrOutputParser()
+    if args.stream:
+        exibir_fluxo(cadeia, {"interesse": "praias"}, "aula003", args.assincrono)
+        return
 
     # Invoca a cadeia passando um dicionário com as variáveis
     # O resultado é uma string limpa graças ao StrOutputParser
@@ -10,7 +10,8 @@ Conceitos abordados:
 - Pydantic BaseModel: Define o schema/estrutura esperada da resposta
 - Field: Descreve campos e suas validações
 - partial_variables: Variáveis pré-preenchidas no template
-- set_debug: Ativa modo debug do LangChain para ver detalhes internos
+- set_debug: Ativa modo debug do LangChain para ver detalhes internos (--debug)
+- Instrumentação: tempos por etapa e uso de tokens via callback (--metricas)
 
 Vantagens da saída estruturada:
 - Respostas em formato JSON consistente
@@ -21,6 +22,30 @@ Vantagens da saída estruturada:
 Fluxo da cadeia:
     prompt_cidade -> modelo -> JsonOutputParser -> dict Python
 
+Métricas por etapa (opcional):
+    python aula004.py --metricas prometheus   # ou --metricas json
+
+Saída estruturada nativa (opcional):
+    python aula004.py --saida function_calling   # ou --saida json_schema
+
+    O schema vai na requisição (ferramenta ou response_format) em vez de nas
+    instruções do prompt: menos tokens de entrada e JSON sempre válido
+    (ver saida_nativa.py). Com json_schema, o gpt-3.5-turbo (sem suporte)
+    é trocado pelo gpt-4o-mini.
+
+Cascata de modelos (opcional):
+    python aula004.py --cascata [--fake]
+
+    Tenta primeiro o modelo mais barato de LLM_CASCATA e só repete no
+    seguinte se o JSON não passar pelo parser, pelo Pydantic ou pela
+    verificação de confiança; max_tokens vem do schema (ver cascata_modelos.py).
+
+Modo streaming (opcional):
+    python aula004.py --fluxo [--fake]
+
+    Exibe cada campo do DestinoTuristico assim que ele termina de chegar e é
+    validado, sem esperar a resposta completa (ver fluxo_estruturado.py).
+
 Dependências:
 - langchain-openai: Integração do LangChain com OpenAI
 - langchain-core: Output parsers
@@ -28,13 +53,20 @@ Dependências:
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
+import json
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from fabrica_modelo import criar_modelo
+from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
 from langchain.globals import set_debug
+from instrumentacao import METRICAS, instrumentar
+from modelo_fake import ModeloChatFake
+from fluxo_estruturado import fluxo_validado
+from templates_compilados import instrucoes_formato
+from saida_nativa import METODOS, modelo_para_saida, saida_nativa
 
 
 # Definição do modelo Pydantic para a estrutura de resposta
@@ -45,20 +77,68 @@ class DestinoTuristico(BaseModel):
     motivo: str = Field(..., description="Motivo pelo qual a cidade é recomendada")
 
 
+def criar_cadeia(modelo, saida: str = "instrucoes"):
+    """
+    Cria a cadeia prompt_cidade -> modelo -> JsonOutputParser.
+
+    O resultado da cadeia é um dicionário validado pelo DestinoTuristico.
+
+    - saida: "instrucoes" (schema no prompt, padrão), "function_calling" ou
+      "json_schema" (saída estruturada nativa, ver saida_nativa.py)
+    """
+    if saida != "instrucoes":
+        # O schema vai na requisição (ferramenta ou response_format), não no prompt
+        prompt_cidade = PromptTemplate.from_template("Sugira uma cidade dado o meu interesse por {interesse}.")
+        return prompt_cidade | saida_nativa(modelo, DestinoTuristico, saida)
+
+    # Cria o parser JSON baseado no modelo Pydantic
+    # O parser irá validar e converter a resposta do modelo
+    parseador = JsonOutputParser(pydantic_object=DestinoTuristico)
+
+    # Cria o template de prompt com instruções de formato
+    # - partial_variables: Injeta automaticamente as instruções de formato JSON
+    # - instrucoes_formato(): o mesmo texto de parseador.get_format_instructions(),
+    #   gerado uma única vez por modelo Pydantic (ver templates_compilados.py)
+    prompt_cidade = PromptTemplate(
+        template="Sugira uma cidade dado o meu interesse por {interesse}.{formato_de_saida}",
+        input_variables=["interesse"],
+        partial_variables={"formato_de_saida": instrucoes_formato(DestinoTuristico)}
+    )
+
+    # O parseador no final converte a resposta em dicionário Python
+    return prompt_cidade | modelo | parseador
+
+
 def main():
     """
     Função principal que demonstra saída estruturada com JsonOutputParser.
     
     Fluxo de execução:
-    1. Ativa o modo debug do LangChain
+    1. Ativa o modo debug do LangChain (apenas com --debug)
     2. Carrega variáveis de ambiente
     3. Cria um JsonOutputParser com o modelo Pydantic
     4. Cria um prompt que inclui instruções de formato
     5. Executa a cadeia e obtém um dicionário Python
+
+    Com --fluxo, exibe os campos validados à medida que são gerados.
     """
+    parser = argparse.ArgumentParser(description="Aula 004 - Saída estruturada")
+    parser.add_argument("--fluxo", action="store_true", help="Exibe os campos durante o streaming")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    parser.add_argument("--cascata", action="store_true", help="Modelo rápido primeiro, o forte só se necessário")
+    parser.add_argument(
+        "--saida", choices=METODOS, default="instrucoes",
+        help="Como pedir o JSON: instruções no prompt ou saída estruturada nativa",
+    )
+    parser.add_argument("--debug", action="store_true", help="Ativa o set_debug (imprime todos os payloads)")
+    parser.add_argument("--metricas", choices=["prometheus", "json"], help="Exibe as métricas por etapa ao final")
+    args = parser.parse_args()
+
     # Ativa o modo debug para visualizar detalhes internos do LangChain
-    # Útil para entender o fluxo e depurar problemas
-    set_debug(True)
+    # Útil para entender o fluxo e depurar problemas, mas caro sob carga:
+    # por padrão, apenas tempos e tokens são registrados (instrumentacao.py)
+    if args.debug:
+        set_debug(True)
 
     # Carrega as variáveis de ambiente do arquivo .env
     load_dotenv()
@@ -66,35 +146,60 @@ def main():
     # Obtém a chave da API
     api_key = os.getenv('OPENAI_API_KEY')
 
-    # Cria o parser JSON baseado no modelo Pydantic
-    # O parser irá validar e converter a resposta do modelo
-    parseador = JsonOutputParser(pydantic_object=DestinoTuristico)
-
-    # Cria o template de prompt com instruções de formato
-    # - partial_variables: Injeta automaticamente as instruções de formato JSON
-    # - get_format_instructions(): Gera instruções para o modelo retornar JSON válido
-    prompt_cidade = PromptTemplate(
-        template="Sugira uma cidade dado o meu interesse por {interesse}.{formato_de_saida}",
-        input_variables=["interesse"],
-        partial_variables={"formato_de_saida": parseador.get_format_instructions()}
-    )
-       
     # Inicialização do modelo
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
-
-    # Criação da cadeia com LCEL
-    # O parseador no final converte a resposta em dicionário Python
-    cadeia = prompt_cidade | modelo | parseador
-
-    # Invoca a cadeia - o resultado é um dicionário, não uma string
-    # Exemplo de resposta: {"cidade": "Florianópolis", "motivo": "Belas praias..."}
-    resposta = cadeia.invoke({"interesse": "praias"})
-    print(resposta)
+    if args.cascata:
+        # Um modelo por nível da cascata, do mais barato ao mais forte
+        from cascata_modelos import Nivel, criar_cascata, obter_niveis
+        niveis = []
+        for posicao, (nome, custo, latencia) in enumerate(obter_niveis()):
+            if args.fake:
+                # Cada nível é 3x mais lento que o anterior; a referência é a
+                # latência do modelo fake mais ~40 tokens de resposta
+                fake = ModeloChatFake(model=nome, latencia_s=0.1 * 3 ** posicao, tokens_por_segundo=20)
+                niveis.append(Nivel(nome, fake, custo, fake.latencia_s + 40 / fake.tokens_por_segundo))
+            else:
+                modelo = criar_modelo(
+                    model_name=modelo_para_saida(nome, args.saida), openai_api_key=api_key, temperature=0.7
+                )
+                niveis.append(Nivel(nome, modelo, custo, latencia))
+        cadeia_base = criar_cascata(
+            lambda modelo: criar_cadeia(modelo, args.saida), niveis, DestinoTuristico, nome="aula004"
+        )
+    else:
+        if args.fake:
+            modelo = ModeloChatFake(latencia_s=0.3, tokens_por_segundo=20)
+        else:
+            modelo = criar_modelo(
+                # json_schema exige gpt-4o-mini ou mais recente (ver saida_nativa.py)
+                model_name=modelo_para_saida("gpt-3.5-turbo", args.saida),
+                openai_api_key=api_key,
+                temperature=0.7,
+                max_tokens=500
+            )
+        # Criação da cadeia com LCEL: prompt (com instruções de formato) | modelo | parseador
+        cadeia_base = criar_cadeia(modelo, args.saida)
+
+    # A instrumentação mede cada etapa: prompt, modelo (e TTFT) e parser
+    cadeia = instrumentar(cadeia_base)
+
+    if args.fluxo:
+        # Cada estado traz apenas os campos completos e já validados pelo Pydantic
+        for estado in fluxo_validado(cadeia, {"interesse": "praias"}, DestinoTuristico):
+            print("Final:" if estado.final else "Parcial:", estado.completos)
+    else:
+        # Invoca a cadeia - o resultado é um dicionário, não uma string
+        # Exemplo de resposta: {"cidade": "Florianópolis", "motivo": "Belas praias..."}
+        resposta = cadeia.invoke({"interesse": "praias"})
+        print(resposta)
+
+    if args.cascata:
+        from cascata_modelos import ESTATISTICAS
+        print("Cascata:", ESTATISTICAS.resumo("aula004", niveis[-1]))
+
+    if args.metricas == "prometheus":
+        print(METRICAS.exportar_prometheus())
+    elif args.metricas == "json":
+        print(json.dumps(METRICAS.exportar_json(), ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
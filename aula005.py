@@ -10,12 +10,33 @@ Conceitos abordados:
 - Encadeamento sequencial de cadeias
 - Passagem de dados entre cadeias
 - Composição de cadeias complexas
+- Pipeline com dependências (DAG): etapas independentes em paralelo
 
 Fluxo do pipeline:
     1. cadeia_1: interesse -> cidade (DestinoTuristico)
     2. cadeia_2: cidade -> restaurante (Restaurante)  
     3. cadeia_3: cidade -> atividade cultural (string)
 
+Pipeline DAG (padrão):
+    As cadeias 2 e 3 dependem apenas de `cidade`, então são executadas em
+    paralelo assim que a cadeia 1 termina. O tempo total cai de três para
+    duas chamadas ao modelo em sequência, e o resultado combina as três saídas:
+    {interesse, cidade, motivo, destino, restaurante, cultural}
+
+    python aula005.py               # pipeline DAG
+    python aula005.py --sequencial  # encadeamento sequencial original
+    python aula005.py --antecipado  # inicia as cadeias 2 e 3 durante o streaming
+                                    # da cadeia 1, assim que "cidade" fica pronta
+    python aula005.py --grafo       # grafo do LangGraph com checkpoints: repetir o
+                                    # comando após uma falha refaz só a etapa que falhou
+                                    # (--checkpoint dados/grafo.sqlite --thread pedido-1)
+    python aula005.py --fake        # usa o ModeloChatFake local
+    python aula005.py --metricas prometheus  # tempos por etapa (ou --metricas json)
+    python aula005.py --debug       # set_debug(True): imprime todos os payloads
+    python aula005.py --recuperacao # injeta trechos do corpus local (FAISS) nos prompts
+    python aula005.py --saida function_calling  # JSON pela saída estruturada nativa
+                                                # (ou --saida json_schema, com o gpt-4o-mini)
+
 Importante:
 - A saída de cada cadeia deve ser compatível com a entrada da próxima
 - O encadeamento usa os campos do dict retornado pela cadeia anterior
@@ -27,13 +48,23 @@ Dependências:
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
+import json
 import os
+import time
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from fabrica_modelo import criar_modelo
+from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from pydantic import BaseModel, Field
 from langchain.globals import set_debug
+from instrumentacao import METRICAS, instrumentar
+from modelo_fake import ModeloChatFake
+from pipeline_dag import Etapa, montar_pipeline
+from fluxo_estruturado import encadear_com_antecipacao
+from templates_compilados import instrucoes_formato
+from saida_nativa import METODOS, modelo_para_saida, saida_nativa
+from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 
 
 # Modelo para a primeira etapa: sugestão de destino turístico
@@ -50,76 +81,217 @@ class Restaurante(BaseModel):
     restaurante: str = Field(..., description="Nome do restaurante recomendado")    
 
 
-def main():
-    """
-    Função principal que demonstra encadeamento de múltiplas cadeias.
-    
-    Fluxo de execução:
-    1. Cadeia 1: Recebe interesse e sugere uma cidade (JSON)
-    2. Cadeia 2: Recebe cidade e sugere um restaurante (JSON)
-    3. Cadeia 3: Recebe cidade e sugere atividade cultural (string)
-    
-    As cadeias são conectadas sequencialmente, onde a saída de uma
-    alimenta a entrada da próxima.
+def criar_etapas(modelo, recuperador=None, saida: str = "instrucoes") -> list:
     """
-    # Ativa modo debug para visualizar o fluxo interno
-    set_debug(True)
-
-    # Carrega as variáveis de ambiente do arquivo .env
-    load_dotenv()
-    
-    # Obtém a chave da API
-    api_key = os.getenv('OPENAI_API_KEY')
+    Cria as três etapas do pipeline (destino, restaurante e cultural), com
+    os campos que cada uma consome e produz.
 
+    - recuperador: IndiceVetorial opcional (recuperacao.py); os trechos
+      relevantes para o interesse e para a cidade entram nos prompts 1 e 2
+    - saida: "instrucoes" (schema no prompt, padrão), "function_calling" ou
+      "json_schema" (saída estruturada nativa nas cadeias 1 e 2, ver saida_nativa.py)
+    """
     # Criação dos parsers para cada tipo de resposta estruturada
     parseador_destino = JsonOutputParser(pydantic_object=DestinoTuristico)
     parseador_restaurante = JsonOutputParser(pydantic_object=Restaurante)
 
+    # Com recuperação, os prompts começam pelos trechos encontrados no corpus
+    referencia = "Use as informações abaixo, se forem relevantes:\n{contexto}\n\n" if recuperador else ""
+
     # Prompt 1: Sugestão de cidade baseada no interesse
+    # As instruções de formato de cada modelo são geradas uma única vez (templates_compilados.py)
     prompt_cidade = PromptTemplate(
-        template="Sugira uma cidade dado o meu interesse por {interesse}.{formato_de_saida}",
+        template=referencia + "Sugira uma cidade dado o meu interesse por {interesse}.{formato_de_saida}",
         input_variables=["interesse"],
-        partial_variables={"formato_de_saida": parseador_destino.get_format_instructions()}
+        partial_variables={"formato_de_saida": instrucoes_formato(DestinoTuristico)}
     )
 
     # Prompt 2: Sugestão de restaurante baseada na cidade
     # Nota: {cidade} será preenchida pela saída da cadeia anterior
     prompt_restaurante = PromptTemplate(
-        template="Sugira um restaurante dado o meu interesse por {cidade}.{formato_de_saida}",
-        partial_variables={"formato_de_saida": parseador_restaurante.get_format_instructions()}
+        template=referencia + "Sugira um restaurante dado o meu interesse por {cidade}.{formato_de_saida}",
+        partial_variables={"formato_de_saida": instrucoes_formato(Restaurante)}
     )
 
     # Prompt 3: Sugestão de atividade cultural baseada na cidade
     prompt_cultural = PromptTemplate(
         template="Sugira atividade cultural dada a minha sugestão de cidade {cidade} ",
     )
-       
-    # Inicialização do modelo (compartilhado entre as cadeias)
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
 
     # Criação das cadeias individuais
-    # Cadeia 1: interesse -> {cidade, motivo}
-    cadeia_1 = prompt_cidade | modelo | parseador_destino
-    
-    # Cadeia 2: cidade -> {cidade, restaurante}
-    cadeia_2 = prompt_restaurante | modelo | parseador_restaurante
+    if saida == "instrucoes":
+        # Cadeia 1: interesse -> {cidade, motivo}
+        cadeia_1 = prompt_cidade | modelo | parseador_destino
+
+        # Cadeia 2: cidade -> {cidade, restaurante}
+        cadeia_2 = prompt_restaurante | modelo | parseador_restaurante
+    else:
+        # Saída nativa: os prompts sem as instruções de formato e o schema na requisição
+        cadeia_1 = (
+            PromptTemplate.from_template(prompt_cidade.template.replace("{formato_de_saida}", ""))
+            | saida_nativa(modelo, DestinoTuristico, saida)
+        )
+        cadeia_2 = (
+            PromptTemplate.from_template(prompt_restaurante.template.replace("{formato_de_saida}", ""))
+            | saida_nativa(modelo, Restaurante, saida)
+        )
     
     # Cadeia 3: cidade -> string com atividade cultural
     cadeia_3 = prompt_cultural | modelo | StrOutputParser()
 
-    # Encadeamento das cadeias em sequência
-    # A saída de cada cadeia é passada como entrada para a próxima
-    cadeia = (cadeia_1 | cadeia_2 | cadeia_3)
+    if recuperador is not None:
+        # A busca roda antes do prompt: interesse -> trechos (cadeia 1), cidade -> trechos (cadeia 2)
+        cadeia_1 = RunnablePassthrough.assign(contexto=recuperador.contexto("interesse")) | cadeia_1
+        cadeia_2 = RunnablePassthrough.assign(contexto=recuperador.contexto("cidade")) | cadeia_2
+
+    # Cada etapa declara os campos que consome
+    # - destino produz "cidade", usada pelas outras duas etapas
+    # - restaurante e cultural não dependem uma da outra (paralelas)
+    return [
+        Etapa("destino", cadeia_1, consome=["interesse"], produz=["cidade", "motivo"]),
+        Etapa("restaurante", cadeia_2, consome=["cidade"]),
+        Etapa("cultural", cadeia_3, consome=["cidade"]),
+    ]
+
+
+def criar_cadeia(modelo, modo: str = "dag", recuperador=None, saida: str = "instrucoes", checkpointer=None):
+    """
+    Cria o pipeline destino -> restaurante / atividade cultural.
+
+    - modo: "dag" (padrão), "sequencial", "antecipado" ou "grafo" (LangGraph,
+      ver pipeline_grafo.py)
+    - recuperador e saida: ver criar_etapas()
+    - checkpointer: apenas no modo "grafo"; com ele, uma execução que falhou
+      pode ser retomada refazendo só a etapa que falhou
+    """
+    etapas = criar_etapas(modelo, recuperador, saida)
+    cadeia_1, cadeia_2, cadeia_3 = (etapa.cadeia for etapa in etapas)
+
+    if modo == "sequencial":
+        # Encadeamento das cadeias em sequência
+        # A saída de cada cadeia é passada como entrada para a próxima
+        return (cadeia_1 | cadeia_2 | cadeia_3)
+    elif modo == "antecipado":
+        # Streaming da cadeia 1: quando o campo "cidade" termina de chegar,
+        # as cadeias 2 e 3 começam em paralelo enquanto o "motivo" é gerado.
+        # Se a resposta final trouxer outra cidade, elas são refeitas.
+        return encadear_com_antecipacao(
+            cadeia_1,
+            RunnableParallel(restaurante=cadeia_2, cultural=cadeia_3),
+            DestinoTuristico,
+            campos=["cidade"],
+            nome="destino",
+        )
+    elif modo == "grafo":
+        # Mesmas etapas como grafo do LangGraph: estado salvo a cada passo
+        from pipeline_grafo import montar_grafo
+        return montar_grafo(etapas, entradas=["interesse"], checkpointer=checkpointer)
+    else:
+        # Pipeline DAG: etapas independentes em paralelo, por camadas
+        return montar_pipeline(etapas, entradas=["interesse"])
+
+
+def main():
+    """
+    Função principal que demonstra encadeamento de múltiplas cadeias.
+    
+    Fluxo de execução:
+    1. Cadeia 1: Recebe interesse e sugere uma cidade (JSON)
+    2. Cadeia 2: Recebe cidade e sugere um restaurante (JSON)
+    3. Cadeia 3: Recebe cidade e sugere atividade cultural (string)
+    
+    Por padrão, as cadeias são organizadas em um pipeline DAG: a cadeia 1
+    alimenta as cadeias 2 e 3, que são executadas em paralelo. Com
+    --sequencial, são conectadas em sequência, onde a saída de uma
+    alimenta a entrada da próxima.
+    """
+    parser = argparse.ArgumentParser(description="Aula 005 - Múltiplas cadeias")
+    parser.add_argument("--sequencial", action="store_true", help="Usa o encadeamento sequencial")
+    parser.add_argument("--antecipado", action="store_true", help="Antecipa as cadeias 2 e 3 via streaming")
+    parser.add_argument("--grafo", action="store_true", help="Usa o grafo do LangGraph com checkpoints")
+    parser.add_argument(
+        "--checkpoint", metavar="ARQUIVO",
+        help="Com --grafo: checkpoints em SQLite (padrão: em memória)",
+    )
+    parser.add_argument(
+        "--thread", default="aula005",
+        help="Com --grafo: identificador da execução; repetir o comando retoma uma execução que falhou",
+    )
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    parser.add_argument(
+        "--recuperacao", nargs="?", const="dados/indice_cidades", metavar="DIRETORIO",
+        help="Injeta trechos do índice FAISS nos prompts (criado a partir de corpus/ se vazio)",
+    )
+    parser.add_argument(
+        "--saida", choices=METODOS, default="instrucoes",
+        help="Como pedir o JSON: instruções no prompt ou saída estruturada nativa",
+    )
+    parser.add_argument("--debug", action="store_true", help="Ativa o set_debug (imprime todos os payloads)")
+    parser.add_argument("--metricas", choices=["prometheus", "json"], help="Exibe as métricas por etapa ao final")
+    args = parser.parse_args()
+
+    # Ativa modo debug para visualizar o fluxo interno (caro sob carga)
+    if args.debug:
+        set_debug(True)
+
+    # Carrega as variáveis de ambiente do arquivo .env
+    load_dotenv()
+    
+    # Obtém a chave da API
+    api_key = os.getenv('OPENAI_API_KEY')
+
+    # Inicialização do modelo (compartilhado entre as cadeias)
+    if args.fake:
+        modelo = ModeloChatFake(latencia_s=0.5, tokens_por_segundo=20)
+    else:
+        modelo = criar_modelo(
+            # json_schema exige gpt-4o-mini ou mais recente (ver saida_nativa.py)
+            model_name=modelo_para_saida("gpt-3.5-turbo", args.saida),
+            openai_api_key=api_key,
+            temperature=0.7,
+            max_tokens=500
+        )
+
+    # Modo do pipeline escolhido na linha de comando
+    modo = "sequencial" if args.sequencial else "antecipado" if args.antecipado else "grafo" if args.grafo else "dag"
+    # Recuperação opcional: importada só quando usada (FAISS e numpy)
+    recuperador = None
+    if args.recuperacao:
+        from recuperacao import abrir_indice
+        recuperador = abrir_indice(args.recuperacao)
+
+    checkpointer = None
+    if args.grafo:
+        from pipeline_grafo import criar_checkpointer
+        checkpointer = criar_checkpointer(args.checkpoint)
+
+    cadeia = criar_cadeia(modelo, modo, recuperador, args.saida, checkpointer)
 
     # Invoca a cadeia completa
-    # Fluxo: {interesse: "praias"} -> cidade -> restaurante -> atividade cultural
-    resposta = cadeia.invoke({"interesse": "praias"})
-    print(resposta)
+    # Fluxo: {interesse: "praias"} -> cidade -> restaurante / atividade cultural
+    inicio = time.perf_counter()
+    # medir_cadeias=True também registra o tempo de cada composição do pipeline
+    if args.grafo:
+        # Retoma a execução do thread se ela parou no meio (só as etapas pendentes rodam)
+        from instrumentacao import InstrumentacaoCallback
+        from pipeline_grafo import invocar_retomavel
+        config = {
+            "configurable": {"thread_id": args.thread},
+            "callbacks": [InstrumentacaoCallback(medir_cadeias=True)],
+        }
+        resposta = invocar_retomavel(cadeia, {"interesse": "praias"}, config)
+        tempos = resposta.pop("tempos")
+        print(resposta)
+        print("Tempo por etapa:", ", ".join(f"{nome} {valor:.2f}s" for nome, valor in tempos.items()))
+    else:
+        resposta = instrumentar(cadeia, medir_cadeias=True).invoke({"interesse": "praias"})
+        print(resposta)
+    print(f"Tempo total: {time.perf_counter() - inicio:.2f}s")
+
+    if args.metricas == "prometheus":
+        print(METRICAS.exportar_prometheus())
+    elif args.metricas == "json":
+        print(json.dumps(METRICAS.exportar_json(), ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
@@ -9,6 +9,8 @@ entre múltiplas interações.
 Conceitos abordados:
 - ChatPromptTemplate com placeholder para histórico
 - InMemoryChatMessageHistory: Armazenamento de mensagens em memória
+- HistoricoResumido: histórico com orçamento de tokens, turnos recentes
+  literais e resumo incremental das mensagens antigas (historico_resumido.py)
 - RunnableWithMessageHistory: Wrapper que adiciona memória a cadeias
 - Gerenciamento de sessões para múltiplas conversas
 - Operador pipe (|): Sintaxe LCEL para encadeamento
@@ -22,20 +24,68 @@ Fluxo da cadeia:
                               ↑
                     RunnableWithMessageHistory (gerencia histórico por sessão)
 
+Orçamento do histórico:
+    Com o InMemoryChatMessageHistory, cada turno reenvia a conversa inteira.
+    Por padrão esta aula usa o HistoricoResumido, que limita o {historico}
+    a MAX_TOKENS_HISTORICO tokens; os turnos antigos viram um resumo gerado
+    em segundo plano, sem atrasar a resposta ao usuário.
+
+    python aula006.py               # histórico com orçamento de tokens
+    python aula006.py --completo    # histórico completo (InMemoryChatMessageHistory)
+    python aula006.py --persistente # sessões gravadas em disco (armazenamento_sessoes.py)
+    python aula006.py --compacto    # histórico completo em formato compacto (historico_compacto.py)
+    python aula006.py --fake        # usa o ModeloChatFake local
+
 Dependências:
 - langchain-openai: Integração do LangChain com OpenAI
 - langchain-core: Output parsers, histórico de mensagens
 - python-dotenv: Gerenciamento de variáveis de ambiente
 """
 
+import argparse
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from fabrica_modelo import criar_modelo
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain.globals import set_debug
+from modelo_fake import ModeloChatFake
+from historico_resumido import HistoricoResumido
+from armazenamento_sessoes import ARQUIVO_PADRAO, ArmazenamentoSessoes
+from historico_compacto import ArmazenamentoCompacto
+
+
+# Orçamento de tokens do histórico enviado a cada turno
+MAX_TOKENS_HISTORICO = 1000
+
+
+def criar_cadeia_com_memoria(modelo, historico_por_sessao) -> RunnableWithMessageHistory:
+    """
+    Cria a cadeia de recomendação com memória.
+
+    - modelo: modelo de chat usado nas respostas
+    - historico_por_sessao: função sessao_id -> histórico da sessão
+
+    Também usada pelo servico_chat.py para atender várias sessões em paralelo.
+    """
+    prompt_sugestao = ChatPromptTemplate.from_messages(
+        [
+            ("system", "Você é um assistente especializado em recomendar cidades turísticas com base nos interesses do usuário."),
+            ("placeholder", "{historico}"),
+            ("human", "{query}"),
+        ]
+    )
+
+    cadeia = prompt_sugestao | modelo | StrOutputParser()
+
+    return RunnableWithMessageHistory(
+        runnable=cadeia,
+        get_session_history=historico_por_sessao,
+        input_messages_key="query",
+        history_messages_key="historico",
+    )
 
 
 def main():
@@ -45,6 +95,14 @@ def main():
     Utiliza RunnableWithMessageHistory para manter o contexto
     entre múltiplas perguntas, permitindo conversas multi-turno.
     """
+    parser = argparse.ArgumentParser(description="Aula 006 - Memória de conversação")
+    parser.add_argument("--completo", action="store_true", help="Mantém o histórico completo, sem resumo")
+    parser.add_argument("--persistente", action="store_true", help="Grava as sessões em disco (SQLite)")
+    parser.add_argument("--compacto", action="store_true",
+                        help="Histórico completo em memória, em formato compacto (muitas sessões)")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    args = parser.parse_args()
+
     # Carrega as variáveis de ambiente do arquivo .env
     load_dotenv()
     
@@ -52,54 +110,64 @@ def main():
     api_key = os.getenv('OPENAI_API_KEY')
 
     # Inicialização do modelo (compartilhado entre as cadeias)
-    modelo = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=500
-    )
-
-    prompt_sugestao = ChatPromptTemplate.from_messages(
-        [
-            ("system", "Você é um assistente especializado em recomendar cidades turísticas com base nos interesses do usuário."),
-            ("placeholder", "{historico}"),
-            ("human", "{query}"),
-        ]
-    )
-
-    cadeia = prompt_sugestao | modelo | StrOutputParser()
+    if args.fake:
+        modelo = ModeloChatFake(latencia_s=0.2)
+    else:
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=api_key,
+            temperature=0.7,
+            max_tokens=500
+        )
 
     memoria = {}
     sessao_id = "aula006_sessao1"
 
-    def historico_por_sessao(sessao_id: str) -> InMemoryChatMessageHistory:
+    def historico_por_sessao(sessao_id: str) -> BaseChatMessageHistory:
         if sessao_id not in memoria:
-            memoria[sessao_id] = InMemoryChatMessageHistory()
+            if args.completo:
+                memoria[sessao_id] = InMemoryChatMessageHistory()
+            else:
+                # O mesmo modelo gera os resumos, em segundo plano
+                memoria[sessao_id] = HistoricoResumido(modelo, max_tokens=MAX_TOKENS_HISTORICO)
 
         return memoria[sessao_id]  
 
+    # Com --persistente, as sessões sobrevivem a reinícios: cada uma é carregada
+    # do disco no primeiro acesso e só as mais recentes ficam em memória
+    armazenamento = None
+    if args.persistente:
+        armazenamento = ArmazenamentoSessoes(os.getenv("SESSOES_ARQUIVO", ARQUIVO_PADRAO))
+        historico_por_sessao = armazenamento.obter
+    elif args.compacto:
+        # Papéis e textos em registros compactos; as mensagens só são
+        # criadas ao montar o prompt
+        historico_por_sessao = ArmazenamentoCompacto().obter
+
     lista_pergunta = [
         "Quero visitar cidades com muitas praias. Quais você recomenda?",
         "Qual a melhor epoca do ano para visitar essas cidades?",
     ]
 
-    cadeia_com_memoria = RunnableWithMessageHistory(
-        runnable=cadeia,
-        get_session_history=historico_por_sessao,
-        input_messages_key="query",
-        history_messages_key="historico",
-    )
+    # prompt (com placeholder {historico}) -> modelo -> StrOutputParser,
+    # envolvido pelo RunnableWithMessageHistory
+    cadeia_com_memoria = criar_cadeia_com_memoria(modelo, historico_por_sessao)
 
     for pergunta in lista_pergunta:
         resposta = cadeia_com_memoria.invoke(
             {
                 "query": pergunta
             },
-            config={"session_id": sessao_id}
+            # Turno de chat: passa à frente de lotes no escalonador (escalonador_taxa.py)
+            config={"session_id": sessao_id, "metadata": {"prioridade": "interativa"}}
         )
 
         print("Usuario: ", pergunta)
         print("Assistente: ", resposta, "\n")
 
+    if armazenamento is not None:
+        # Grava as mensagens ainda na fila antes de encerrar
+        armazenamento.fechar()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""
+Benchmark Offline das Cadeias das Aulas
+=======================================
+
+Mede o desempenho das cadeias da aula001 à aula006 sem chave de API: um
+servidor local compatível com a OpenAI (servidor_fake.py) é iniciado e o
+ChatOpenAI de cada aula é apontado para ele. Os resultados são gravados em
+JSON e podem ser comparados com uma execução de referência para detectar
+regressões antes do deploy.
+
+Métricas por aula:
+- vazão (requisições/s) com concorrência configurável
+- tempo até o primeiro token (TTFT) p50/p95/p99
+- latência total p50/p95/p99
+- pico de memória alocada por requisição (tracemalloc, em uma passada
+  separada para não distorcer as medições de tempo)
+
+Uso:
+    python benchmark.py --requisicoes 100 --concorrencia 16 --saida benchmark.json
+    python benchmark.py --aulas aula003 aula005 --latencia 0.1 --tokens-por-segundo 200
+    python benchmark.py --referencia benchmark_base.json --tolerancia 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+
+from fabrica_modelo import criar_modelo
+from pool_conexoes import obter_pool
+from processamento_lote import percentil
+from servidor_fake import ServidorFake
+
+
+class MedidorPrimeiroToken(BaseCallbackHandler):
+    """Registra o instante do primeiro token não vazio recebido do modelo."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.primeiro_token: Optional[float] = None
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token and self.primeiro_token is None:
+            self.primeiro_token = time.perf_counter()
+
+
+def criar_cenarios() -> Dict[str, Tuple[Callable, Callable[[int], dict], Callable[[int], dict]]]:
+    """
+    Retorna, para cada aula: (criar_cadeia(modelo), entrada(i), config(i)).
+    As aulas são importadas aqui para que `--aulas` selecione o que medir.
+    """
+    import aula001
+    import aula002
+    import aula003
+    import aula004
+    import aula005
+    import aula006
+    from historico_resumido import HistoricoResumido
+
+    parametros_plano = {"numero_dias": 7, "numero_criancas": 2, "atividade": "música"}
+    template_plano = aula002.criar_template()
+    sem_config = lambda i: {}
+
+    def cadeia_aula006(modelo):
+        memoria = {}
+
+        def historico_por_sessao(sessao_id: str):
+            if sessao_id not in memoria:
+                memoria[sessao_id] = HistoricoResumido(modelo, max_tokens=aula006.MAX_TOKENS_HISTORICO)
+            return memoria[sessao_id]
+
+        return aula006.criar_cadeia_com_memoria(modelo, historico_por_sessao)
+
+    return {
+        "aula001": (
+            lambda modelo: RunnableLambda(lambda entrada: aula001.criar_prompt(**entrada)) | modelo,
+            lambda i: parametros_plano,
+            sem_config,
+        ),
+        "aula002": (
+            lambda modelo: RunnableLambda(lambda entrada: template_plano.format(**entrada)) | modelo,
+            lambda i: parametros_plano,
+            sem_config,
+        ),
+        "aula003": (aula003.criar_cadeia, lambda i: {"interesse": "praias"}, sem_config),
+        "aula004": (aula004.criar_cadeia, lambda i: {"interesse": "praias"}, sem_config),
+        "aula005": (aula005.criar_cadeia, lambda i: {"interesse": "praias"}, sem_config),
+        "aula006": (
+            cadeia_aula006,
+            lambda i: {"query": "Quero visitar cidades com muitas praias. Quais você recomenda?"},
+            # Uma sessão para cada 4 requisições: o histórico cresce ao longo do teste
+            lambda i: {"configurable": {"session_id": f"benchmark-{i // 4}"}},
+        ),
+    }
+
+
+async def _medir_requisicao(cadeia, entrada: dict, config: dict) -> Tuple[float, Optional[float]]:
+    """Executa uma requisição em streaming; retorna (latência, ttft) em segundos."""
+    medidor = MedidorPrimeiroToken()
+    config = {**config, "callbacks": [medidor]}
+    inicio = time.perf_counter()
+    async for _ in cadeia.astream(entrada, config=config):
+        pass
+    fim = time.perf_counter()
+    ttft = medidor.primeiro_token - inicio if medidor.primeiro_token else None
+    return fim - inicio, ttft
+
+
+async def medir_cenario(cadeia, entrada, config, requisicoes: int, concorrencia: int) -> dict:
+    """Executa `requisicoes` chamadas com até `concorrencia` simultâneas e resume as métricas."""
+    latencias: List[float] = []
+    ttfts: List[float] = []
+    erros = 0
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma(i: int):
+        nonlocal erros
+        async with semaforo:
+            try:
+                latencia, ttft = await _medir_requisicao(cadeia, entrada(i), config(i))
+            except Exception:
+                erros += 1
+                return
+            latencias.append(latencia)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    # Aquecimento: importações tardias, conexão HTTP e caches internos
+    await _medir_requisicao(cadeia, entrada(-1), config(-1))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma(i) for i in range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "requisicoes": requisicoes,
+        "erros": erros,
+        "duracao_s": round(duracao, 4),
+        "vazao_rps": round(requisicoes / duracao, 3) if duracao else 0.0,
+        **{f"ttft_p{p}_ms": round(percentil(ttfts, p) * 1000, 2) for p in (50, 95, 99)},
+        **{f"latencia_p{p}_ms": round(percentil(latencias, p) * 1000, 2) for p in (50, 95, 99)},
+    }
+
+
+async def medir_memoria(cadeia, entrada, config, amostras: int = 3) -> float:
+    """Pico de memória alocada (KB) durante requisições sequenciais."""
+    tracemalloc.start()
+    try:
+        for i in range(amostras):
+            tracemalloc.reset_peak()
+            await _medir_requisicao(cadeia, entrada(i), config(i))
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(pico / 1024, 1)
+
+
+def comparar(resultados: dict, referencia: dict, tolerancia: float) -> List[str]:
+    """Lista as regressões de latência p95, TTFT p95 ou vazão acima da tolerância."""
+    regressoes = []
+    for aula, atual in resultados.items():
+        base = referencia.get("resultados", {}).get(aula)
+        if not base:
+            continue
+        for metrica in ("latencia_p95_ms", "ttft_p95_ms"):
+            if base.get(metrica) and atual[metrica] > base[metrica] * (1 + tolerancia):
+                regressoes.append(f"{aula}: {metrica} {base[metrica]} -> {atual[metrica]}")
+        if base.get("vazao_rps") and atual["vazao_rps"] < base["vazao_rps"] * (1 - tolerancia):
+            regressoes.append(f"{aula}: vazao_rps {base['vazao_rps']} -> {atual['vazao_rps']}")
+    return regressoes
+
+
+def imprimir(aula: str, metricas: dict) -> None:
+    """Exibe uma linha de resumo das métricas de uma aula."""
+    print(
+        f"{aula}: {metricas['vazao_rps']:.1f} req/s | "
+        f"TTFT p50 {metricas['ttft_p50_ms']:.0f}ms p99 {metricas['ttft_p99_ms']:.0f}ms | "
+        f"latência p50 {metricas['latencia_p50_ms']:.0f}ms p95 {metricas['latencia_p95_ms']:.0f}ms "
+        f"p99 {metricas['latencia_p99_ms']:.0f}ms | memória {metricas['memoria_pico_kb']:.0f}KB | "
+        f"erros {metricas['erros']}"
+    )
+
+
+def main():
+    """Executa o benchmark e grava os resultados em JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark offline das cadeias das aulas")
+    parser.add_argument("--aulas", nargs="*", help="Aulas a medir (padrão: todas)")
+    parser.add_argument("--requisicoes", type=int, default=50, help="Requisições por aula")
+    parser.add_argument("--concorrencia", type=int, default=8, help="Requisições simultâneas")
+    parser.add_argument("--latencia", type=float, default=0.1, help="Mediana do TTFT do servidor (s)")
+    parser.add_argument("--dispersao", type=float, default=0.3, help="Sigma log-normal da latência")
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 500")
+    parser.add_argument("--saida", default="benchmark.json", help="Arquivo JSON de resultados")
+    parser.add_argument("--referencia", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    cenarios = criar_cenarios()
+    aulas = args.aulas or list(cenarios)
+
+    with ServidorFake(
+        latencia_s=args.latencia,
+        dispersao=args.dispersao,
+        tokens_por_segundo=args.tokens_por_segundo,
+        taxa_erro=args.taxa_erro,
+        semente=42,
+    ) as servidor:
+        # Mesmos parâmetros das aulas; sem cache, sem retentativas e sem as camadas
+        # configuráveis por ambiente (LLM_AGRUPAR...), para a referência ser comparável
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key="fake",
+            base_url=servidor.url,
+            temperature=0.7,
+            max_tokens=500,
+            max_retries=0,
+            cache=False,
+            agrupar=False,
+            escalonador=False,
+            redundancia=False,
+        )
+
+        resultados = {}
+
+        # Um único loop de eventos: o cliente HTTP assíncrono do ChatOpenAI fica preso ao loop em que foi criado
+        async def medir_todas():
+            for aula in aulas:
+                criar_cadeia, entrada, config = cenarios[aula]
+                cadeia = criar_cadeia(modelo)
+                metricas = await medir_cenario(cadeia, entrada, config, args.requisicoes, args.concorrencia)
+                metricas["memoria_pico_kb"] = await medir_memoria(cadeia, entrada, config)
+                resultados[aula] = metricas
+                imprimir(aula, metricas)
+
+        asyncio.run(medir_todas())
+        servidor_estatisticas = dict(servidor.estatisticas)
+
+    relatorio = {
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "parametros": {
+            "requisicoes": args.requisicoes,
+            "concorrencia": args.concorrencia,
+            "servidor": asdict(servidor.configuracao),
+        },
+        "servidor": servidor_estatisticas,
+        "pool": obter_pool().estatisticas() if obter_pool() else None,
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+        for regressao in regressoes:
+            print("REGRESSÃO:", regressao)
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
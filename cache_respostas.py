@@ -0,0 +1,256 @@
+"""
+Cache Persistente de Respostas do Modelo (SQLite)
+=================================================
+
+Este módulo implementa um cache em disco para as respostas dos modelos de
+chat. Prompts idênticos (mesmo texto e mesmos parâmetros do modelo) são
+respondidos a partir do disco, sem pagar a latência e o custo da API.
+
+Conceitos abordados:
+- BaseCache: Interface de cache de respostas do LangChain
+- Chave do cache: prompt renderizado + parâmetros do modelo (nome,
+  temperature, max_tokens...), combinados em um hash SHA-256
+- Remoção LRU (menos usadas recentemente) ao atingir o limite de tamanho
+- Expiração por tempo (TTL)
+- Contadores de acertos e falhas
+
+Configuração por variáveis de ambiente (lidas por `obter_cache()`):
+- LLM_CACHE=0                       desativa o cache
+- LLM_CACHE_ARQUIVO                 caminho do banco (padrão: .cache/respostas_llm.sqlite)
+- LLM_CACHE_TTL_S                   validade das entradas em segundos (padrão: 7 dias)
+- LLM_CACHE_MAX_ENTRADAS            número máximo de respostas (padrão: 10000)
+- LLM_CACHE_MAX_MB                  tamanho máximo das respostas em MB (padrão: 100)
+- LLM_CACHE_TEMPERATURA_MAXIMA      modelos com temperature acima deste valor
+                                    não usam o cache (padrão: 1.0)
+
+Uso:
+    python cache_respostas.py             # exibe estatísticas do cache
+    python cache_respostas.py --limpar    # remove todas as entradas
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Optional, Sequence
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+
+ARQUIVO_PADRAO = os.path.join(".cache", "respostas_llm.sqlite")
+
+
+class CacheSQLite(BaseCache):
+    """
+    Cache de respostas em SQLite com remoção LRU, TTL e limite de tamanho.
+
+    Seguro para uso por várias threads: todas as operações passam por uma
+    única conexão protegida por uma trava.
+    """
+
+    def __init__(
+        self,
+        arquivo: str = ARQUIVO_PADRAO,
+        ttl_s: Optional[float] = 7 * 24 * 3600,
+        max_entradas: int = 10_000,
+        max_bytes: int = 100 * 1024 * 1024,
+    ):
+        self.arquivo = arquivo
+        self.ttl_s = ttl_s
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+
+        # Contadores do processo atual
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+        diretorio = os.path.dirname(arquivo)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._trava = threading.Lock()
+        self._conexao = sqlite3.connect(arquivo, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                criado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+            """
+        )
+        self._conexao.execute(
+            "CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (acessado_em)"
+        )
+        # Ocupação mantida em memória: o COUNT/SUM da tabela só roda na abertura
+        # e quando um limite é excedido
+        self._entradas, self._bytes = self._contar()
+
+    def _contar(self):
+        """Número de entradas e bytes das respostas, lidos da tabela (com a trava)."""
+        return self._conexao.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas"
+        ).fetchone()
+
+    def _remover(self, chave: str, tamanho: int) -> None:
+        """Remove uma entrada e desconta-a da ocupação (com a trava)."""
+        if self._conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,)).rowcount:
+            self._entradas -= 1
+            self._bytes -= tamanho
+
+    @staticmethod
+    def _chave(prompt: str, llm_string: str) -> str:
+        # llm_string inclui nome do modelo, temperature, max_tokens e demais parâmetros
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        """Retorna as gerações em cache, ou None em caso de falha (miss)."""
+        chave = self._chave(prompt, llm_string)
+        agora = time.time()
+        with self._trava:
+            linha = self._conexao.execute(
+                "SELECT resposta, criado_em, tamanho FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is not None and self.ttl_s is not None and agora - linha[1] > self.ttl_s:
+                # Entrada expirada: remove e trata como falha
+                self._remover(chave, linha[2])
+                self.remocoes += 1
+                linha = None
+            if linha is None:
+                self.falhas += 1
+                return None
+            self._conexao.execute(
+                "UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave)
+            )
+            self.acertos += 1
+        # loads() ainda é marcado como beta pelo LangChain; o aviso se repetiria a cada acerto
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return loads(linha[0], allowed_objects="core")
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        """Grava a resposta e remove as entradas menos usadas se o limite for excedido."""
+        resposta = dumps(list(return_val))
+        chave = self._chave(prompt, llm_string)
+        agora = time.time()
+        with self._trava:
+            anterior = self._conexao.execute(
+                "SELECT tamanho FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?)",
+                (chave, resposta, len(resposta), agora, agora),
+            )
+            if anterior is None:
+                self._entradas += 1
+            else:
+                self._bytes -= anterior[0]
+            self._bytes += len(resposta)
+            self._aplicar_limites()
+
+    def _aplicar_limites(self) -> None:
+        """Remove entradas em ordem LRU até respeitar max_entradas e max_bytes."""
+        if self._entradas <= self.max_entradas and self._bytes <= self.max_bytes:
+            return
+        # Recontagem antes de remover: outro processo pode usar o mesmo arquivo
+        quantidade, total_bytes = self._contar()
+        cursor = self._conexao.execute(
+            "SELECT chave, tamanho FROM respostas ORDER BY acessado_em ASC"
+        )
+        removidas = []
+        for chave, tamanho in cursor:
+            if quantidade <= self.max_entradas and total_bytes <= self.max_bytes:
+                break
+            removidas.append((chave,))
+            quantidade -= 1
+            total_bytes -= tamanho
+        self._conexao.executemany("DELETE FROM respostas WHERE chave = ?", removidas)
+        self.remocoes += len(removidas)
+        self._entradas, self._bytes = quantidade, total_bytes
+
+    def clear(self, **kwargs) -> None:
+        """Remove todas as entradas do cache."""
+        with self._trava:
+            self._conexao.execute("DELETE FROM respostas")
+            self._entradas = self._bytes = 0
+
+    def estatisticas(self) -> dict:
+        """Contadores do processo atual e ocupação do banco."""
+        with self._trava:
+            quantidade, total_bytes = self._contar()
+        consultas = self.acertos + self.falhas
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            "remocoes": self.remocoes,
+            "entradas": quantidade,
+            "bytes": total_bytes,
+        }
+
+
+_cache_global: Optional[CacheSQLite] = None
+_trava_global = threading.Lock()
+
+
+def obter_cache() -> Optional[CacheSQLite]:
+    """
+    Retorna o cache compartilhado do processo, criado a partir das variáveis
+    de ambiente na primeira chamada (ou None se LLM_CACHE=0).
+    """
+    global _cache_global
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    with _trava_global:
+        if _cache_global is None:
+            ttl = float(os.getenv("LLM_CACHE_TTL_S", 7 * 24 * 3600))
+            _cache_global = CacheSQLite(
+                arquivo=os.getenv("LLM_CACHE_ARQUIVO", ARQUIVO_PADRAO),
+                ttl_s=ttl if ttl > 0 else None,
+                max_entradas=int(os.getenv("LLM_CACHE_MAX_ENTRADAS", 10_000)),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", 100)) * 1024 * 1024),
+            )
+    return _cache_global
+
+
+def cache_para_temperatura(temperature: Optional[float]) -> Optional[CacheSQLite]:
+    """
+    Retorna o cache compartilhado, ou None quando a temperature do modelo
+    excede LLM_CACHE_TEMPERATURA_MAXIMA (respostas não determinísticas).
+    """
+    limite = float(os.getenv("LLM_CACHE_TEMPERATURA_MAXIMA", 1.0))
+    if temperature is not None and temperature > limite:
+        return None
+    return obter_cache()
+
+
+def main():
+    """Exibe as estatísticas do cache ou remove todas as entradas."""
+    parser = argparse.ArgumentParser(description="Cache persistente de respostas do modelo")
+    parser.add_argument("--limpar", action="store_true", help="Remove todas as entradas")
+    args = parser.parse_args()
+
+    cache = obter_cache()
+    if cache is None:
+        print("Cache desativado (LLM_CACHE=0)")
+        return
+    if args.limpar:
+        cache.clear()
+        print("Cache limpo.")
+    estatisticas = cache.estatisticas()
+    print(f"Arquivo: {cache.arquivo}")
+    print(f"Entradas: {estatisticas['entradas']} ({estatisticas['bytes'] / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Cascata de Modelos: o Rápido Primeiro, o Forte Quando Necessário
+================================================================
+
+Todas as aulas usam o mesmo modelo com max_tokens=500, seja qual for a
+dificuldade da tarefa. Na cascata, cada pedido vai primeiro ao modelo mais
+rápido e barato; só quando a resposta não passa pelas verificações ele é
+repetido no nível seguinte (um modelo mais forte):
+- o JsonOutputParser (ou a saída nativa) não consegue ler o JSON
+- o Pydantic rejeita o objeto (campo faltando, tipo errado)
+- a verificação de confiança falha (padrão: algum campo de texto vazio)
+
+Conceitos abordados:
+- Cascata de cadeias: a mesma cadeia criada para cada modelo, do mais
+  barato ao mais caro; erros de transporte (rede, 429) não escalam, ficam
+  com as retentativas do cliente e do escalonador
+- max_tokens por tarefa, estimado a partir do schema de saída (campos,
+  maxLength, maxItems) em vez de 500 para tudo: respostas truncadas
+  custam menos e o escalonador (escalonador_taxa.py) reserva menos TPM
+- Estatísticas por cadeia: taxa de escalonamento, nível que resolveu,
+  custo relativo e latência economizada em relação a usar sempre o último
+  nível (estimada pela latência média observada nele ou, se ele ainda não
+  foi chamado, pela latência de referência do nível)
+
+Configuração por variáveis de ambiente (lidas por `obter_niveis()`):
+- LLM_CASCATA    modelos da cascata, do mais barato ao mais forte,
+                 separados por vírgula, cada um como modelo[:custo[:latencia_s]]
+                 (padrão: gpt-4o-mini,gpt-4o). Sem custo ou latência, usa os
+                 valores de REFERENCIAS (custo 1.0 e sem latência para
+                 modelos fora da tabela)
+
+Uso:
+    from cascata_modelos import Nivel, criar_cascata
+
+    cadeia = criar_cascata(
+        aula004.criar_cadeia,
+        [Nivel("gpt-4o-mini", rapido, custo=1), Nivel("gpt-4o", forte, custo=16)],
+        esquema=aula004.DestinoTuristico,
+        nome="aula004",
+    )
+
+    python aula004.py --cascata
+    python cascata_modelos.py --requisicoes 200   # comparação no servidor fake
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from instrumentacao import METRICAS, Metricas
+from modelo_fake import estimar_tokens
+
+# Tokens reservados para um campo de texto sem maxLength
+TOKENS_POR_TEXTO = 64
+# Itens considerados para listas sem maxItems
+ITENS_POR_LISTA = 5
+
+# Custo relativo por chamada (preço por token em relação ao gpt-4o-mini) e
+# latência típica de uma resposta curta (s), usados quando LLM_CASCATA não
+# informa os valores; ajuste à conta e à região
+REFERENCIAS: Dict[str, Tuple[float, Optional[float]]] = {
+    "gpt-4o-mini": (1.0, 1.0),
+    "gpt-3.5-turbo": (3.0, 1.0),
+    "gpt-4o": (16.0, 2.5),
+}
+
+
+# ----------------------------------------------------------------------
+# max_tokens a partir do schema
+# ----------------------------------------------------------------------
+
+def max_tokens_para_esquema(esquema: Type[BaseModel], folga: float = 1.25) -> int:
+    """
+    Estimativa de tokens de um JSON que segue `esquema`, com uma folga:
+    nomes dos campos, pontuação e o tamanho máximo de cada valor.
+    """
+    schema = esquema.model_json_schema()
+    definicoes = schema.get("$defs", {})
+
+    def estimar(no: dict) -> int:
+        if "$ref" in no:
+            return estimar(definicoes[no["$ref"].rsplit("/", 1)[-1]])
+        for chave in ("anyOf", "oneOf"):
+            if chave in no:
+                return max(estimar(opcao) for opcao in no[chave])
+        tipo = no.get("type")
+        if tipo == "object":
+            return 2 + sum(
+                estimar_tokens(json.dumps(nome)) + 1 + estimar(filho)
+                for nome, filho in no.get("properties", {}).items()
+            )
+        if tipo == "array":
+            return 2 + no.get("maxItems", ITENS_POR_LISTA) * (1 + estimar(no.get("items", {})))
+        if tipo in ("integer", "number"):
+            return 4
+        if tipo in ("boolean", "null"):
+            return 2
+        if "enum" in no:
+            return 2 + max(estimar_tokens(str(valor)) for valor in no["enum"])
+        if "maxLength" in no:
+            return 2 + estimar_tokens("x" * no["maxLength"])
+        return TOKENS_POR_TEXTO
+
+    return math.ceil(estimar(schema) * folga)
+
+
+def limitar_tokens(modelo, max_tokens: int):
+    """Cópia do modelo com outro max_tokens (ChatOpenAI, ModeloChatFake...)."""
+    if "max_tokens" not in type(modelo).model_fields:
+        return modelo
+    return modelo.model_copy(update={"max_tokens": max_tokens})
+
+
+# ----------------------------------------------------------------------
+# Verificação de confiança
+# ----------------------------------------------------------------------
+
+def campos_preenchidos(esquema: Type[BaseModel]) -> Callable[[Any], bool]:
+    """Verificação padrão: todos os campos de texto do schema vêm preenchidos."""
+    campos = [
+        nome for nome, propriedade in esquema.model_json_schema().get("properties", {}).items()
+        if propriedade.get("type") == "string"
+    ]
+
+    def verificar(resultado: Any) -> bool:
+        return all(str(resultado.get(campo) or "").strip() for campo in campos)
+
+    return verificar
+
+
+# ----------------------------------------------------------------------
+# Estatísticas
+# ----------------------------------------------------------------------
+
+class EstatisticasCascata:
+    """Contadores e latências por cadeia, seguros entre threads."""
+
+    def __init__(self, metricas: Metricas = METRICAS):
+        self.metricas = metricas
+        self._trava = threading.Lock()
+        self._cadeias: Dict[str, dict] = {}
+
+    def _cadeia(self, nome: str) -> dict:
+        return self._cadeias.setdefault(nome, {
+            "chamadas": 0,
+            "escalonadas": 0,
+            "motivos": Counter(),
+            "resolvidas": Counter(),
+            "custo": 0.0,
+            "latencia_s": 0.0,
+            # Latência média das chamadas de cada nível (para estimar a economia)
+            "latencia_nivel": {},
+            "atendidas_nivel": Counter(),
+        })
+
+    def registrar_tentativa(self, cadeia: str, nivel: str, duracao: float, motivo: Optional[str]) -> None:
+        with self._trava:
+            dados = self._cadeia(cadeia)
+            dados["atendidas_nivel"][nivel] += 1
+            media = dados["latencia_nivel"].get(nivel, duracao)
+            dados["latencia_nivel"][nivel] = media + (duracao - media) / dados["atendidas_nivel"][nivel]
+            if motivo:
+                dados["motivos"][motivo] += 1
+        if motivo:
+            self.metricas.incrementar("llm_cascata_escalonamentos_total", cadeia=cadeia, nivel=nivel, motivo=motivo)
+
+    def registrar_chamada(self, cadeia: str, nivel: str, niveis_usados: int, custo: float, duracao: float) -> None:
+        with self._trava:
+            dados = self._cadeia(cadeia)
+            dados["chamadas"] += 1
+            dados["escalonadas"] += niveis_usados > 1
+            dados["resolvidas"][nivel] += 1
+            dados["custo"] += custo
+            dados["latencia_s"] += duracao
+        self.metricas.incrementar("llm_cascata_total", cadeia=cadeia, nivel=nivel)
+        self.metricas.observar("llm_cascata_segundos", duracao, cadeia=cadeia)
+
+    def resumo(self, cadeia: str, ultimo: "Nivel") -> dict:
+        """
+        Taxa de escalonamento, resolvidas por nível, latência média, custo
+        relativo (1.0 = sempre o último nível) e latência economizada.
+
+        A base da economia é a latência média observada no último nível
+        (em qualquer cadeia do processo) ou, sem observações, a sua
+        latência de referência; sem nenhuma das duas, fica None.
+        """
+        with self._trava:
+            dados = self._cadeia(cadeia)
+            chamadas = dados["chamadas"]
+            custo_ultimo = ultimo.custo
+            observadas = [
+                (outra["latencia_nivel"][ultimo.nome], outra["atendidas_nivel"][ultimo.nome])
+                for outra in self._cadeias.values() if ultimo.nome in outra["latencia_nivel"]
+            ]
+            if observadas:
+                media_ultimo = sum(media * n for media, n in observadas) / sum(n for _, n in observadas)
+            else:
+                media_ultimo = ultimo.latencia_s
+            economia = media_ultimo * chamadas - dados["latencia_s"] if media_ultimo is not None else None
+            return {
+                "chamadas": chamadas,
+                "taxa_escalonamento": dados["escalonadas"] / chamadas if chamadas else 0.0,
+                "motivos": dict(dados["motivos"]),
+                "resolvidas_por_nivel": dict(dados["resolvidas"]),
+                "latencia_media_s": dados["latencia_s"] / chamadas if chamadas else 0.0,
+                "custo_relativo": dados["custo"] / (custo_ultimo * chamadas) if chamadas and custo_ultimo else None,
+                "latencia_referencia_s": media_ultimo,
+                "latencia_economizada_s": economia,
+            }
+
+
+# Estatísticas padrão do processo
+ESTATISTICAS = EstatisticasCascata()
+
+
+# ----------------------------------------------------------------------
+# Cascata
+# ----------------------------------------------------------------------
+
+@dataclass
+class Nivel:
+    """
+    Um nível da cascata: nome do modelo, o modelo, o custo relativo por
+    chamada e a latência de referência (base da latência economizada
+    enquanto o nível não tiver sido chamado).
+    """
+    nome: str
+    modelo: Any
+    custo: float = 1.0
+    latencia_s: Optional[float] = None
+
+
+class FalhaCascata(ValueError):
+    """Nenhum nível produziu uma resposta válida."""
+
+
+def criar_cascata(
+    criar_cadeia: Callable[[Any], Runnable],
+    niveis: Sequence[Nivel],
+    esquema: Type[BaseModel],
+    nome: str = "cadeia",
+    confianca: Optional[Callable[[Any], bool]] = None,
+    max_tokens: Optional[int] = None,
+    estatisticas: EstatisticasCascata = ESTATISTICAS,
+) -> Runnable:
+    """
+    Runnable que executa `criar_cadeia(modelo)` nível a nível até uma
+    resposta passar pelas verificações.
+
+    - esquema: modelo Pydantic da saída (validação e max_tokens)
+    - confianca: função resultado -> bool (padrão: campos_preenchidos);
+      no último nível, uma resposta de baixa confiança é devolvida assim mesmo
+    - max_tokens: padrão estimado pelo schema (max_tokens_para_esquema)
+    """
+    if not niveis:
+        raise ValueError("A cascata precisa de pelo menos um nível")
+    limite = max_tokens or max_tokens_para_esquema(esquema)
+    cadeias = [(nivel, criar_cadeia(limitar_tokens(nivel.modelo, limite))) for nivel in niveis]
+    verificar = confianca or campos_preenchidos(esquema)
+
+    def avaliar(resultado: Any) -> Optional[str]:
+        """Motivo para escalar, ou None se a resposta é aceita."""
+        esquema.model_validate(resultado)
+        return None if verificar(resultado) else "confianca"
+
+    def concluir(nivel: Nivel, usados: int, custo: float, inicio: float) -> None:
+        estatisticas.registrar_chamada(nome, nivel.nome, usados, custo, time.perf_counter() - inicio)
+
+    def executar(entrada, config=None):
+        inicio = time.perf_counter()
+        custo = 0.0
+        for posicao, (nivel, cadeia) in enumerate(cadeias):
+            ultimo = posicao == len(cadeias) - 1
+            inicio_nivel = time.perf_counter()
+            custo += nivel.custo
+            try:
+                resultado = cadeia.invoke(entrada, config)
+                motivo = avaliar(resultado)
+            except ValueError as erro:
+                # OutputParserException e ValidationError são ValueError
+                estatisticas.registrar_tentativa(nome, nivel.nome, time.perf_counter() - inicio_nivel, "analise")
+                if ultimo:
+                    concluir(nivel, posicao + 1, custo, inicio)
+                    raise FalhaCascata(f"{nome}: nenhum nível produziu uma resposta válida") from erro
+                continue
+            estatisticas.registrar_tentativa(
+                nome, nivel.nome, time.perf_counter() - inicio_nivel, None if ultimo else motivo
+            )
+            if motivo is None or ultimo:
+                concluir(nivel, posicao + 1, custo, inicio)
+                return resultado
+
+    async def aexecutar(entrada, config=None):
+        inicio = time.perf_counter()
+        custo = 0.0
+        for posicao, (nivel, cadeia) in enumerate(cadeias):
+            ultimo = posicao == len(cadeias) - 1
+            inicio_nivel = time.perf_counter()
+            custo += nivel.custo
+            try:
+                resultado = await cadeia.ainvoke(entrada, config)
+                motivo = avaliar(resultado)
+            except ValueError as erro:
+                estatisticas.registrar_tentativa(nome, nivel.nome, time.perf_counter() - inicio_nivel, "analise")
+                if ultimo:
+                    concluir(nivel, posicao + 1, custo, inicio)
+                    raise FalhaCascata(f"{nome}: nenhum nível produziu uma resposta válida") from erro
+                continue
+            estatisticas.registrar_tentativa(
+                nome, nivel.nome, time.perf_counter() - inicio_nivel, None if ultimo else motivo
+            )
+            if motivo is None or ultimo:
+                concluir(nivel, posicao + 1, custo, inicio)
+                return resultado
+
+    return RunnableLambda(executar, afunc=aexecutar, name=f"cascata_{nome}")
+
+
+def obter_niveis() -> List[Tuple[str, float, Optional[float]]]:
+    """
+    (modelo, custo, latência de referência) de cada nível configurado em
+    LLM_CASCATA, do mais barato ao mais forte.
+    """
+    niveis = []
+    for item in os.getenv("LLM_CASCATA", "gpt-4o-mini,gpt-4o").split(","):
+        partes = [parte.strip() for parte in item.split(":")]
+        if not partes[0]:
+            continue
+        custo, latencia = REFERENCIAS.get(partes[0], (1.0, None))
+        if len(partes) > 1 and partes[1]:
+            custo = float(partes[1])
+        if len(partes) > 2 and partes[2]:
+            latencia = float(partes[2])
+        niveis.append((partes[0], custo, latencia))
+    return niveis
+
+
+# ----------------------------------------------------------------------
+# Comparação no servidor fake
+# ----------------------------------------------------------------------
+
+def main():
+    """Sempre o modelo forte x cascata rápido -> forte, na cadeia da aula004, no servidor fake."""
+    parser = argparse.ArgumentParser(description="Cascata de modelos com escalonamento por falha de análise")
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument(
+        "--taxa-json-invalido", type=float, default=0.1,
+        help="Fração de JSON malformado do modelo rápido (o forte não erra)",
+    )
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import aula004
+    from fabrica_modelo import criar_modelo
+    from processamento_lote import percentil
+    from servidor_fake import ServidorFake
+
+    modelos = {
+        "gpt-fake-rapido": {"latencia_s": 0.1, "tokens_por_segundo": 400, "taxa_json_invalido": args.taxa_json_invalido},
+        "gpt-fake-forte": {"latencia_s": 0.4, "tokens_por_segundo": 80},
+    }
+    entradas = [{"interesse": f"praias {i}"} for i in range(args.requisicoes)]
+    print(f"max_tokens pelo schema DestinoTuristico: {max_tokens_para_esquema(aula004.DestinoTuristico)} (antes: 500)")
+
+    with ServidorFake(latencia_s=0.1, dispersao=0.3, semente=42, modelos=modelos) as servidor:
+
+        def modelo(nome: str):
+            return criar_modelo(
+                model_name=nome, openai_api_key="fake", base_url=servidor.url,
+                cache=False, agrupar=False, escalonador=False, max_tokens=500,
+            )
+
+        forte = Nivel("gpt-fake-forte", modelo("gpt-fake-forte"), custo=16)
+        estrategias = {
+            "sempre forte": [forte],
+            "cascata": [Nivel("gpt-fake-rapido", modelo("gpt-fake-rapido"), custo=1), forte],
+        }
+        estatisticas = EstatisticasCascata(Metricas())
+        for nome, niveis in estrategias.items():
+            cadeia = criar_cascata(
+                aula004.criar_cadeia, niveis, aula004.DestinoTuristico, nome=nome, estatisticas=estatisticas
+            )
+            latencias: List[float] = []
+            falhas = 0
+
+            def executar(entrada):
+                inicio = time.perf_counter()
+                try:
+                    cadeia.invoke(entrada)
+                except FalhaCascata:
+                    return None
+                return time.perf_counter() - inicio
+
+            with ThreadPoolExecutor(args.concorrencia) as executor:
+                for latencia in executor.map(executar, entradas):
+                    if latencia is None:
+                        falhas += 1
+                    else:
+                        latencias.append(latencia)
+            resumo = estatisticas.resumo(nome, forte)
+            economia = resumo["latencia_economizada_s"]
+            print(
+                f"{nome:<13} p50 {percentil(latencias, 50):.3f}s | p95 {percentil(latencias, 95):.3f}s | "
+                f"falhas {falhas} | escalonamento {resumo['taxa_escalonamento']:.1%} {resumo['motivos'] or ''} | "
+                f"custo relativo {resumo['custo_relativo']:.2f}"
+                + (f" | latência economizada {economia:.1f}s" if economia is not None else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Linha de Comando Unificada das Aulas
+====================================
+
+Ponto de entrada único para as aulas, as cadeias e as ferramentas do
+projeto. Este módulo importa apenas a biblioteca padrão: o LangChain, o
+Pydantic e o SDK da OpenAI só são carregados quando uma aula ou cadeia é
+de fato executada, o que mantém rápida a inicialização de jobs curtos.
+
+Conceitos abordados:
+- Despacho por nome: `python cli.py aula004 --fake` executa o main() da
+  aula004 com os argumentos restantes
+- Registro de cadeias por referência textual ("modulo:funcao"), resolvida
+  com importlib apenas no momento do uso
+- Importações tardias (lazy imports) como técnica de tempo de inicialização
+- Perfil de importação (`--import-profile`) com base em `python -X importtime`
+  e orçamento em milissegundos (código de saída 1 se ultrapassado)
+
+Uso:
+    python cli.py listar
+    python cli.py aula004 --fake --fluxo
+    python cli.py cadeia aula005 --fake --entrada '{"interesse": "praias"}'
+    python cli.py --import-profile aula004 --orcamento-ms 800
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+# Alvos executáveis: nome -> (módulo com main(), descrição)
+ALVOS: Dict[str, Tuple[str, str]] = {
+    "aula001": ("aula001", "Introdução ao LangChain"),
+    "aula002": ("aula002", "ChatPromptTemplate"),
+    "aula003": ("aula003", "Cadeias com LCEL (--lote para o modo em lote)"),
+    "aula004": ("aula004", "Saída estruturada JSON"),
+    "aula005": ("aula005", "Múltiplas cadeias (pipeline DAG)"),
+    "grafo": ("pipeline_grafo", "Pipeline da aula005 como grafo com checkpoints (falha e retomada)"),
+    "aula006": ("aula006", "Memória de conversação"),
+    "historico": ("historico_compacto", "Memória por sessão: InMemoryChatMessageHistory x histórico compacto"),
+    "servico_chat": ("servico_chat", "Serviço de chat multi-sessão (teste de carga)"),
+    "servidor_fake": ("servidor_fake", "Servidor local compatível com a API da OpenAI"),
+    "lote": ("lote_jsonl", "Execução retomável de uma cadeia sobre um arquivo JSONL"),
+    "cascata": ("cascata_modelos", "Cascata de modelos rápido -> forte no servidor fake"),
+    "redundancia": ("requisicoes_redundantes", "Requisições redundantes contra lentidões na cauda"),
+    "benchmark": ("benchmark", "Benchmark offline das aulas"),
+    "cache": ("cache_respostas", "Ocupação e limpeza do cache de respostas"),
+}
+
+# Cadeias registradas: nome -> "modulo:funcao", onde funcao(modelo) cria a cadeia
+CADEIAS: Dict[str, str] = {
+    "aula003": "aula003:criar_cadeia",
+    "aula004": "aula004:criar_cadeia",
+    "aula005": "aula005:criar_cadeia",
+}
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def resolver(referencia: str):
+    """Importa e retorna o objeto de uma referência "modulo:atributo"."""
+    modulo, _, atributo = referencia.partition(":")
+    objeto = importlib.import_module(modulo)
+    return getattr(objeto, atributo) if atributo else objeto
+
+
+def criar_modelo_padrao(fake: bool = False):
+    """Modelo usado pelas cadeias da CLI: o fake local ou o ChatOpenAI das aulas."""
+    if fake:
+        from modelo_fake import ModeloChatFake
+
+        return ModeloChatFake()
+
+    from dotenv import load_dotenv
+    from fabrica_modelo import criar_modelo
+
+    load_dotenv()
+    return criar_modelo(
+        model_name="gpt-3.5-turbo",
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        temperature=0.7,
+        max_tokens=500
+    )
+
+
+def carregar_cadeia(nome: str, modelo):
+    """Cria a cadeia registrada `nome` com o modelo informado."""
+    if nome not in CADEIAS:
+        raise KeyError(f"Cadeia desconhecida: {nome} (disponíveis: {', '.join(CADEIAS)})")
+    return resolver(CADEIAS[nome])(modelo)
+
+
+# ----------------------------------------------------------------------
+# Perfil de importação
+# ----------------------------------------------------------------------
+
+def perfil_importacao(modulo: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Importa `modulo` em um processo novo com `-X importtime`.
+
+    Retorna (tempo total em ms, [(pacote, ms próprios)] em ordem decrescente).
+    """
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True,
+        text=True,
+        cwd=DIRETORIO,
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {modulo}:\n{resultado.stderr[-2000:]}")
+
+    total_us = 0
+    por_pacote: Dict[str, int] = defaultdict(int)
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:"):
+            continue
+        # "import time: <próprio us> | <acumulado us> | <recuo><módulo>"
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        proprio, acumulado = proprio.strip(), acumulado.strip()
+        if not proprio.isdigit():
+            continue  # cabeçalho
+        por_pacote[nome.strip().split(".")[0]] += int(proprio)
+        # Importações de primeiro nível (um espaço de recuo) somam o tempo total
+        if not nome.startswith("  "):
+            total_us += int(acumulado)
+    pacotes = sorted(((pacote, us / 1000) for pacote, us in por_pacote.items()), key=lambda item: -item[1])
+    return total_us / 1000, pacotes
+
+
+def imprimir_perfil(modulo: str, orcamento_ms: float = None, top: int = 10) -> bool:
+    """Exibe o perfil de importação; retorna False se o orçamento foi ultrapassado."""
+    total_ms, pacotes = perfil_importacao(modulo)
+    print(f"Importação de {modulo}: {total_ms:.0f}ms")
+    for pacote, ms in pacotes[:top]:
+        print(f"  {pacote:<28} {ms:8.1f}ms")
+    if orcamento_ms is None:
+        return True
+    if total_ms > orcamento_ms:
+        print(f"ACIMA DO ORÇAMENTO: {total_ms:.0f}ms > {orcamento_ms:.0f}ms")
+        return False
+    print(f"Dentro do orçamento de {orcamento_ms:.0f}ms")
+    return True
+
+
+# ----------------------------------------------------------------------
+# Comandos
+# ----------------------------------------------------------------------
+
+def listar() -> None:
+    """Lista os alvos e as cadeias disponíveis (sem importar nenhum deles)."""
+    print("Alvos:")
+    for nome, (_, descricao) in ALVOS.items():
+        print(f"  {nome:<14} {descricao}")
+    print("Cadeias (python cli.py cadeia <nome>):")
+    for nome, referencia in CADEIAS.items():
+        print(f"  {nome:<14} {referencia}")
+
+
+def executar_cadeia(argumentos: List[str]) -> None:
+    """Executa uma cadeia registrada com uma entrada JSON e imprime a saída."""
+    parser = argparse.ArgumentParser(prog="cli.py cadeia", description="Executa uma cadeia registrada")
+    parser.add_argument("nome", choices=list(CADEIAS))
+    parser.add_argument("--entrada", default='{"interesse": "praias"}', help="Entrada da cadeia em JSON")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    args = parser.parse_args(argumentos)
+
+    cadeia = carregar_cadeia(args.nome, criar_modelo_padrao(args.fake))
+    saida = cadeia.invoke(json.loads(args.entrada))
+    print(saida if isinstance(saida, str) else json.dumps(saida, ensure_ascii=False, default=str))
+
+
+def executar_alvo(nome: str, argumentos: List[str]) -> None:
+    """Executa o main() do alvo como se ele tivesse sido chamado diretamente."""
+    modulo, _ = ALVOS[nome]
+    sys.argv = [f"{modulo}.py", *argumentos]
+    resolver(f"{modulo}:main")()
+
+
+def main():
+    """Despacha para a aula, cadeia ou ferramenta pedida."""
+    parser = argparse.ArgumentParser(
+        description="Linha de comando unificada das aulas",
+        epilog="Os argumentos após o alvo são repassados a ele (ex.: cli.py aula004 --fake).",
+    )
+    parser.add_argument("alvo", nargs="?", default="listar", help="listar, cadeia ou um dos alvos")
+    parser.add_argument("argumentos", nargs=argparse.REMAINDER, help="Argumentos do alvo")
+    parser.add_argument(
+        "--import-profile", action="store_true",
+        help="Mede o tempo de importação do alvo (ou da própria CLI) em vez de executá-lo",
+    )
+    parser.add_argument("--orcamento-ms", type=float, help="Tempo máximo de importação aceito (ms)")
+    parser.add_argument("--top", type=int, default=10, help="Pacotes exibidos no perfil")
+    args = parser.parse_args()
+
+    if args.import_profile:
+        # As opções do perfil também são aceitas depois do alvo
+        perfil = argparse.ArgumentParser(add_help=False)
+        perfil.add_argument("--orcamento-ms", type=float, default=args.orcamento_ms)
+        perfil.add_argument("--top", type=int, default=args.top)
+        opcoes, args.argumentos = perfil.parse_known_args(args.argumentos)
+        if args.alvo == "listar":
+            modulo = "cli"
+        elif args.alvo == "cadeia" and args.argumentos:
+            modulo = CADEIAS[args.argumentos[0]].partition(":")[0]
+        else:
+            modulo = ALVOS[args.alvo][0]
+        sys.exit(0 if imprimir_perfil(modulo, opcoes.orcamento_ms, opcoes.top) else 1)
+
+    if args.alvo == "listar":
+        listar()
+    elif args.alvo == "cadeia":
+        executar_cadeia(args.argumentos)
+    elif args.alvo in ALVOS:
+        executar_alvo(args.alvo, args.argumentos)
+    else:
+        parser.error(f"alvo desconhecido: {args.alvo} (use 'listar')")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+"""
+Escalonador de Chamadas com Limites de Taxa Adaptativos
+=======================================================
+
+Ao disparar muitos pedidos de plano de atividades (aula001) de uma vez, o
+provedor responde 429: a conta tem limites de requisições por minuto (RPM)
+e de tokens por minuto (TPM). As retentativas ingênuas do SDK esperam às
+cegas e voltam todas juntas, e enquanto isso os turnos de chat da aula006
+ficam presos atrás do lote.
+
+Este módulo coloca um escalonador na frente do modelo:
+- Baldes de tokens de RPM e TPM: cada chamada custa 1 requisição e os
+  tokens estimados do prompt + max_tokens; ao final, o custo é corrigido
+  com o uso real devolvido pelo provedor
+- Concorrência adaptativa (AIMD, como o controle de congestionamento do
+  TCP): +1 chamada simultânea por "janela" de respostas rápidas; em 429
+  ou latência acima do alvo, o limite cai pela metade e as novas chamadas
+  esperam o Retry-After
+- Classes de prioridade: "interativa" (chat) passa à frente de "normal" e
+  de "lote" na fila, e `vagas_reservadas` vagas de concorrência ficam
+  sempre livres para ela
+- Retentativas de 429 e de falhas transitórias feitas pelo próprio
+  escalonador (o SDK é criado com max_retries=0), voltando à fila com a
+  mesma prioridade
+
+A prioridade vem dos metadados da execução:
+    cadeia.invoke(entrada, config={"metadata": {"prioridade": "interativa"}})
+
+Configuração por variáveis de ambiente (lidas por `obter_escalonador()`;
+o escalonador só é ativado se LLM_LIMITE_RPM ou LLM_LIMITE_TPM for definido):
+- LLM_LIMITE_RPM                requisições por minuto da conta
+- LLM_LIMITE_TPM                tokens por minuto da conta
+- LLM_CONCORRENCIA_INICIAL      chamadas simultâneas iniciais (padrão: 8)
+- LLM_CONCORRENCIA_MAXIMA       teto da concorrência adaptativa (padrão: 64)
+- LLM_LATENCIA_ALVO_S           latência acima da qual a concorrência diminui
+                                (padrão: sem alvo, só os 429 reduzem)
+
+Uso:
+    python escalonador_taxa.py --pedidos 300 --limite-rpm 600
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from instrumentacao import BUCKETS_SEGUNDOS, METRICAS, Metricas
+
+# Classes de prioridade: menor valor sai primeiro da fila
+PRIORIDADES = {"interativa": 0, "normal": 1, "lote": 2}
+
+# Custo usado quando o modelo não define max_tokens
+MAX_TOKENS_PADRAO = 1000
+
+
+class BaldeTokens:
+    """
+    Balde de tokens com reposição contínua de `limite_por_minuto`.
+
+    A capacidade equivale a `rajada_s` segundos de reposição: os provedores
+    aplicam os limites por minuto em janelas curtas, então uma rajada de um
+    minuto inteiro de pedidos também recebe 429.
+    """
+
+    def __init__(self, limite_por_minuto: float, rajada_s: float = 1.0):
+        self.taxa = limite_por_minuto / 60
+        self.capacidade = self.taxa * rajada_s
+        self.disponivel = self.capacidade
+        self._atualizado = time.monotonic()
+
+    def _repor(self, agora: float) -> None:
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def espera(self, custo: float, agora: float) -> float:
+        """Segundos até `custo` caber no balde (custos maiores que a capacidade esperam o balde cheio)."""
+        self._repor(agora)
+        falta = min(custo, self.capacidade) - self.disponivel
+        return falta / self.taxa if falta > 0 else 0.0
+
+    def consumir(self, custo: float) -> None:
+        # Pode ficar negativo (custo maior que a capacidade ou correção pelo uso real)
+        self.disponivel -= custo
+
+    def devolver(self, quantidade: float) -> None:
+        self.disponivel = min(self.capacidade, self.disponivel + quantidade)
+
+
+class _Pedido:
+    """Pedido na fila do escalonador."""
+
+    __slots__ = ("prioridade", "ordem", "custo", "liberar", "cancelado", "concedido", "chegada")
+
+    def __init__(self, prioridade: int, ordem: int, custo: int, liberar: Callable[[], None]):
+        self.prioridade = prioridade
+        self.ordem = ordem
+        self.custo = custo
+        self.liberar = liberar
+        self.cancelado = False
+        self.concedido = False
+        self.chegada = time.monotonic()
+
+    def __lt__(self, outro: "_Pedido") -> bool:
+        return (self.prioridade, self.ordem) < (outro.prioridade, outro.ordem)
+
+
+def _limitado(erro: BaseException) -> bool:
+    """429 do provedor (openai.RateLimitError ou equivalente)."""
+    return getattr(erro, "status_code", None) == 429
+
+
+def _transitorio(erro: BaseException) -> bool:
+    """Falhas que o SDK da OpenAI também repetiria: 408, 409, 5xx e erros de conexão."""
+    status = getattr(erro, "status_code", None)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    return isinstance(erro, (ConnectionError, TimeoutError)) or type(erro).__name__ in (
+        "APIConnectionError", "APITimeoutError",
+    )
+
+
+def _retry_after(erro: BaseException) -> Optional[float]:
+    resposta = getattr(erro, "response", None)
+    try:
+        return float(resposta.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _tokens_usados(resultado) -> Optional[int]:
+    """Tokens de entrada + saída de um ChatResult, se o provedor informou."""
+    uso = (getattr(resultado, "llm_output", None) or {}).get("token_usage") or {}
+    if uso.get("total_tokens"):
+        return uso["total_tokens"]
+    for geracao in getattr(resultado, "generations", []):
+        metadados = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+        if metadados:
+            return metadados.get("total_tokens")
+    return None
+
+
+class EscalonadorTaxa:
+    """
+    Fila com prioridades na frente das chamadas ao modelo.
+
+    - rpm / tpm: limites da conta (None = sem limite)
+    - concorrencia_inicial / minima / maxima: faixa da concorrência adaptativa
+    - latencia_alvo_s: respostas mais lentas que isso também reduzem a concorrência
+    - fator_reducao: multiplicador da concorrência em cada redução (AIMD)
+    - vagas_reservadas: vagas que só chamadas interativas podem ocupar
+      (sempre sobra ao menos uma para as demais)
+    - max_tentativas: tentativas por chamada em 429 e falhas transitórias
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        concorrencia_inicial: int = 8,
+        concorrencia_minima: int = 1,
+        concorrencia_maxima: int = 64,
+        latencia_alvo_s: Optional[float] = None,
+        fator_reducao: float = 0.5,
+        vagas_reservadas: int = 1,
+        rajada_s: float = 1.0,
+        max_tentativas: int = 6,
+        metricas: Metricas = METRICAS,
+    ):
+        self.rpm = BaldeTokens(rpm, rajada_s) if rpm else None
+        self.tpm = BaldeTokens(tpm, rajada_s) if tpm else None
+        self.limite = float(concorrencia_inicial)
+        self.concorrencia_minima = concorrencia_minima
+        self.concorrencia_maxima = concorrencia_maxima
+        self.latencia_alvo_s = latencia_alvo_s
+        self.fator_reducao = fator_reducao
+        self.vagas_reservadas = vagas_reservadas
+        self.max_tentativas = max_tentativas
+        self.metricas = metricas
+
+        self._fila: list = []
+        self._ordem = itertools.count()
+        self._trava = threading.Lock()
+        self._em_andamento = 0
+        self._pausado_ate = 0.0
+        self._ultima_reducao = 0.0
+        self._despertar_em: Optional[float] = None
+        # Contadores do processo atual
+        self.chamadas = 0
+        self.respostas_429 = 0
+        self.reducoes = 0
+
+    # ------------------------------------------------------------------
+    # Fila e admissão (sempre com a trava)
+    # ------------------------------------------------------------------
+
+    def _espera_admissao(self, pedido: _Pedido, agora: float) -> Optional[float]:
+        """0 se o pedido pode sair agora, segundos até poder, ou None se depende de uma vaga."""
+        limite = int(self.limite)
+        vagas = limite - self._em_andamento
+        if pedido.prioridade > PRIORIDADES["interativa"]:
+            # A reserva nunca ocupa todas as vagas: com o limite reduzido a 1
+            # (AIMD), os lotes ainda saem, um por vez
+            vagas -= min(self.vagas_reservadas, limite - 1)
+        if vagas <= 0:
+            return None
+        espera = self._pausado_ate - agora
+        if self.rpm:
+            espera = max(espera, self.rpm.espera(1, agora))
+        if self.tpm:
+            espera = max(espera, self.tpm.espera(pedido.custo, agora))
+        return max(espera, 0.0)
+
+    def _despachar(self) -> None:
+        agora = time.monotonic()
+        while self._fila:
+            pedido = self._fila[0]
+            if pedido.cancelado:
+                heapq.heappop(self._fila)
+                continue
+            espera = self._espera_admissao(pedido, agora)
+            if espera is None:
+                return  # a próxima vaga liberada chama _despachar de novo
+            if espera > 0:
+                self._agendar(agora + espera)
+                return
+            heapq.heappop(self._fila)
+            if self.rpm:
+                self.rpm.consumir(1)
+            if self.tpm:
+                self.tpm.consumir(pedido.custo)
+            self._em_andamento += 1
+            pedido.concedido = True
+            self.metricas.observar(
+                "llm_escalonador_espera_segundos", agora - pedido.chegada, BUCKETS_SEGUNDOS,
+                prioridade=_nome_prioridade(pedido.prioridade),
+            )
+            pedido.liberar()
+
+    def _agendar(self, momento: float) -> None:
+        """Acorda a fila quando os baldes (ou a pausa do Retry-After) permitirem."""
+        if self._despertar_em is not None and self._despertar_em <= momento:
+            return
+        self._despertar_em = momento
+        temporizador = threading.Timer(momento - time.monotonic(), self._acordar, args=(momento,))
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _acordar(self, momento: float) -> None:
+        with self._trava:
+            if self._despertar_em == momento:
+                self._despertar_em = None
+            self._despachar()
+
+    def _enfileirar(self, custo: int, prioridade: str, liberar: Callable[[], None]) -> _Pedido:
+        pedido = _Pedido(PRIORIDADES[prioridade], next(self._ordem), custo, liberar)
+        with self._trava:
+            self.chamadas += 1
+            heapq.heappush(self._fila, pedido)
+            self._despachar()
+        return pedido
+
+    def _concluir(
+        self,
+        pedido: _Pedido,
+        latencia: Optional[float] = None,
+        tokens: Optional[int] = None,
+        limitado: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Libera a vaga, corrige o TPM pelo uso real e ajusta a concorrência (AIMD)."""
+        agora = time.monotonic()
+        with self._trava:
+            self._em_andamento -= 1
+            if self.tpm and tokens is not None:
+                self.tpm.devolver(pedido.custo - tokens)
+            lento = self.latencia_alvo_s is not None and latencia is not None and latencia > self.latencia_alvo_s
+            if limitado or lento:
+                if limitado:
+                    self.respostas_429 += 1
+                    self._pausado_ate = max(self._pausado_ate, agora + (retry_after or 1.0))
+                # Uma redução por janela: uma rajada de 429 não zera a concorrência
+                if agora - self._ultima_reducao >= max(self.latencia_alvo_s or 0.0, 1.0):
+                    self._ultima_reducao = agora
+                    self.reducoes += 1
+                    self.limite = max(float(self.concorrencia_minima), self.limite * self.fator_reducao)
+                    self.metricas.incrementar("llm_escalonador_reducoes_total", motivo="429" if limitado else "latencia")
+            elif latencia is not None:
+                # +1 vaga a cada `limite` respostas rápidas (aproximadamente uma por janela)
+                self.limite = min(float(self.concorrencia_maxima), self.limite + 1 / self.limite)
+            self._despachar()
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def _aguardar(self, custo: int, prioridade: str) -> _Pedido:
+        evento = threading.Event()
+        pedido = self._enfileirar(custo, prioridade, evento.set)
+        evento.wait()
+        return pedido
+
+    async def _aaguardar(self, custo: int, prioridade: str) -> _Pedido:
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+
+        def resolver() -> None:
+            if not futuro.done():
+                futuro.set_result(None)
+
+        pedido = self._enfileirar(custo, prioridade, lambda: loop.call_soon_threadsafe(resolver))
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            with self._trava:
+                pedido.cancelado = True
+                concedido = pedido.concedido
+            if concedido:
+                self._concluir(pedido)
+            raise
+        return pedido
+
+    def _tratar_erro(self, pedido: _Pedido, erro: BaseException, tentativa: int) -> bool:
+        """Conclui o pedido que falhou; retorna True se a chamada deve ser repetida."""
+        limitado = _limitado(erro)
+        # Falhas não contam como respostas rápidas: só o 429 ajusta a concorrência
+        self._concluir(pedido, limitado=limitado, retry_after=_retry_after(erro))
+        repetir = (limitado or _transitorio(erro)) and tentativa < self.max_tentativas - 1
+        if repetir:
+            self.metricas.incrementar("llm_retentativas_total", runnable="escalonador")
+        return repetir
+
+    def executar(self, funcao: Callable[[], Any], custo: int, prioridade: str = "normal") -> Any:
+        """Executa `funcao()` quando houver vaga e limite disponível, repetindo em 429."""
+        for tentativa in range(self.max_tentativas):
+            pedido = self._aguardar(custo, prioridade)
+            inicio = time.monotonic()
+            try:
+                resultado = funcao()
+            except Exception as erro:
+                if self._tratar_erro(pedido, erro, tentativa):
+                    continue
+                raise
+            except BaseException:
+                self._concluir(pedido)
+                raise
+            self._concluir(pedido, time.monotonic() - inicio, _tokens_usados(resultado))
+            return resultado
+
+    async def aexecutar(self, funcao: Callable[[], Awaitable[Any]], custo: int, prioridade: str = "normal") -> Any:
+        """Versão assíncrona de executar(); compartilha fila e limites com as chamadas síncronas."""
+        for tentativa in range(self.max_tentativas):
+            pedido = await self._aaguardar(custo, prioridade)
+            inicio = time.monotonic()
+            try:
+                resultado = await funcao()
+            except Exception as erro:
+                if self._tratar_erro(pedido, erro, tentativa):
+                    continue
+                raise
+            except BaseException:
+                self._concluir(pedido)
+                raise
+            self._concluir(pedido, time.monotonic() - inicio, _tokens_usados(resultado))
+            return resultado
+
+    def estatisticas(self) -> dict:
+        with self._trava:
+            return {
+                "chamadas": self.chamadas,
+                "em_andamento": self._em_andamento,
+                "na_fila": sum(1 for pedido in self._fila if not pedido.cancelado),
+                "limite_concorrencia": round(self.limite, 2),
+                "respostas_429": self.respostas_429,
+                "reducoes": self.reducoes,
+            }
+
+
+def _nome_prioridade(valor: int) -> str:
+    return next(nome for nome, prioridade in PRIORIDADES.items() if prioridade == valor)
+
+
+@lru_cache(maxsize=None)
+def _contador(model_name: str):
+    from historico_resumido import contador_tokens
+
+    return contador_tokens(model_name)
+
+
+class EscalonamentoMixin:
+    """
+    Mixin para modelos de chat do LangChain: cada chamada de
+    _generate/_agenerate passa pelo escalonador da classe.
+    """
+
+    def _pedido_escalonado(self, messages, run_manager, kwargs: dict) -> Tuple[int, str]:
+        """(custo estimado em tokens, prioridade) da chamada."""
+        max_tokens = kwargs.get("max_tokens") or getattr(self, "max_tokens", None) or MAX_TOKENS_PADRAO
+        custo = _contador(getattr(self, "model_name", None) or "gpt-3.5-turbo")(messages) + max_tokens
+        prioridade = ((run_manager.metadata if run_manager else None) or {}).get("prioridade", "normal")
+        return custo, prioridade
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        custo, prioridade = self._pedido_escalonado(messages, run_manager, kwargs)
+        return self.escalonador().executar(
+            lambda: super(EscalonamentoMixin, self)._generate(messages, stop, run_manager, **kwargs),
+            custo, prioridade,
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        custo, prioridade = self._pedido_escalonado(messages, run_manager, kwargs)
+        return await self.escalonador().aexecutar(
+            lambda: super(EscalonamentoMixin, self)._agenerate(messages, stop, run_manager, **kwargs),
+            custo, prioridade,
+        )
+
+
+@lru_cache(maxsize=None)
+def classe_escalonada(classe: type, escalonador: EscalonadorTaxa) -> type:
+    """
+    Subclasse de `classe` (ex.: ChatOpenAI) cujas chamadas passam por
+    `escalonador`. Mantém o nome da original, como classe_agrupada.
+    """
+    return type(
+        classe.__name__,
+        (EscalonamentoMixin, classe),
+        {"__doc__": classe.__doc__, "escalonador": staticmethod(lambda: escalonador)},
+    )
+
+
+_escalonador_global: Optional[EscalonadorTaxa] = None
+_trava_global = threading.Lock()
+
+
+def obter_escalonador() -> Optional[EscalonadorTaxa]:
+    """
+    Retorna o escalonador compartilhado do processo, criado a partir das
+    variáveis de ambiente (ou None se nenhum limite foi configurado).
+    """
+    global _escalonador_global
+    rpm, tpm = os.getenv("LLM_LIMITE_RPM"), os.getenv("LLM_LIMITE_TPM")
+    if not rpm and not tpm:
+        return None
+    with _trava_global:
+        if _escalonador_global is None:
+            latencia_alvo = os.getenv("LLM_LATENCIA_ALVO_S")
+            _escalonador_global = EscalonadorTaxa(
+                rpm=float(rpm) if rpm else None,
+                tpm=float(tpm) if tpm else None,
+                concorrencia_inicial=int(os.getenv("LLM_CONCORRENCIA_INICIAL", 8)),
+                concorrencia_maxima=int(os.getenv("LLM_CONCORRENCIA_MAXIMA", 64)),
+                latencia_alvo_s=float(latencia_alvo) if latencia_alvo else None,
+            )
+    return _escalonador_global
+
+
+def main():
+    """Lote de planos da aula001 com turnos de chat simultâneos, com e sem escalonador, no servidor fake."""
+    parser = argparse.ArgumentParser(description="Escalonador com limites RPM/TPM e prioridades")
+    parser.add_argument("--pedidos", type=int, default=300, help="Planos de atividades no lote")
+    parser.add_argument("--turnos", type=int, default=20, help="Turnos de chat durante o lote")
+    parser.add_argument("--limite-rpm", type=float, default=600)
+    parser.add_argument("--limite-tpm", type=float, default=200_000)
+    parser.add_argument("--concorrencia", type=int, default=64, help="Concorrência do lote")
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import aula001
+    from fabrica_modelo import criar_modelo
+    from processamento_lote import percentil
+    from servidor_fake import ServidorFake
+
+    atividades = ["música", "esportes", "ciências", "artes", "culinária"]
+    planos = [
+        aula001.criar_prompt(i % 7 + 1, i % 4 + 1, atividades[i % len(atividades)]) for i in range(args.pedidos)
+    ]
+
+    for escalonar in (False, True):
+        with ServidorFake(latencia_s=0.2, limite_rpm=args.limite_rpm, limite_tpm=args.limite_tpm) as servidor:
+            escalonador = EscalonadorTaxa(rpm=args.limite_rpm, tpm=args.limite_tpm) if escalonar else None
+            # Sem escalonador: retentativas padrão do SDK (max_retries=2, com espera exponencial)
+            modelo = criar_modelo(
+                model_name="gpt-fake", openai_api_key="fake", base_url=servidor.url,
+                cache=False, agrupar=False, max_tokens=300, escalonador=escalonador or False,
+            )
+            lote = {"falhas": 0}
+
+            def plano(prompt):
+                try:
+                    modelo.invoke(prompt, config={"metadata": {"prioridade": "lote"}})
+                except Exception:
+                    lote["falhas"] += 1
+
+            latencias, falhas_chat = [], 0
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(args.concorrencia) as executor:
+                pendentes = [executor.submit(plano, prompt) for prompt in planos]
+                # Turnos de chat (aula006) chegam enquanto o lote está em andamento
+                time.sleep(0.5)
+                for turno in range(args.turnos):
+                    inicio_turno = time.perf_counter()
+                    try:
+                        modelo.invoke(
+                            f"Turno {turno}: sugira uma cidade com praias.",
+                            config={"metadata": {"prioridade": "interativa"}},
+                        )
+                        latencias.append(time.perf_counter() - inicio_turno)
+                    except Exception:
+                        falhas_chat += 1
+                    time.sleep(0.2)
+                for futuro in pendentes:
+                    futuro.result()
+            duracao = time.perf_counter() - inicio
+            latencias.sort()
+            print(
+                f"{'Com' if escalonar else 'Sem'} escalonador: lote de {args.pedidos} em {duracao:.1f}s "
+                f"({lote['falhas']} falhas) | chat p50 {percentil(latencias, 50):.2f}s "
+                f"p95 {percentil(latencias, 95):.2f}s ({falhas_chat} falhas) | "
+                f"{servidor.estatisticas['respostas_429']} respostas 429"
+            )
+            if escalonador:
+                print("  Escalonador:", escalonador.estatisticas())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Fábrica de Modelos de Chat
+==========================
+
+Ponto único de criação dos modelos usados pelas aulas. A função
+`criar_modelo` aceita os mesmos argumentos do ChatOpenAI e acrescenta a
+configuração compartilhada por todas as cadeias, sem alterar a definição
+de nenhuma delas.
+
+Conceitos abordados:
+- Centralização da construção do ChatOpenAI
+- Cache persistente de respostas (ver cache_respostas.py), desativado
+  automaticamente para temperatures acima de LLM_CACHE_TEMPERATURA_MAXIMA
+- Pool de conexões HTTP único por processo (ver pool_conexoes.py),
+  compartilhado por todos os modelos, nos caminhos síncrono e assíncrono
+- Agrupamento de chamadas idênticas em andamento (ver agrupamento_chamadas.py),
+  com a mesma regra de temperature do cache
+- Escalonador com limites RPM/TPM, concorrência adaptativa e prioridades
+  (ver escalonador_taxa.py), ativado quando os limites são configurados
+- Requisições redundantes contra lentidões na cauda (ver
+  requisicoes_redundantes.py), opcionais (LLM_REDUNDANCIA=1)
+- Importação tardia do langchain_openai (e do SDK da OpenAI): só acontece
+  quando um modelo real é criado, não ao importar a aula (ver cli.py)
+
+Uso:
+    from fabrica_modelo import criar_modelo
+
+    modelo = criar_modelo(
+        model_name="gpt-3.5-turbo",
+        openai_api_key=api_key,
+        temperature=0.7,
+        max_tokens=500
+    )
+"""
+
+from typing import TYPE_CHECKING
+
+from agrupamento_chamadas import agrupamento_para_temperatura, classe_agrupada
+from cache_respostas import cache_para_temperatura
+from escalonador_taxa import classe_escalonada, obter_escalonador
+from requisicoes_redundantes import classe_redundante, obter_redundancia
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+
+def criar_modelo(**kwargs) -> "ChatOpenAI":
+    """
+    Cria um ChatOpenAI com a configuração compartilhada das aulas.
+
+    Se `cache` não for informado, usa o cache persistente do processo
+    (ou nenhum cache, quando desativado ou para temperatures altas).
+    Se `http_client` não for informado, usa o pool de conexões do processo.
+    Se `agrupar` não for informado, agrupa chamadas idênticas em andamento
+    (exceto quando desativado ou para temperatures altas).
+    Se `escalonador` não for informado, usa o escalonador do processo, se
+    houver (False desativa); as retentativas passam a ser dele.
+    Se `redundancia` não for informada, usa a Redundancia do processo, se
+    ativada (False desativa).
+    """
+    from langchain_openai import ChatOpenAI
+    from pool_conexoes import obter_pool
+
+    if "cache" not in kwargs:
+        # False desativa explicitamente qualquer cache global do LangChain
+        kwargs["cache"] = cache_para_temperatura(kwargs.get("temperature", 0.7)) or False
+    pool = obter_pool() if "http_client" not in kwargs and "http_async_client" not in kwargs else None
+    if pool is not None:
+        kwargs["http_client"] = pool.cliente
+        kwargs["http_async_client"] = pool.cliente_assincrono
+        if "timeout" not in kwargs and "request_timeout" not in kwargs:
+            kwargs["request_timeout"] = pool.timeout
+    agrupar = kwargs.pop("agrupar", None)
+    if agrupar is None:
+        agrupar = agrupamento_para_temperatura(kwargs.get("temperature", 0.7))
+    escalonador = kwargs.pop("escalonador", None)
+    if escalonador is None:
+        escalonador = obter_escalonador()
+    redundancia = kwargs.pop("redundancia", None)
+    if redundancia is None:
+        redundancia = obter_redundancia()
+
+    # Agrupamento por fora: chamadas agrupadas ocupam uma única vaga do escalonador
+    # e compartilham a mesma cópia redundante; cada cópia passa pelo escalonador
+    classe = ChatOpenAI
+    if escalonador:
+        classe = classe_escalonada(classe, escalonador)
+        # Os 429 precisam chegar ao escalonador, que faz as retentativas
+        kwargs.setdefault("max_retries", 0)
+    if redundancia:
+        classe = classe_redundante(classe, redundancia)
+    if agrupar:
+        classe = classe_agrupada(classe)
+    return classe(**kwargs)
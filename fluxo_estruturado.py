@@ -0,0 +1,213 @@
+"""
+Streaming de Saída Estruturada com Antecipação da Próxima Cadeia
+================================================================
+
+O JsonOutputParser só entrega o dicionário final depois que a resposta
+inteira do modelo chega, e só então a cadeia seguinte pode começar. Este
+módulo consome a resposta em streaming, valida cada campo do modelo
+Pydantic assim que ele termina de chegar e inicia a próxima cadeia de
+forma especulativa, sem esperar o fim da geração.
+
+Conceitos abordados:
+- stream/astream de uma cadeia terminada em JsonOutputParser: dicionários
+  parciais a cada novo token
+- Campo completo: um campo está finalizado quando o modelo já começou a
+  escrever o campo seguinte (ou quando o streaming terminou)
+- Validação campo a campo com pydantic.TypeAdapter
+- Execução especulativa: a cadeia seguinte começa assim que os campos
+  de que ela depende estão completos; se a análise final mudar esses
+  campos, a execução especulativa é descartada e refeita. No ainvoke a
+  tarefa especulativa é cancelada (a requisição HTTP é interrompida); no
+  invoke, uma chamada especulativa que já começou não pode ser
+  interrompida: ela termina em segundo plano, com os tokens cobrados, e
+  o resultado é ignorado
+
+Exemplo (aula005):
+    cadeia_1 gera {"cidade": "Salvador", "motivo": "..."}
+                          ↑ ao terminar "cidade", restaurante e atividade
+                            cultural já são solicitados, enquanto o modelo
+                            ainda escreve o "motivo"
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Type
+
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+
+@dataclass
+class EstadoParcial:
+    """
+    Estado da saída estruturada durante o streaming.
+
+    - parcial: último dicionário parcial produzido pelo JsonOutputParser
+    - completos: campos já finalizados e validados pelo modelo Pydantic
+    - final: True quando o streaming terminou (completos == resposta inteira)
+    """
+    parcial: Dict[str, Any] = field(default_factory=dict)
+    completos: Dict[str, Any] = field(default_factory=dict)
+    final: bool = False
+
+
+@lru_cache(maxsize=None)
+def _validador(modelo: Type[BaseModel], campo: str) -> Optional[TypeAdapter]:
+    """TypeAdapter para a anotação de um campo do modelo (criado uma única vez)."""
+    info = modelo.model_fields.get(campo)
+    return TypeAdapter(info.annotation) if info is not None else None
+
+
+def _validar_campos(modelo: Type[BaseModel], parcial: Dict[str, Any], final: bool) -> Dict[str, Any]:
+    """Retorna os campos completos de `parcial` que passam na validação."""
+    chaves = list(parcial)
+    if not final:
+        # O último campo ainda pode estar sendo escrito pelo modelo
+        chaves = chaves[:-1]
+    completos = {}
+    for chave in chaves:
+        validador = _validador(modelo, chave)
+        if validador is None:
+            continue
+        try:
+            completos[chave] = validador.validate_python(parcial[chave])
+        except ValidationError:
+            continue
+    return completos
+
+
+def _estados(modelo: Type[BaseModel]):
+    """Converte dicionários parciais em EstadoParcial, emitindo só quando há novos campos."""
+    anterior: Dict[str, Any] = {}
+
+    def proximo(parcial: Any, final: bool) -> Optional[EstadoParcial]:
+        nonlocal anterior
+        if final:
+            # Validação completa do objeto: erros na resposta final (inclusive
+            # uma saída que não é um objeto JSON) são propagados como ValidationError
+            completos = modelo.model_validate(parcial).model_dump()
+            return EstadoParcial(parcial=parcial, completos=completos, final=True)
+        if not isinstance(parcial, dict):
+            return None
+        completos = _validar_campos(modelo, parcial, final=False)
+        if completos == anterior:
+            return None
+        anterior = completos
+        return EstadoParcial(parcial=parcial, completos=completos)
+
+    return proximo
+
+
+def fluxo_validado(
+    cadeia: Runnable, entrada: Any, modelo: Type[BaseModel], config: Optional[dict] = None
+) -> Iterator[EstadoParcial]:
+    """
+    Executa `cadeia` (terminada em JsonOutputParser) em streaming e produz um
+    EstadoParcial sempre que um novo campo fica completo e válido.
+    O último estado produzido tem final=True.
+    """
+    proximo = _estados(modelo)
+    ultimo = None
+    for parcial in cadeia.stream(entrada, config=config):
+        ultimo = parcial
+        estado = proximo(parcial, final=False)
+        if estado is not None:
+            yield estado
+    yield proximo({} if ultimo is None else ultimo, final=True)
+
+
+async def afluxo_validado(
+    cadeia: Runnable, entrada: Any, modelo: Type[BaseModel], config: Optional[dict] = None
+) -> AsyncIterator[EstadoParcial]:
+    """Versão assíncrona de `fluxo_validado`."""
+    proximo = _estados(modelo)
+    ultimo = None
+    async for parcial in cadeia.astream(entrada, config=config):
+        ultimo = parcial
+        estado = proximo(parcial, final=False)
+        if estado is not None:
+            yield estado
+    yield proximo({} if ultimo is None else ultimo, final=True)
+
+
+def encadear_com_antecipacao(
+    primeira: Runnable,
+    seguinte: Runnable,
+    modelo: Type[BaseModel],
+    campos: Sequence[str],
+    nome: str,
+) -> Runnable:
+    """
+    Encadeia `primeira` e `seguinte`, iniciando `seguinte` assim que os
+    `campos` da saída de `primeira` estiverem completos.
+
+    - primeira: cadeia terminada em JsonOutputParser(pydantic_object=modelo)
+    - seguinte: cadeia que recebe {campo: valor} para cada um dos `campos`
+      e retorna um dict (por exemplo, um RunnableParallel)
+    - nome: chave em que a saída de `primeira` é guardada no resultado
+
+    O resultado combina a entrada, a saída de `primeira` (em `nome`), os
+    `campos` no nível superior e o dict retornado por `seguinte`.
+    """
+    def entrada_seguinte(completos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if all(campo in completos for campo in campos):
+            return {campo: completos[campo] for campo in campos}
+        return None
+
+    def combinar(entrada, final: Dict[str, Any], saida_seguinte: Dict[str, Any]) -> Dict[str, Any]:
+        resultado = dict(entrada) if isinstance(entrada, dict) else {}
+        resultado[nome] = final
+        resultado.update({campo: final[campo] for campo in campos})
+        resultado.update(saida_seguinte)
+        return resultado
+
+    def executar(entrada, config=None):
+        especulada = None
+        futuro = None
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            for estado in fluxo_validado(primeira, entrada, modelo, config):
+                dados = entrada_seguinte(estado.completos)
+                if futuro is None and dados is not None:
+                    especulada = dados
+                    futuro = executor.submit(seguinte.invoke, dados, config)
+                if estado.final:
+                    final = estado.completos
+            dados_finais = entrada_seguinte(final)
+            if futuro is None or dados_finais != especulada:
+                # A especulação não aconteceu ou ficou inválida: descarta e refaz.
+                # cancel() só evita uma chamada que ainda não começou; uma já em
+                # andamento termina em segundo plano e o resultado é ignorado
+                if futuro is not None:
+                    futuro.cancel()
+                futuro = executor.submit(seguinte.invoke, dados_finais, config)
+            return combinar(entrada, final, futuro.result())
+        finally:
+            # Não espera uma chamada especulativa descartada que já esteja em andamento
+            # (ela não é interrompida: continua até o fim, sem bloquear a resposta)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def aexecutar(entrada, config=None):
+        especulada = None
+        tarefa = None
+        try:
+            async for estado in afluxo_validado(primeira, entrada, modelo, config):
+                dados = entrada_seguinte(estado.completos)
+                if tarefa is None and dados is not None:
+                    especulada = dados
+                    tarefa = asyncio.create_task(seguinte.ainvoke(dados, config))
+                if estado.final:
+                    final = estado.completos
+            dados_finais = entrada_seguinte(final)
+            if tarefa is None or dados_finais != especulada:
+                if tarefa is not None:
+                    tarefa.cancel()  # interrompe a requisição especulativa
+                tarefa = asyncio.create_task(seguinte.ainvoke(dados_finais, config))
+            return combinar(entrada, final, await tarefa)
+        finally:
+            if tarefa is not None and not tarefa.done():
+                tarefa.cancel()
+
+    return RunnableLambda(executar, afunc=aexecutar, name=f"antecipacao_{nome}")
@@ -0,0 +1,157 @@
+"""
+Streaming de Tokens com Tempo até o Primeiro Token
+==================================================
+
+As aulas 001, 002 e 003 chamam .invoke() e só imprimem a resposta quando
+os ~500 tokens chegaram: o usuário vê segundos de tela parada. Este módulo
+executa a mesma cadeia com .stream() / .astream() e escreve cada pedaço
+de texto na saída (stdout, arquivo, socket...) assim que ele chega. O
+StrOutputParser no fim da cadeia continua produzindo o texto: a resposta
+final é a concatenação dos pedaços, igual ao retorno do .invoke().
+
+Conceitos abordados:
+- stream() / astream(): o StrOutputParser repassa cada pedaço do modelo
+  como string, sem esperar o fim da resposta
+- Latência percebida x latência total: tempo até o primeiro token (TTFT)
+  medido à parte da duração da chamada
+- Tokens por segundo da geração, contados do primeiro ao último pedaço
+  (a API da OpenAI envia um token por pedaço)
+- Histogramas nas métricas do processo (instrumentacao.METRICAS):
+  `fluxo_ttft_segundos`, `fluxo_duracao_segundos` e
+  `fluxo_tokens_por_segundo`, rotulados pela cadeia
+
+Uso:
+    from fluxo_tokens import transmitir
+
+    resposta, medicao = transmitir(prompt | modelo | StrOutputParser(), {"interesse": "praias"}, sys.stdout, nome="aula003")
+    print(medicao.resumo())
+
+    python aula001.py --stream
+    python aula003.py --stream --assincrono --fake
+"""
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, TextIO, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
+
+from instrumentacao import METRICAS, Metricas
+
+# Buckets de tokens por segundo
+BUCKETS_TOKENS_POR_SEGUNDO = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+@dataclass
+class MedicaoFluxo:
+    """Tempos de uma chamada em streaming, em segundos desde o início da chamada."""
+
+    ttft_s: Optional[float] = None
+    duracao_s: float = 0.0
+    tokens: int = 0
+
+    @property
+    def tokens_por_segundo(self) -> float:
+        """Vazão da geração: tokens depois do primeiro, divididos pelo tempo após o primeiro."""
+        if self.ttft_s is None or self.tokens < 2 or self.duracao_s <= self.ttft_s:
+            return 0.0
+        return (self.tokens - 1) / (self.duracao_s - self.ttft_s)
+
+    def resumo(self) -> str:
+        ttft = f"{self.ttft_s * 1000:.0f}ms" if self.ttft_s is not None else "-"
+        return (
+            f"TTFT {ttft} | total {self.duracao_s * 1000:.0f}ms | "
+            f"{self.tokens} tokens | {self.tokens_por_segundo:.1f} tokens/s"
+        )
+
+
+class _Medidor:
+    """Acompanha os pedaços de uma chamada, escrevendo-os na saída."""
+
+    def __init__(self, saida: Optional[TextIO]):
+        self.saida = saida
+        self.pedacos = []
+        self.medicao = MedicaoFluxo()
+        self.inicio = time.perf_counter()
+
+    def receber(self, pedaco: str) -> None:
+        if not pedaco:
+            return
+        if self.medicao.ttft_s is None:
+            self.medicao.ttft_s = time.perf_counter() - self.inicio
+        self.medicao.tokens += 1
+        self.pedacos.append(pedaco)
+        if self.saida is not None:
+            self.saida.write(pedaco)
+            self.saida.flush()
+
+    def concluir(self, nome: str, metricas: Metricas) -> Tuple[str, MedicaoFluxo]:
+        medicao = self.medicao
+        medicao.duracao_s = time.perf_counter() - self.inicio
+        metricas.observar("fluxo_duracao_segundos", medicao.duracao_s, cadeia=nome)
+        if medicao.ttft_s is not None:
+            metricas.observar("fluxo_ttft_segundos", medicao.ttft_s, cadeia=nome)
+        if medicao.tokens_por_segundo:
+            metricas.observar(
+                "fluxo_tokens_por_segundo", medicao.tokens_por_segundo, BUCKETS_TOKENS_POR_SEGUNDO, cadeia=nome
+            )
+        return "".join(self.pedacos), medicao
+
+
+def com_texto(cadeia: Runnable) -> Runnable:
+    """
+    Garante que a cadeia termina em texto: o modelo sozinho (aulas 001 e
+    002) emite AIMessageChunk; com o StrOutputParser, cada pedaço vira str.
+    """
+    if isinstance(cadeia, StrOutputParser) or isinstance(getattr(cadeia, "last", None), StrOutputParser):
+        return cadeia
+    return cadeia | StrOutputParser()
+
+
+def transmitir(
+    cadeia: Runnable,
+    entrada: Any,
+    saida: Optional[TextIO] = None,
+    config: Optional[dict] = None,
+    nome: str = "cadeia",
+    metricas: Metricas = METRICAS,
+) -> Tuple[str, MedicaoFluxo]:
+    """
+    Executa `cadeia` com .stream(), escrevendo cada pedaço em `saida`
+    (sys.stdout, arquivo...; None só mede). Retorna (resposta completa, medição).
+    """
+    cadeia = com_texto(cadeia)
+    medidor = _Medidor(saida)
+    for pedaco in cadeia.stream(entrada, config):
+        medidor.receber(pedaco)
+    return medidor.concluir(nome, metricas)
+
+
+async def atransmitir(
+    cadeia: Runnable,
+    entrada: Any,
+    saida: Optional[TextIO] = None,
+    config: Optional[dict] = None,
+    nome: str = "cadeia",
+    metricas: Metricas = METRICAS,
+) -> Tuple[str, MedicaoFluxo]:
+    """Versão assíncrona de transmitir(), com .astream()."""
+    cadeia = com_texto(cadeia)
+    medidor = _Medidor(saida)
+    async for pedaco in cadeia.astream(entrada, config):
+        medidor.receber(pedaco)
+    return medidor.concluir(nome, metricas)
+
+
+def exibir_fluxo(cadeia: Runnable, entrada: Any, nome: str, assincrono: bool = False) -> str:
+    """Modo --stream das aulas: escreve a resposta no stdout conforme chega e exibe a medição."""
+    if assincrono:
+        resposta, medicao = asyncio.run(atransmitir(cadeia, entrada, sys.stdout, nome=nome))
+    else:
+        resposta, medicao = transmitir(cadeia, entrada, sys.stdout, nome=nome)
+    print()
+    print(f"[{nome}] {medicao.resumo()}")
+    return resposta
@@ -0,0 +1,259 @@
+"""
+Histórico de Sessões Compacto em Memória
+========================================
+
+O InMemoryChatMessageHistory guarda, por turno e por sessão, um objeto de
+mensagem completo do LangChain: além do texto, o id, o response_metadata,
+o usage_metadata e os dicionários de kwargs adicionais. Com 100 mil
+sessões ativas em um processo, esses objetos dominam a memória.
+
+Este módulo guarda cada sessão em um registro compacto e só cria as
+mensagens do LangChain quando o histórico é lido, isto é, quando o
+RunnableWithMessageHistory preenche o placeholder {historico} do prompt.
+As mensagens criadas servem àquele turno e são descartadas em seguida.
+
+Conceitos abordados:
+- __slots__: o registro de cada sessão não tem __dict__
+- Papéis em array('B'): um byte por mensagem ("human", "ai", "system")
+  em vez de um objeto de mensagem com o tipo em string
+- Textos como str simples; só o papel e o conteúdo são mantidos (id e
+  metadados da resposta são descartados)
+- Turnos frios comprimidos: a cada BLOCO_FRIO mensagens além das
+  `quentes` mais recentes, os textos mais antigos são comprimidos com
+  zlib em um bloco
+- Mensagens com conteúdo que não é texto (ex.: chamadas de ferramentas)
+  são guardadas como objetos, sem perda
+
+Custo: a memória cai, mas cada leitura recria as mensagens (e descomprime
+os blocos frios). Renderizar o prompt fica de 3 a 7 vezes mais lento que
+com o InMemoryChatMessageHistory (~188µs x 61µs com 12 mensagens;
+~445µs x 62µs com 40), o que compensa quando a memória, e não a CPU,
+limita o número de sessões por processo.
+
+Uso:
+    from historico_compacto import ArmazenamentoCompacto
+
+    armazenamento = ArmazenamentoCompacto()
+    cadeia = criar_cadeia_com_memoria(modelo, armazenamento.obter)
+
+    python aula006.py --compacto
+    python historico_compacto.py --sessoes 5000 --turnos 20   # memória e renderização
+"""
+
+import argparse
+import pickle
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, List, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# Código de cada papel (índice) -> classe da mensagem
+PAPEIS = (HumanMessage, AIMessage, SystemMessage)
+_CODIGOS = {classe: codigo for codigo, classe in enumerate(PAPEIS)}
+# Mensagem guardada como objeto (conteúdo que não é texto, campos extras)
+_OBJETO = 255
+# Mensagens por bloco comprimido
+BLOCO_FRIO = 16
+
+
+class _Sessao:
+    """Registro de uma sessão: papéis, textos recentes e blocos comprimidos."""
+
+    __slots__ = ("papeis", "textos", "frios")
+
+    def __init__(self):
+        self.papeis = array("B")
+        self.textos: List = []   # str (ou a mensagem, para _OBJETO) das mensagens não comprimidas
+        self.frios: List[bytes] = []  # BLOCO_FRIO textos por bloco, em pickle + zlib
+
+
+def _codigo(mensagem: BaseMessage) -> int:
+    """Papel da mensagem, ou _OBJETO se ela tem algo além do texto."""
+    codigo = _CODIGOS.get(type(mensagem))
+    simples = (
+        codigo is not None
+        and isinstance(mensagem.content, str)
+        and not mensagem.additional_kwargs
+        and not getattr(mensagem, "tool_calls", None)
+        and not mensagem.name
+    )
+    return codigo if simples else _OBJETO
+
+
+class HistoricoCompacto(BaseChatMessageHistory):
+    """
+    Vista de uma sessão do ArmazenamentoCompacto. Criada a cada acesso e
+    sem estado próprio: as mensagens são montadas a cada leitura.
+    """
+
+    def __init__(self, armazenamento: "ArmazenamentoCompacto", sessao: _Sessao):
+        self._armazenamento = armazenamento
+        self._sessao = sessao
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self._armazenamento.materializar(self._sessao)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._armazenamento.acrescentar(self._sessao, messages)
+
+    def clear(self) -> None:
+        self._armazenamento.limpar(self._sessao)
+
+
+class ArmazenamentoCompacto:
+    """
+    Sessões em memória em formato compacto.
+
+    - quentes: mensagens mais recentes mantidas sem compressão
+      (None desativa a compressão)
+    """
+
+    def __init__(self, quentes: int = 8):
+        self.quentes = quentes
+        self._sessoes: Dict[str, _Sessao] = {}
+        self._trava = threading.Lock()
+
+    def obter(self, sessao_id: str) -> HistoricoCompacto:
+        """Histórico da sessão (criada no primeiro acesso), para o RunnableWithMessageHistory."""
+        with self._trava:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                sessao = self._sessoes[sys.intern(sessao_id)] = _Sessao()
+        return HistoricoCompacto(self, sessao)
+
+    @property
+    def total_sessoes(self) -> int:
+        return len(self._sessoes)
+
+    @property
+    def total_blocos_frios(self) -> int:
+        with self._trava:
+            return sum(len(sessao.frios) for sessao in self._sessoes.values())
+
+    def acrescentar(self, sessao: _Sessao, mensagens: Sequence[BaseMessage]) -> None:
+        with self._trava:
+            for mensagem in mensagens:
+                codigo = _codigo(mensagem)
+                sessao.papeis.append(codigo)
+                sessao.textos.append(mensagem.content if codigo != _OBJETO else mensagem)
+            if self.quentes is not None:
+                while len(sessao.textos) >= self.quentes + BLOCO_FRIO:
+                    bloco = sessao.textos[:BLOCO_FRIO]
+                    del sessao.textos[:BLOCO_FRIO]
+                    sessao.frios.append(zlib.compress(pickle.dumps(bloco, pickle.HIGHEST_PROTOCOL)))
+
+    def materializar(self, sessao: _Sessao) -> List[BaseMessage]:
+        """Mensagens do LangChain da sessão, criadas agora."""
+        with self._trava:
+            frios = list(sessao.frios)
+            textos = list(sessao.textos)
+            papeis = sessao.papeis.tolist()
+        for bloco in reversed(frios):
+            textos[:0] = pickle.loads(zlib.decompress(bloco))
+        return [
+            texto if codigo == _OBJETO else PAPEIS[codigo](content=texto)
+            for codigo, texto in zip(papeis, textos)
+        ]
+
+    def limpar(self, sessao: _Sessao) -> None:
+        with self._trava:
+            sessao.papeis = array("B")
+            sessao.textos = []
+            sessao.frios = []
+
+    def remover(self, sessao_id: str) -> None:
+        """Descarta uma sessão encerrada."""
+        with self._trava:
+            self._sessoes.pop(sessao_id, None)
+
+
+# ----------------------------------------------------------------------
+# Comparação com o InMemoryChatMessageHistory
+# ----------------------------------------------------------------------
+
+def _conversa(indice: int, turnos: int) -> List[BaseMessage]:
+    """Turnos como os da aula006, com os metadados que o ChatOpenAI devolve."""
+    mensagens: List[BaseMessage] = []
+    for turno in range(turnos):
+        mensagens.append(HumanMessage(content=f"Pergunta {turno} da sessão {indice}: quais cidades com praias?"))
+        mensagens.append(AIMessage(
+            content=f"Sugestão {turno} para a sessão {indice}: Florianópolis, pelas praias e pela culinária local. " * 3,
+            id=f"run-{indice:08d}-{turno:04d}",
+            response_metadata={"model_name": "gpt-3.5-turbo-0125", "finish_reason": "stop",
+                               "token_usage": {"prompt_tokens": 120, "completion_tokens": 60, "total_tokens": 180}},
+            usage_metadata={"input_tokens": 120, "output_tokens": 60, "total_tokens": 180},
+        ))
+    return mensagens
+
+
+def main():
+    """Memória por sessão e tempo de renderização: InMemoryChatMessageHistory x compacto."""
+    parser = argparse.ArgumentParser(description="Histórico compacto x InMemoryChatMessageHistory")
+    parser.add_argument("--sessoes", type=int, default=5_000)
+    # 20 turnos = 40 mensagens: com quentes=4, dois blocos de BLOCO_FRIO por sessão
+    parser.add_argument("--turnos", type=int, default=20, help="Pares pergunta/resposta por sessão")
+    parser.add_argument("--renderizacoes", type=int, default=2_000, help="Prompts renderizados na medição")
+    args = parser.parse_args()
+
+    import gc
+    import tracemalloc
+
+    from langchain_core.chat_history import InMemoryChatMessageHistory
+    from langchain_core.prompts import ChatPromptTemplate
+
+    # Mesmo formato do prompt da aula006
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", "Você recomenda cidades."), ("placeholder", "{historico}"), ("human", "{query}")]
+    )
+
+    def medir(nome: str, obter, armazenamento: ArmazenamentoCompacto = None) -> None:
+        gc.collect()
+        tracemalloc.start()
+        for indice in range(args.sessoes):
+            # Um turno por vez, como no RunnableWithMessageHistory; as mensagens
+            # de entrada só sobrevivem se o histórico guardar os objetos
+            mensagens = _conversa(indice, args.turnos)
+            historico = obter(f"sessao-{indice}")
+            for posicao in range(0, len(mensagens), 2):
+                historico.add_messages(mensagens[posicao:posicao + 2])
+            del mensagens, historico
+        gc.collect()
+        memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        inicio = time.perf_counter()
+        for indice in range(args.renderizacoes):
+            prompt.format_messages(historico=obter(f"sessao-{indice % args.sessoes}").messages, query="E no inverno?")
+        renderizacao = (time.perf_counter() - inicio) / args.renderizacoes
+        frios = f" | {armazenamento.total_blocos_frios / args.sessoes:.1f} blocos frios/sessão" if armazenamento else ""
+        print(
+            f"{nome:<30} {memoria / args.sessoes:>7.0f} bytes/sessão | {memoria / 2**20:>6.1f} MiB | "
+            f"renderização {renderizacao * 1e6:>5.0f} µs{frios}"
+        )
+
+    print(f"{args.sessoes} sessões x {2 * args.turnos} mensagens")
+    padrao: Dict[str, InMemoryChatMessageHistory] = {}
+
+    def obter_padrao(sessao_id: str) -> InMemoryChatMessageHistory:
+        if sessao_id not in padrao:
+            padrao[sessao_id] = InMemoryChatMessageHistory()
+        return padrao[sessao_id]
+
+    medir("InMemoryChatMessageHistory", obter_padrao)
+    padrao.clear()
+    sem_compressao = ArmazenamentoCompacto(quentes=None)
+    medir("compacto (sem compressão)", sem_compressao.obter, sem_compressao)
+    comprimido = ArmazenamentoCompacto(quentes=4)
+    medir("compacto (frios comprimidos)", comprimido.obter, comprimido)
+    if not comprimido.total_blocos_frios:
+        print(f"Nenhum bloco comprimido: use --turnos >= {(4 + BLOCO_FRIO) // 2}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Histórico de Conversação com Orçamento de Tokens e Resumo Incremental
+=====================================================================
+
+O InMemoryChatMessageHistory cresce sem limite: a cada turno o prompt leva
+a conversa inteira, e tokens, latência e custo crescem linearmente. Este
+módulo mantém o histórico dentro de um orçamento de tokens: os turnos mais
+recentes ficam literais e os mais antigos são incorporados a um resumo
+que é atualizado de forma incremental.
+
+Conceitos abordados:
+- BaseChatMessageHistory: Interface de histórico usada pelo
+  RunnableWithMessageHistory
+- Contagem de tokens com o tokenizador do modelo (tiktoken), com
+  estimativa aproximada quando o tokenizador não está disponível
+- Resumo incremental: resumo anterior + mensagens novas -> novo resumo
+- Resumo fora do caminho da requisição: gerado em uma thread de fundo,
+  sem atrasar o turno do usuário
+
+Estrutura das mensagens enviadas ao prompt ({historico}):
+    [SystemMessage com o resumo]  +  [mensagens aguardando resumo]  +  [turnos recentes]
+
+Enquanto um resumo está sendo gerado, as mensagens que ele vai cobrir
+continuam no prompt (as mais antigas são descartadas se o orçamento
+for excedido), então nenhum turno deixa de ser considerado. Um clear()
+durante o resumo descarta o resultado dele; resumos que falham são
+registrados no log e contados em `historico_resumo_erros_total`.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.output_parsers import StrOutputParser
+
+from instrumentacao import METRICAS
+
+logger = logging.getLogger(__name__)
+
+# Threads compartilhadas por todas as sessões para gerar resumos
+_executor_resumos = ThreadPoolExecutor(max_workers=4, thread_name_prefix="resumo")
+
+PROMPT_RESUMO = ChatPromptTemplate.from_messages(
+    [
+        ("system", "Você resume conversas de forma concisa, preservando fatos, preferências e decisões do usuário."),
+        ("human", "Resumo atual da conversa:\n{resumo}\n\nNovas mensagens:\n{mensagens}\n\n"
+                  "Escreva o resumo atualizado em no máximo {max_palavras} palavras."),
+    ]
+)
+
+
+@lru_cache(maxsize=None)
+def contador_tokens(model_name: str = "gpt-3.5-turbo") -> Callable[[Sequence[BaseMessage]], int]:
+    """
+    Retorna uma função que conta os tokens de uma lista de mensagens.
+
+    Usa o tokenizador tiktoken do modelo; se ele não puder ser carregado
+    (modelo desconhecido ou sem acesso à rede para baixar o vocabulário),
+    usa a estimativa aproximada do LangChain.
+    """
+    try:
+        import tiktoken
+        codificador = tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return count_tokens_approximately
+
+    def contar(mensagens: Sequence[BaseMessage]) -> int:
+        # ~4 tokens de formatação por mensagem, como no formato de chat da OpenAI
+        return sum(len(codificador.encode(str(mensagem.content))) + 4 for mensagem in mensagens)
+
+    return contar
+
+
+class HistoricoResumido(BaseChatMessageHistory):
+    """
+    Histórico de mensagens limitado a `max_tokens`, com resumo incremental.
+
+    - modelo: modelo de chat usado para gerar os resumos
+    - max_tokens: orçamento de tokens das mensagens devolvidas ao prompt
+    - proporcao_recentes: fração do orçamento reservada aos turnos literais
+    - min_mensagens_recentes: mensagens que nunca são resumidas
+    - contar_tokens: função que conta tokens de uma lista de mensagens
+    """
+
+    def __init__(
+        self,
+        modelo,
+        max_tokens: int = 1000,
+        proporcao_recentes: float = 0.75,
+        min_mensagens_recentes: int = 2,
+        contar_tokens: Optional[Callable[[Sequence[BaseMessage]], int]] = None,
+    ):
+        self.cadeia_resumo = PROMPT_RESUMO | modelo | StrOutputParser()
+        self.max_tokens = max_tokens
+        self.max_tokens_recentes = int(max_tokens * proporcao_recentes)
+        self.min_mensagens_recentes = min_mensagens_recentes
+        self.contar_tokens = contar_tokens or contador_tokens(
+            getattr(modelo, "model_name", "gpt-3.5-turbo")
+        )
+
+        self.resumo = ""
+        self._recentes: List[BaseMessage] = []
+        self._tokens_recentes: List[int] = []
+        self._pendentes: List[BaseMessage] = []
+        self._resumo_em_andamento: Optional[Future] = None
+        # Incrementada pelo clear(): resumos iniciados antes dele são descartados
+        self._geracao = 0
+        self._trava = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Interface do BaseChatMessageHistory
+    # ------------------------------------------------------------------
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Mensagens para o placeholder {historico}, dentro do orçamento de tokens."""
+        with self._trava:
+            resumo = [SystemMessage(f"Resumo da conversa até aqui: {self.resumo}")] if self.resumo else []
+            recentes = list(self._recentes)
+            disponivel = self.max_tokens - sum(self._tokens_recentes) - (
+                self.contar_tokens(resumo) if resumo else 0
+            )
+            # Mensagens aguardando resumo entram enquanto couberem (das mais novas para as mais antigas)
+            pendentes: List[BaseMessage] = []
+            for mensagem in reversed(self._pendentes):
+                tokens = self.contar_tokens([mensagem])
+                if tokens > disponivel:
+                    break
+                pendentes.insert(0, mensagem)
+                disponivel -= tokens
+        return resumo + pendentes + recentes
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Adiciona mensagens e agenda o resumo das antigas se o orçamento for excedido."""
+        with self._trava:
+            for mensagem in messages:
+                self._recentes.append(mensagem)
+                self._tokens_recentes.append(self.contar_tokens([mensagem]))
+            # Move os turnos mais antigos para a fila de resumo
+            while (
+                sum(self._tokens_recentes) > self.max_tokens_recentes
+                and len(self._recentes) > self.min_mensagens_recentes
+            ):
+                self._pendentes.append(self._recentes.pop(0))
+                self._tokens_recentes.pop(0)
+            self._agendar_resumo()
+
+    def clear(self) -> None:
+        with self._trava:
+            self.resumo = ""
+            self._recentes.clear()
+            self._tokens_recentes.clear()
+            self._pendentes.clear()
+            self._geracao += 1
+            self._resumo_em_andamento = None
+
+    # ------------------------------------------------------------------
+    # Resumo em segundo plano
+    # ------------------------------------------------------------------
+
+    def _agendar_resumo(self) -> None:
+        """Inicia um resumo em segundo plano se houver mensagens pendentes (com a trava)."""
+        if not self._pendentes or self._resumo_em_andamento is not None:
+            return
+        lote = list(self._pendentes)
+        max_palavras = max(20, int((self.max_tokens - self.max_tokens_recentes) * 0.6))
+        self._resumo_em_andamento = _executor_resumos.submit(
+            self._resumir, self.resumo, lote, max_palavras, self._geracao
+        )
+
+    def _resumir(self, resumo_atual: str, lote: List[BaseMessage], max_palavras: int, geracao: int) -> None:
+        novo_resumo = None
+        try:
+            novo_resumo = self.cadeia_resumo.invoke(
+                {
+                    "resumo": resumo_atual or "(vazio)",
+                    "mensagens": get_buffer_string(lote),
+                    "max_palavras": max_palavras,
+                }
+            )
+        except Exception:
+            # Sem o registro a falha ficaria só no Future, que ninguém consulta
+            logger.exception("Falha ao resumir %d mensagens", len(lote))
+            METRICAS.incrementar("historico_resumo_erros_total")
+        with self._trava:
+            if geracao != self._geracao:
+                # O histórico foi limpo durante o resumo: o resultado é de outra conversa
+                return
+            self._resumo_em_andamento = None
+            if novo_resumo is not None:
+                self.resumo = novo_resumo.strip()
+                # Remove do início da fila apenas as mensagens cobertas por este resumo
+                del self._pendentes[: len(lote)]
+                # Mensagens que chegaram durante o resumo são agendadas agora
+                self._agendar_resumo()
+            # Em caso de falha as mensagens continuam pendentes para a próxima tentativa
+
+    def aguardar_resumo(self, timeout: Optional[float] = None) -> None:
+        """Aguarda a conclusão dos resumos em andamento (útil em testes e no encerramento)."""
+        while True:
+            with self._trava:
+                futuro = self._resumo_em_andamento
+            if futuro is None:
+                return
+            try:
+                futuro.result(timeout=timeout)
+            except Exception:
+                return
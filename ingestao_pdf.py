@@ -0,0 +1,262 @@
+"""
+Ingestão Paralela de PDFs no Índice Vetorial
+============================================
+
+Guias de viagem e cardápios costumam chegar em PDF, às centenas de
+páginas. Este módulo extrai o texto com o pypdf em um pool de processos,
+divide cada página em trechos e envia os trechos ao índice da
+recuperacao.py em lotes de tamanho fixo, à medida que ficam prontos: a
+memória usada não cresce com o tamanho do acervo.
+
+Conceitos abordados:
+- ProcessPoolExecutor: extração de texto (CPU) em paralelo, por faixas de
+  páginas, contornando o GIL
+- Fila limitada de tarefas pendentes: no máximo alguns blocos de páginas
+  em memória, esperando o embedding
+- Gerador de lotes consumido por `IndiceVetorial.adicionar_lotes`:
+  extração, embedding e gravação acontecem em fluxo contínuo
+- Hash SHA-256 do conteúdo: arquivos sem mudança são pulados; arquivos
+  alterados têm os trechos antigos removidos antes da nova ingestão
+- Relatório com páginas por segundo
+
+Os arquivos já ingeridos ficam registrados em `arquivos.sqlite`, dentro
+do diretório do índice.
+
+Uso:
+    python ingestao_pdf.py guias/ cardapios/ --indice dados/indice_cidades
+    python ingestao_pdf.py guia.pdf --processos 4 --paginas-por-tarefa 8 --lote 256
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from recuperacao import DIRETORIO_PADRAO, IndiceVetorial, dividir_texto
+
+
+# ----------------------------------------------------------------------
+# Tarefas executadas nos processos do pool
+# ----------------------------------------------------------------------
+
+def _inspecionar(caminho: str) -> Tuple[str, str, int]:
+    """(caminho, sha256 do conteúdo, número de páginas) de um PDF."""
+    from pypdf import PdfReader
+
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            sha.update(bloco)
+    return caminho, sha.hexdigest(), len(PdfReader(caminho).pages)
+
+
+def _extrair(caminho: str, inicio: int, fim: int, tamanho: int, sobreposicao: int) -> Tuple[List[str], List[dict]]:
+    """Textos e metadados dos trechos das páginas [inicio, fim) de um PDF."""
+    from pypdf import PdfReader
+
+    leitor = PdfReader(caminho)
+    textos: List[str] = []
+    metadados: List[dict] = []
+    for numero in range(inicio, fim):
+        texto = leitor.pages[numero].extract_text() or ""
+        for indice, trecho in enumerate(dividir_texto(texto, tamanho, sobreposicao)):
+            textos.append(trecho)
+            metadados.append({"fonte": caminho, "pagina": numero + 1, "trecho": indice})
+    return textos, metadados
+
+
+# ----------------------------------------------------------------------
+# Registro dos arquivos já ingeridos
+# ----------------------------------------------------------------------
+
+class RegistroArquivos:
+    """Hash, páginas e trechos de cada arquivo ingerido, em SQLite."""
+
+    def __init__(self, caminho: str):
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS arquivos ("
+            " caminho TEXT PRIMARY KEY, sha256 TEXT NOT NULL, paginas INTEGER NOT NULL,"
+            " trechos INTEGER NOT NULL, ingerido_em REAL NOT NULL)"
+        )
+
+    def hash(self, caminho: str) -> Optional[str]:
+        linha = self._conexao.execute("SELECT sha256 FROM arquivos WHERE caminho = ?", (caminho,)).fetchone()
+        return linha[0] if linha else None
+
+    def registrar(self, caminho: str, sha256: str, paginas: int, trechos: int) -> None:
+        with self._conexao:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, ?)",
+                (caminho, sha256, paginas, trechos, time.time()),
+            )
+
+    def fechar(self) -> None:
+        self._conexao.close()
+
+
+# ----------------------------------------------------------------------
+# Pipeline
+# ----------------------------------------------------------------------
+
+@dataclass
+class RelatorioIngestao:
+    arquivos: int = 0
+    pulados: int = 0
+    paginas: int = 0
+    trechos: int = 0
+    duracao_s: float = 0.0
+
+    @property
+    def paginas_por_s(self) -> float:
+        return self.paginas / self.duracao_s if self.duracao_s else 0.0
+
+    def resumo(self) -> str:
+        return (
+            f"{self.arquivos} arquivo(s) ingerido(s), {self.pulados} sem mudança | "
+            f"{self.paginas} páginas, {self.trechos} trechos em {self.duracao_s:.2f}s "
+            f"({self.paginas_por_s:.1f} páginas/s)"
+        )
+
+
+def listar_pdfs(caminhos: Sequence[str]) -> List[str]:
+    """PDFs informados diretamente ou encontrados (recursivamente) nos diretórios."""
+    encontrados = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            for raiz, _, nomes in os.walk(caminho):
+                encontrados.extend(os.path.join(raiz, nome) for nome in nomes if nome.lower().endswith(".pdf"))
+        else:
+            encontrados.append(caminho)
+    return sorted(encontrados)
+
+
+def ingerir_pdfs(
+    indice: IndiceVetorial,
+    caminhos: Sequence[str],
+    processos: Optional[int] = None,
+    paginas_por_tarefa: int = 8,
+    tamanho_lote: int = 256,
+    tamanho_trecho: int = 400,
+    sobreposicao: int = 50,
+) -> RelatorioIngestao:
+    """
+    Ingere os PDFs de `caminhos` (arquivos ou diretórios) no índice.
+
+    - processos: processos de extração (padrão: número de CPUs)
+    - paginas_por_tarefa: páginas extraídas por tarefa do pool
+    - tamanho_lote: trechos por chamada de embedding / gravação
+    """
+    processos = processos or os.cpu_count() or 1
+    registro = RegistroArquivos(os.path.join(indice.diretorio, "arquivos.sqlite"))
+    relatorio = RelatorioIngestao()
+    # Arquivos cujos trechos já foram todos entregues ao índice: (caminho, sha256, páginas, trechos)
+    concluidos: List[Tuple[str, str, int, int]] = []
+    inicio = time.perf_counter()
+
+    with ProcessPoolExecutor(processos) as executor:
+
+        def tarefas() -> Iterator[Tuple[str, str, int, int, int]]:
+            """(caminho, sha256, páginas, início, fim) de cada faixa de páginas a extrair."""
+            for caminho, sha256, paginas in executor.map(_inspecionar, listar_pdfs(caminhos)):
+                if registro.hash(caminho) == sha256:
+                    relatorio.pulados += 1
+                    continue
+                # Arquivo novo ou alterado: descarta trechos de uma versão anterior
+                indice.remover_fonte(caminho)
+                relatorio.arquivos += 1
+                if paginas == 0:
+                    concluidos.append((caminho, sha256, 0, 0))
+                for pagina in range(0, paginas, paginas_por_tarefa):
+                    yield caminho, sha256, paginas, pagina, min(pagina + paginas_por_tarefa, paginas)
+
+        def _concluir(aguardando: list, trechos_por_arquivo: Dict[str, int]) -> None:
+            for caminho, sha256, paginas in aguardando:
+                concluidos.append((caminho, sha256, paginas, trechos_por_arquivo.pop(caminho, 0)))
+            aguardando.clear()
+
+        def lotes() -> Iterator[Tuple[List[str], List[dict]]]:
+            # No máximo 2 tarefas por processo em andamento: a memória não depende do acervo
+            pendentes: deque = deque()
+            fila = tarefas()
+            trechos_por_arquivo: Dict[str, int] = {}
+            textos: List[str] = []
+            metadados: List[dict] = []
+            aguardando: List[Tuple[str, str, int]] = []
+
+            def completar_fila() -> None:
+                while len(pendentes) < 2 * processos:
+                    tarefa = next(fila, None)
+                    if tarefa is None:
+                        return
+                    caminho, _, _, pagina, fim = tarefa
+                    futuro = executor.submit(_extrair, caminho, pagina, fim, tamanho_trecho, sobreposicao)
+                    pendentes.append((tarefa, futuro))
+
+            completar_fila()
+            while pendentes:
+                (caminho, sha256, paginas, pagina, fim), futuro = pendentes.popleft()
+                novos_textos, novos_metadados = futuro.result()
+                completar_fila()
+                relatorio.paginas += fim - pagina
+                trechos_por_arquivo[caminho] = trechos_por_arquivo.get(caminho, 0) + len(novos_textos)
+                textos.extend(novos_textos)
+                metadados.extend(novos_metadados)
+                if fim == paginas:
+                    aguardando.append((caminho, sha256, paginas))
+                while len(textos) >= tamanho_lote:
+                    yield textos[:tamanho_lote], metadados[:tamanho_lote]
+                    del textos[:tamanho_lote], metadados[:tamanho_lote]
+                    relatorio.trechos += tamanho_lote
+                    # Ao retomar o gerador, o índice já gravou o lote anterior
+                    if not textos:
+                        _concluir(aguardando, trechos_por_arquivo)
+            if textos:
+                yield textos, metadados
+                relatorio.trechos += len(textos)
+            _concluir(aguardando, trechos_por_arquivo)
+
+        try:
+            indice.adicionar_lotes(lotes())
+        finally:
+            # Só os arquivos entregues por inteiro entram no registro; os demais
+            # serão reingeridos (e seus trechos parciais removidos) na próxima execução
+            for caminho, sha256, paginas, trechos in concluidos:
+                registro.registrar(caminho, sha256, paginas, trechos)
+            registro.fechar()
+
+    relatorio.duracao_s = time.perf_counter() - inicio
+    return relatorio
+
+
+def main():
+    """Ingere PDFs no índice vetorial e informa o desempenho."""
+    parser = argparse.ArgumentParser(description="Ingestão paralela de PDFs no índice vetorial")
+    parser.add_argument("caminhos", nargs="+", help="Arquivos PDF ou diretórios com PDFs")
+    parser.add_argument("--indice", default=DIRETORIO_PADRAO, help="Diretório do índice")
+    parser.add_argument("--processos", type=int, help="Processos de extração (padrão: número de CPUs)")
+    parser.add_argument("--paginas-por-tarefa", type=int, default=8)
+    parser.add_argument("--lote", type=int, default=256, help="Trechos por lote de embedding")
+    args = parser.parse_args()
+
+    indice = IndiceVetorial(args.indice)
+    try:
+        relatorio = ingerir_pdfs(
+            indice, args.caminhos,
+            processos=args.processos,
+            paginas_por_tarefa=args.paginas_por_tarefa,
+            tamanho_lote=args.lote,
+        )
+    finally:
+        indice.fechar()
+    print(relatorio.resumo())
+    print(f"Índice: {indice.total} trechos em {indice.quantidade_segmentos} segmento(s)")
+
+
+if __name__ == "__main__":
+    main()
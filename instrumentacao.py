@@ -0,0 +1,319 @@
+"""
+Instrumentação de Baixo Custo das Cadeias (Callbacks + Histogramas)
+===================================================================
+
+O set_debug(True) imprime cada payload completo no stdout, o que é caro
+demais para ficar ligado sob carga. Este módulo registra, por meio de um
+callback do LangChain, apenas tempos e contadores em histogramas mantidos
+no próprio processo, que podem ficar ativos em produção.
+
+Conceitos abordados:
+- BaseCallbackHandler: ganchos de início/fim de cada Runnable
+- Tempo por etapa: formatação do prompt, chamada ao modelo, tempo até o
+  primeiro token (TTFT) e análise da saída (parser)
+- Uso de tokens (entrada e saída), retentativas e erros
+- Histogramas com buckets fixos (mesmo formato do Prometheus)
+- Exportação sob demanda (pull): texto Prometheus ou JSON, opcionalmente
+  servida em HTTP no caminho /metrics
+
+Uso:
+    from instrumentacao import instrumentar, METRICAS
+
+    cadeia = instrumentar(prompt | modelo | parseador)
+    cadeia.invoke({...})
+    print(METRICAS.exportar_prometheus())
+
+    servidor = iniciar_servidor_metricas(9100)   # GET http://localhost:9100/metrics
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Buckets de duração (segundos) e de contagem de tokens
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_TOKENS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class Histograma:
+    """Histograma com buckets fixos: contagem, soma e contagem por bucket."""
+
+    __slots__ = ("limites", "contagens", "soma", "total", "_trava")
+
+    def __init__(self, limites: Sequence[float]):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+        self._trava = threading.Lock()
+
+    def observar(self, valor: float) -> None:
+        posicao = bisect.bisect_left(self.limites, valor)
+        with self._trava:
+            self.contagens[posicao] += 1
+            self.soma += valor
+            self.total += 1
+
+    def quantil(self, q: float) -> float:
+        """Estimativa do quantil q (0 a 1) pelo limite superior do bucket."""
+        alvo = q * self.total
+        acumulado = 0
+        for posicao, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo and contagem:
+                return self.limites[posicao] if posicao < len(self.limites) else float("inf")
+        return 0.0
+
+
+class Metricas:
+    """Registro de histogramas e contadores rotulados, exportável sob demanda."""
+
+    def __init__(self):
+        self._histogramas: Dict[Tuple[str, Tuple], Histograma] = {}
+        self._contadores: Dict[Tuple[str, Tuple], float] = {}
+        self._trava = threading.Lock()
+
+    def observar(self, nome: str, valor: float, limites=BUCKETS_SEGUNDOS, **rotulos) -> None:
+        chave = (nome, tuple(sorted(rotulos.items())))
+        histograma = self._histogramas.get(chave)
+        if histograma is None:
+            with self._trava:
+                histograma = self._histogramas.setdefault(chave, Histograma(limites))
+        histograma.observar(valor)
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos) -> None:
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._trava:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def limpar(self) -> None:
+        with self._trava:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    # ------------------------------------------------------------------
+    # Exportação
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _rotulos(rotulos: Tuple, extra: str = "") -> str:
+        partes = [f'{nome}="{valor}"' for nome, valor in rotulos]
+        if extra:
+            partes.append(extra)
+        return "{" + ",".join(partes) + "}" if partes else ""
+
+    def exportar_prometheus(self) -> str:
+        """Texto no formato de exposição do Prometheus."""
+        linhas: List[str] = []
+        with self._trava:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(self._histogramas.items(), key=lambda item: item[0])
+        tipos_emitidos = set()
+        for (nome, rotulos), valor in contadores:
+            if nome not in tipos_emitidos:
+                linhas.append(f"# TYPE {nome} counter")
+                tipos_emitidos.add(nome)
+            linhas.append(f"{nome}{self._rotulos(rotulos)} {valor}")
+        for (nome, rotulos), histograma in histogramas:
+            if nome not in tipos_emitidos:
+                linhas.append(f"# TYPE {nome} histogram")
+                tipos_emitidos.add(nome)
+            acumulado = 0
+            for limite, contagem in zip(list(histograma.limites) + ["+Inf"], histograma.contagens):
+                acumulado += contagem
+                rotulos_bucket = self._rotulos(rotulos, 'le="%s"' % limite)
+                linhas.append(f"{nome}_bucket{rotulos_bucket} {acumulado}")
+            linhas.append(f"{nome}_sum{self._rotulos(rotulos)} {histograma.soma}")
+            linhas.append(f"{nome}_count{self._rotulos(rotulos)} {histograma.total}")
+        return "\n".join(linhas) + "\n"
+
+    def exportar_json(self) -> dict:
+        """Resumo em dicionário: contadores e, por histograma, contagem, média, p50 e p99."""
+        with self._trava:
+            contadores = dict(self._contadores)
+            histogramas = dict(self._histogramas)
+        return {
+            "contadores": [
+                {"nome": nome, "rotulos": dict(rotulos), "valor": valor}
+                for (nome, rotulos), valor in sorted(contadores.items())
+            ],
+            "histogramas": [
+                {
+                    "nome": nome,
+                    "rotulos": dict(rotulos),
+                    "contagem": histograma.total,
+                    "media": histograma.soma / histograma.total if histograma.total else 0.0,
+                    "p50": histograma.quantil(0.5),
+                    "p99": histograma.quantil(0.99),
+                }
+                for (nome, rotulos), histograma in sorted(histogramas.items(), key=lambda item: item[0])
+            ],
+        }
+
+
+# Registro padrão do processo
+METRICAS = Metricas()
+
+
+def _etapa(nome: str) -> Optional[str]:
+    """Classifica um Runnable pelo nome: formatação do prompt ou análise da saída."""
+    if "Prompt" in nome:
+        return "formatacao_prompt"
+    if "Parser" in nome:
+        return "parse"
+    return None
+
+
+class InstrumentacaoCallback(BaseCallbackHandler):
+    """
+    Callback que alimenta um registro de Metricas.
+
+    Métricas produzidas:
+    - llm_etapa_duracao_segundos{etapa, runnable}: formatacao_prompt, parse,
+      chamada_modelo (e cadeia, para as demais composições)
+    - llm_ttft_segundos{runnable}: tempo até o primeiro token (streaming)
+    - llm_tokens_total{tipo, modelo}: tokens de entrada e de saída
+    - llm_erros_total{etapa, runnable}
+    - llm_retentativas_total{runnable}: aqui, só as de Runnables com
+      .with_retry(); as retentativas do ChatOpenAI acontecem dentro do SDK
+      da OpenAI e são contadas pelo pool de conexões
+      (runnable="sdk_openai", ver pool_conexoes.py) e pelo escalonador
+      (runnable="escalonador", ver escalonador_taxa.py)
+    """
+
+    # Executa no próprio fluxo da chamada (sem trocar de thread): custo mínimo
+    run_inline = True
+
+    def __init__(self, metricas: Metricas = METRICAS, medir_cadeias: bool = False):
+        self.metricas = metricas
+        self.medir_cadeias = medir_cadeias
+        # run_id -> (inicio, etapa, nome, primeiro_token_registrado)
+        self._execucoes: Dict[UUID, list] = {}
+
+    @staticmethod
+    def _nome(serialized: Optional[dict], kwargs: dict) -> str:
+        return kwargs.get("name") or (serialized or {}).get("name") or "desconhecido"
+
+    def _iniciar(self, run_id: UUID, etapa: str, nome: str) -> None:
+        self._execucoes[run_id] = [time.perf_counter(), etapa, nome, False]
+
+    def _finalizar(self, run_id: UUID) -> Optional[list]:
+        execucao = self._execucoes.pop(run_id, None)
+        if execucao is not None:
+            inicio, etapa, nome, _ = execucao
+            self.metricas.observar(
+                "llm_etapa_duracao_segundos", time.perf_counter() - inicio, etapa=etapa, runnable=nome
+            )
+        return execucao
+
+    def _falhar(self, run_id: UUID) -> None:
+        execucao = self._execucoes.pop(run_id, None)
+        if execucao is not None:
+            self.metricas.incrementar("llm_erros_total", etapa=execucao[1], runnable=execucao[2])
+
+    # Runnables (prompts, parsers e composições)
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs) -> None:
+        nome = self._nome(serialized, kwargs)
+        etapa = _etapa(nome) or ("cadeia" if self.medir_cadeias else None)
+        if etapa is not None:
+            self._iniciar(run_id, etapa, nome)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._finalizar(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._falhar(run_id)
+
+    # Modelo de chat
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._iniciar(run_id, "chamada_modelo", self._nome(serialized, kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._iniciar(run_id, "chamada_modelo", self._nome(serialized, kwargs))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs) -> None:
+        execucao = self._execucoes.get(run_id)
+        if execucao is not None and not execucao[3] and token:
+            execucao[3] = True
+            self.metricas.observar("llm_ttft_segundos", time.perf_counter() - execucao[0], runnable=execucao[2])
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        execucao = self._finalizar(run_id)
+        entrada, saida, modelo = _uso_tokens(response)
+        rotulo_modelo = modelo or (execucao[2] if execucao else "desconhecido")
+        if entrada:
+            self.metricas.incrementar("llm_tokens_total", entrada, tipo="entrada", modelo=rotulo_modelo)
+        if saida:
+            self.metricas.incrementar("llm_tokens_total", saida, tipo="saida", modelo=rotulo_modelo)
+            self.metricas.observar("llm_tokens_saida", saida, BUCKETS_TOKENS, modelo=rotulo_modelo)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._falhar(run_id)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs) -> None:
+        # O RunnableRetry só é rastreado com medir_cadeias=True; sem ele, o rótulo é genérico
+        execucao = self._execucoes.get(run_id)
+        self.metricas.incrementar("llm_retentativas_total", runnable=execucao[2] if execucao else "with_retry")
+
+
+def _uso_tokens(response) -> Tuple[int, int, Optional[str]]:
+    """Extrai (tokens de entrada, tokens de saída, modelo) de um LLMResult."""
+    saida_llm = response.llm_output or {}
+    uso = saida_llm.get("token_usage") or {}
+    entrada = uso.get("prompt_tokens", 0)
+    saida = uso.get("completion_tokens", 0)
+    modelo = saida_llm.get("model_name")
+    if not uso:
+        # Streaming: o uso vem no usage_metadata da mensagem final
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                mensagem = getattr(geracao, "message", None)
+                metadados = getattr(mensagem, "usage_metadata", None) or {}
+                entrada += metadados.get("input_tokens", 0)
+                saida += metadados.get("output_tokens", 0)
+                modelo = modelo or (getattr(mensagem, "response_metadata", None) or {}).get("model_name")
+    return entrada, saida, modelo
+
+
+def instrumentar(cadeia, metricas: Metricas = METRICAS, medir_cadeias: bool = False):
+    """Retorna a cadeia com o callback de instrumentação em todas as execuções."""
+    return cadeia.with_config(callbacks=[InstrumentacaoCallback(metricas, medir_cadeias)])
+
+
+def iniciar_servidor_metricas(porta: int = 9100, metricas: Metricas = METRICAS, host: str = "127.0.0.1"):
+    """
+    Serve as métricas em uma thread de fundo:
+    - GET /metrics       texto Prometheus
+    - GET /metrics.json  resumo em JSON
+    """
+    class Manipulador(BaseHTTPRequestHandler):
+        def log_message(self, formato, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                corpo = json.dumps(metricas.exportar_json(), ensure_ascii=False).encode("utf-8")
+                tipo = "application/json"
+            elif self.path.startswith("/metrics"):
+                corpo = metricas.exportar_prometheus().encode("utf-8")
+                tipo = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+    servidor = ThreadingHTTPServer((host, porta), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="servidor-metricas", daemon=True).start()
+    return servidor
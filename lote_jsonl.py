@@ -0,0 +1,272 @@
+"""
+Execução Retomável de Cadeias sobre Arquivos JSONL
+==================================================
+
+Para rodar as cadeias das aulas 004 e 005 sobre arquivos com milhões de
+linhas, um laço em Python que guarda tudo em memória e recomeça do zero
+a cada falha não serve. Este módulo lê o JSONL de entrada em fluxo,
+executa qualquer cadeia registrada na CLI (cli.CADEIAS) com concorrência
+limitada e grava cada resultado no JSONL de saída assim que fica pronto.
+
+Conceitos abordados:
+- Leitura em fluxo: só as linhas em andamento ficam em memória
+  (processamento_lote.afluxo_em_lote, em ordem de conclusão)
+- Checkpoint: "todas as linhas antes de N estão prontas" + as linhas
+  prontas depois de N + a posição (em bytes) da linha N na entrada, e o
+  tamanho dos arquivos de saída naquele momento. Ao retomar, a entrada é
+  lida a partir dessa posição e as saídas são truncadas nesse tamanho:
+  cada linha aparece uma única vez na saída, mesmo após uma queda
+- Gravação atômica do checkpoint (arquivo temporário + os.replace), após
+  flush e fsync das saídas
+- Fila de falhas (dead-letter): linhas com erro na cadeia ou JSON
+  inválido vão para `<saida>.falhas.jsonl`, com a entrada e o erro, e não
+  interrompem o lote
+
+Arquivos gerados:
+    saida.jsonl              {"linha": 12, "saida": {...}}
+    saida.falhas.jsonl       {"linha": 7, "entrada": {...}, "erro": "..."}
+    saida.checkpoint.json    progresso (removido ao final do lote)
+
+Uso:
+    python lote_jsonl.py aula004 entradas.jsonl saida.jsonl --fake --concorrencia 32
+    python cli.py lote aula005 entradas.jsonl saida.jsonl    # pela CLI unificada
+
+    # Após uma queda, o mesmo comando continua de onde parou
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Set, Tuple
+
+from processamento_lote import afluxo_em_lote
+
+
+@dataclass
+class RelatorioExecucao:
+    processadas: int = 0
+    falhas: int = 0
+    retomadas: int = 0
+    duracao_s: float = 0.0
+
+    def resumo(self) -> str:
+        vazao = self.processadas / self.duracao_s if self.duracao_s else 0.0
+        retomada = f", {self.retomadas} já concluídas antes" if self.retomadas else ""
+        return (
+            f"{self.processadas} linhas ({self.falhas} falhas{retomada}) em {self.duracao_s:.2f}s "
+            f"| {vazao:.1f} linhas/s"
+        )
+
+
+class Progresso:
+    """
+    Linhas concluídas, em forma compacta: todas antes de `concluidas_ate`
+    mais o conjunto das concluídas depois dela.
+    """
+
+    def __init__(self, concluidas_ate: int = 0, posicao: int = 0, concluidas=()):
+        self.concluidas_ate = concluidas_ate
+        self.posicao = posicao  # byte da entrada onde começa a linha `concluidas_ate`
+        self.concluidas: Set[int] = set(concluidas)
+        # Byte final das linhas já lidas e ainda acima de `concluidas_ate`
+        self._fins: Dict[int, int] = {}
+
+    def lida(self, linha: int, fim: int) -> None:
+        self._fins[linha] = fim
+
+    def concluir(self, linha: int) -> None:
+        self.concluidas.add(linha)
+        while self.concluidas_ate in self.concluidas:
+            self.concluidas.remove(self.concluidas_ate)
+            self.posicao = self._fins.pop(self.concluidas_ate, self.posicao)
+            self.concluidas_ate += 1
+
+    def pendente(self, linha: int) -> bool:
+        return linha >= self.concluidas_ate and linha not in self.concluidas
+
+
+class ExecutorJSONL:
+    """
+    Executa `cadeia` sobre cada linha de `entrada` e grava em `saida`.
+
+    - max_concorrencia: linhas em andamento ao mesmo tempo
+    - intervalo_checkpoint_s: tempo máximo entre dois checkpoints
+    - reiniciar: ignora um checkpoint existente e começa do zero
+    """
+
+    def __init__(
+        self,
+        cadeia,
+        entrada: str,
+        saida: str,
+        max_concorrencia: int = 16,
+        intervalo_checkpoint_s: float = 5.0,
+        reiniciar: bool = False,
+    ):
+        self.cadeia = cadeia
+        self.entrada = entrada
+        self.saida = saida
+        self.falhas = saida.removesuffix(".jsonl") + ".falhas.jsonl"
+        self.arquivo_checkpoint = saida.removesuffix(".jsonl") + ".checkpoint.json"
+        self.max_concorrencia = max_concorrencia
+        self.intervalo_checkpoint_s = intervalo_checkpoint_s
+        self.reiniciar = reiniciar
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+
+    def _carregar_checkpoint(self) -> Tuple[Progresso, int, int]:
+        """(progresso, tamanho da saída, tamanho das falhas) do último checkpoint."""
+        if self.reiniciar or not os.path.exists(self.arquivo_checkpoint):
+            return Progresso(), 0, 0
+        with open(self.arquivo_checkpoint, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        if dados["entrada"] != os.path.abspath(self.entrada):
+            raise ValueError(
+                f"O checkpoint {self.arquivo_checkpoint} é de outra entrada ({dados['entrada']}); "
+                "use --reiniciar para começar do zero"
+            )
+        progresso = Progresso(dados["concluidas_ate"], dados["posicao"], dados["concluidas"])
+        return progresso, dados["tamanho_saida"], dados["tamanho_falhas"]
+
+    def _gravar_checkpoint(self, progresso: Progresso, saida, falhas) -> None:
+        for arquivo in (saida, falhas):
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        dados = {
+            "entrada": os.path.abspath(self.entrada),
+            "concluidas_ate": progresso.concluidas_ate,
+            "posicao": progresso.posicao,
+            "concluidas": sorted(progresso.concluidas),
+            "tamanho_saida": saida.tell(),
+            "tamanho_falhas": falhas.tell(),
+        }
+        temporario = self.arquivo_checkpoint + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(dados, arquivo)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self.arquivo_checkpoint)
+
+    @staticmethod
+    def _abrir_saida(caminho: str, tamanho: int):
+        """Abre para acrescentar, descartando o que foi gravado depois do checkpoint."""
+        arquivo = open(caminho, "ab")
+        arquivo.truncate(tamanho)
+        arquivo.seek(tamanho)
+        return arquivo
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    async def executar(self) -> RelatorioExecucao:
+        progresso, tamanho_saida, tamanho_falhas = self._carregar_checkpoint()
+        relatorio = RelatorioExecucao(retomadas=progresso.concluidas_ate + len(progresso.concluidas))
+        saida = self._abrir_saida(self.saida, tamanho_saida)
+        falhas = self._abrir_saida(self.falhas, tamanho_falhas)
+        # Índice do afluxo_em_lote (ordem de leitura) -> número da linha na entrada
+        linhas: Dict[int, int] = {}
+        lidas = 0
+
+        def gravar(arquivo, registro: dict) -> None:
+            arquivo.write(json.dumps(registro, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+
+        def falhar(linha: int, entrada, erro: str) -> None:
+            gravar(falhas, {"linha": linha, "entrada": entrada, "erro": erro})
+            relatorio.falhas += 1
+            relatorio.processadas += 1
+            progresso.concluir(linha)
+
+        def ler() -> Iterator[dict]:
+            """Entradas pendentes, a partir da posição do checkpoint."""
+            nonlocal lidas
+            with open(self.entrada, "rb") as arquivo:
+                arquivo.seek(progresso.posicao)
+                linha = progresso.concluidas_ate
+                for texto in iter(arquivo.readline, b""):
+                    progresso.lida(linha, arquivo.tell())
+                    if progresso.pendente(linha):
+                        try:
+                            entrada = json.loads(texto) if texto.strip() else None
+                        except json.JSONDecodeError as erro:
+                            falhar(linha, texto.decode("utf-8", "replace").rstrip("\n"), f"JSON inválido: {erro}")
+                        else:
+                            if entrada is None:
+                                progresso.concluir(linha)  # linha em branco
+                            else:
+                                linhas[lidas] = linha
+                                lidas += 1
+                                yield entrada
+                    linha += 1
+
+        inicio = time.perf_counter()
+        ultimo_checkpoint = time.monotonic()
+        try:
+            async for resultado in afluxo_em_lote(self.cadeia, ler(), self.max_concorrencia):
+                linha = linhas.pop(resultado.indice)
+                if resultado.sucesso:
+                    gravar(saida, {"linha": linha, "saida": resultado.saida})
+                    relatorio.processadas += 1
+                    progresso.concluir(linha)
+                else:
+                    falhar(linha, resultado.entrada, f"{type(resultado.erro).__name__}: {resultado.erro}")
+                if time.monotonic() - ultimo_checkpoint >= self.intervalo_checkpoint_s:
+                    self._gravar_checkpoint(progresso, saida, falhas)
+                    ultimo_checkpoint = time.monotonic()
+        except BaseException:
+            # Interrompido (Ctrl+C, cancelamento): guarda o que já foi concluído
+            self._gravar_checkpoint(progresso, saida, falhas)
+            raise
+        else:
+            # Lote completo: o checkpoint não é mais necessário
+            for arquivo in (saida, falhas):
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            if os.path.exists(self.arquivo_checkpoint):
+                os.remove(self.arquivo_checkpoint)
+        finally:
+            saida.close()
+            falhas.close()
+        relatorio.duracao_s = time.perf_counter() - inicio
+        return relatorio
+
+
+def main():
+    """Executa uma cadeia registrada sobre um arquivo JSONL."""
+    from cli import CADEIAS, carregar_cadeia, criar_modelo_padrao
+
+    parser = argparse.ArgumentParser(description="Execução retomável de cadeias sobre JSONL")
+    parser.add_argument("cadeia", choices=list(CADEIAS), help="Cadeia registrada em cli.CADEIAS")
+    parser.add_argument("entrada", help="JSONL de entrada (um objeto por linha)")
+    parser.add_argument("saida", help="JSONL de saída")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--intervalo-checkpoint", type=float, default=5.0, help="Segundos entre checkpoints")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint e começa do zero")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    args = parser.parse_args()
+
+    executor = ExecutorJSONL(
+        carregar_cadeia(args.cadeia, criar_modelo_padrao(args.fake)),
+        args.entrada,
+        args.saida,
+        max_concorrencia=args.concorrencia,
+        intervalo_checkpoint_s=args.intervalo_checkpoint,
+        reiniciar=args.reiniciar,
+    )
+    try:
+        relatorio = asyncio.run(executor.executar())
+    except KeyboardInterrupt:
+        print(f"Interrompido; progresso salvo em {executor.arquivo_checkpoint}")
+        raise SystemExit(130)
+    print(relatorio.resumo())
+    if relatorio.falhas:
+        print(f"Falhas em {executor.falhas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Modelo de Chat Simulado (Fake) para Testes Locais
+=================================================
+
+Este módulo define um modelo de chat compatível com o LangChain que não
+acessa a rede. Ele permite executar e medir as cadeias das aulas sem uma
+chave da API da OpenAI, simulando latência, velocidade de geração e erros.
+
+Conceitos abordados:
+- BaseChatModel: Classe base para modelos de chat do LangChain
+- Geração síncrona e assíncrona (_generate / _agenerate)
+- Streaming token a token (_stream / _astream)
+- Metadados de uso de tokens (usage_metadata)
+- Chamada de ferramentas (bind_tools), usada por with_structured_output
+
+Respostas geradas:
+- Se o prompt contém instruções de formato do JsonOutputParser, a resposta
+  é um JSON com todos os campos do schema preenchidos
+- Com ferramentas associadas (bind_tools), a resposta é uma chamada da
+  primeira ferramenta, com os argumentos preenchidos a partir do schema
+- Caso contrário, a resposta é um texto simples com `tamanho_resposta` palavras
+
+Uso:
+    from modelo_fake import ModeloChatFake
+
+    modelo = ModeloChatFake(latencia_s=0.2, tokens_por_segundo=50)
+    cadeia = prompt_cidade | modelo | StrOutputParser()
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, Field, PrivateAttr
+
+
+# Cidades usadas para preencher o campo "cidade" nas respostas JSON
+CIDADES = [
+    "Florianópolis", "Salvador", "Recife", "Natal", "Fortaleza",
+    "Rio de Janeiro", "Ouro Preto", "Paraty", "Gramado", "Belém",
+]
+
+# Localiza o schema JSON dentro das instruções de formato do JsonOutputParser
+PADRAO_SCHEMA = re.compile(r"```\s*(\{.*\})\s*```", re.DOTALL)
+
+
+class ErroSimulado(RuntimeError):
+    """Erro lançado pelo modelo fake para simular falhas do provedor."""
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa simples de tokens (aproximadamente 4 caracteres por token)."""
+    return max(1, len(texto) // 4)
+
+
+def dividir_em_tokens(texto: str) -> List[str]:
+    """Divide o texto em "tokens" (palavras com o espaço seguinte), preservando o texto original."""
+    return re.findall(r"\S+\s*", texto)
+
+
+def resposta_padrao(prompt: str, tamanho_resposta: int = 40) -> str:
+    """
+    Gera uma resposta determinística para o prompt informado.
+
+    Se o prompt contém um schema JSON (instruções do JsonOutputParser),
+    retorna um objeto JSON com todos os campos do schema preenchidos.
+    """
+    semente = sum(prompt.encode("utf-8"))
+    correspondencia = PADRAO_SCHEMA.search(prompt)
+    if correspondencia:
+        try:
+            schema = json.loads(correspondencia.group(1))
+        except json.JSONDecodeError:
+            schema = {}
+        if schema.get("properties"):
+            return resposta_esquema(schema, prompt)
+
+    palavras = ["Sugestão", "simulada:"]
+    palavras += [f"palavra{(semente + i) % 97}" for i in range(tamanho_resposta)]
+    return " ".join(palavras)
+
+
+def resposta_esquema(schema: dict, prompt: str) -> str:
+    """
+    Objeto JSON com todos os campos de um JSON Schema preenchidos, como o
+    modelo devolve ao usar ferramentas (function calling) ou JSON Schema.
+    """
+    semente = sum(prompt.encode("utf-8"))
+    # Mantém a cidade já citada no prompt (ex.: etapas seguintes da aula005)
+    cidade = next((nome for nome in CIDADES if nome in prompt), CIDADES[semente % len(CIDADES)])
+    dados = {
+        campo: cidade if campo == "cidade" else f"Sugestão de {campo} em {cidade}"
+        for campo in schema.get("properties", {})
+    }
+    return json.dumps(dados, ensure_ascii=False)
+
+
+class ModeloChatFake(BaseChatModel):
+    """
+    Modelo de chat local que simula o comportamento do ChatOpenAI.
+
+    A latência de cada chamada é composta por:
+    - latencia_s (+ variação aleatória de até desvio_latencia_s) antes do
+      primeiro token
+    - um intervalo de 1 / tokens_por_segundo entre tokens (quando > 0)
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model_name: str = Field(default="fake-gpt", alias="model")
+    temperature: float = 0.7
+    max_tokens: Optional[int] = 500
+    latencia_s: float = 0.05
+    desvio_latencia_s: float = 0.0
+    tokens_por_segundo: float = 0.0
+    taxa_erro: float = 0.0
+    tamanho_resposta: int = 40
+    semente: Optional[int] = None
+    responder: Optional[Callable[[str], str]] = None
+
+    _aleatorio: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._aleatorio = random.Random(self.semente)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    # ------------------------------------------------------------------
+    # Funções auxiliares
+    # ------------------------------------------------------------------
+
+    def _atraso_inicial(self) -> float:
+        """Sorteia a latência até o primeiro token."""
+        variacao = self._aleatorio.uniform(0, self.desvio_latencia_s)
+        return max(0.0, self.latencia_s + variacao)
+
+    def _intervalo_token(self) -> float:
+        return 1.0 / self.tokens_por_segundo if self.tokens_por_segundo > 0 else 0.0
+
+    def _verificar_erro(self) -> None:
+        if self.taxa_erro and self._aleatorio.random() < self.taxa_erro:
+            raise ErroSimulado("Falha simulada do provedor do modelo")
+
+    def _montar_resposta(self, messages: List[BaseMessage], tools: Optional[List[dict]] = None) -> tuple:
+        """Retorna (texto_prompt, tokens_resposta) para as mensagens recebidas."""
+        prompt = "\n".join(str(mensagem.content) for mensagem in messages)
+        if tools:
+            # Chamada de ferramenta: os argumentos seguem o schema da primeira ferramenta
+            texto = resposta_esquema(tools[0]["function"]["parameters"], prompt)
+            # As definições das ferramentas também contam como tokens de entrada
+            prompt += "\n" + json.dumps(tools, ensure_ascii=False)
+        else:
+            gerar = self.responder or (
+                lambda texto: resposta_padrao(texto, self.tamanho_resposta)
+            )
+            texto = gerar(prompt)
+        tokens = dividir_em_tokens(texto)
+        if self.max_tokens:
+            tokens = tokens[: self.max_tokens]
+        return prompt, tokens
+
+    def _uso(self, prompt: str, tokens: List[str]) -> dict:
+        entrada = estimar_tokens(prompt)
+        return {
+            "input_tokens": entrada,
+            "output_tokens": len(tokens),
+            "total_tokens": entrada + len(tokens),
+        }
+
+    def _pedaco_ferramenta(self, prompt: str, tokens: List[str], tools: List[dict]) -> ChatGenerationChunk:
+        """Chamada de ferramenta completa em um único pedaço do streaming."""
+        return ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{
+                    "name": tools[0]["function"]["name"],
+                    "args": "".join(tokens),
+                    "id": f"call_{self._aleatorio.getrandbits(48):012x}",
+                    "index": 0,
+                }],
+                usage_metadata=self._uso(prompt, tokens),
+            )
+        )
+
+    def _resultado(self, prompt: str, tokens: List[str], tools: Optional[List[dict]] = None) -> ChatResult:
+        uso = self._uso(prompt, tokens)
+        if tools:
+            mensagem = AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": tools[0]["function"]["name"],
+                    "args": json.loads("".join(tokens)),
+                    "id": f"call_{self._aleatorio.getrandbits(48):012x}",
+                    "type": "tool_call",
+                }],
+                usage_metadata=uso,
+                response_metadata={"model_name": self.model_name, "finish_reason": "tool_calls"},
+            )
+        else:
+            mensagem = AIMessage(
+                content="".join(tokens),
+                usage_metadata=uso,
+                response_metadata={"model_name": self.model_name, "finish_reason": "stop"},
+            )
+        return ChatResult(
+            generations=[ChatGeneration(message=mensagem)],
+            llm_output={
+                "model_name": self.model_name,
+                "token_usage": {
+                    "prompt_tokens": uso["input_tokens"],
+                    "completion_tokens": uso["output_tokens"],
+                    "total_tokens": uso["total_tokens"],
+                },
+            },
+        )
+
+    # ------------------------------------------------------------------
+    # Interface do BaseChatModel
+    # ------------------------------------------------------------------
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any):
+        """Associa ferramentas ao modelo; a resposta passa a ser uma chamada da primeira delas."""
+        return self.bind(tools=[convert_to_openai_tool(ferramenta) for ferramenta in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._atraso_inicial())
+        self._verificar_erro()
+        tools = kwargs.get("tools")
+        prompt, tokens = self._montar_resposta(messages, tools)
+        time.sleep(self._intervalo_token() * len(tokens))
+        return self._resultado(prompt, tokens, tools)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._atraso_inicial())
+        self._verificar_erro()
+        tools = kwargs.get("tools")
+        prompt, tokens = self._montar_resposta(messages, tools)
+        await asyncio.sleep(self._intervalo_token() * len(tokens))
+        return self._resultado(prompt, tokens, tools)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._atraso_inicial())
+        self._verificar_erro()
+        tools = kwargs.get("tools")
+        prompt, tokens = self._montar_resposta(messages, tools)
+        if tools:
+            yield self._pedaco_ferramenta(prompt, tokens, tools)
+            return
+        intervalo = self._intervalo_token()
+        for posicao, token in enumerate(tokens):
+            if posicao:
+                time.sleep(intervalo)
+            pedaco = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=pedaco)
+            yield pedaco
+        # Último pedaço carrega o uso de tokens, como faz o ChatOpenAI
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._uso(prompt, tokens))
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._atraso_inicial())
+        self._verificar_erro()
+        tools = kwargs.get("tools")
+        prompt, tokens = self._montar_resposta(messages, tools)
+        if tools:
+            yield self._pedaco_ferramenta(prompt, tokens, tools)
+            return
+        intervalo = self._intervalo_token()
+        for posicao, token in enumerate(tokens):
+            if posicao:
+                await asyncio.sleep(intervalo)
+            pedaco = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=pedaco)
+            yield pedaco
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._uso(prompt, tokens))
+        )
@@ -0,0 +1,108 @@
+"""
+Pipeline de Cadeias com Dependências (DAG)
+==========================================
+
+Este módulo monta um pipeline LCEL a partir de etapas que declaram quais
+campos consomem e quais campos produzem. Etapas independentes entre si são
+executadas em paralelo assim que os campos de que precisam estão disponíveis.
+
+Conceitos abordados:
+- Grafo de dependências (DAG) entre cadeias
+- Ordenação em camadas: cada camada só depende das anteriores
+- RunnablePassthrough.assign: executa várias cadeias em paralelo e mescla
+  os resultados no dicionário de estado
+- Resultado combinado em um único dicionário
+
+Exemplo (aula005):
+    destino:      interesse -> {cidade, motivo}
+    restaurante:  cidade    -> {cidade, restaurante}   \\  executadas em
+    cultural:     cidade    -> string                  /   paralelo
+
+    Camada 1: [destino]  ->  Camada 2: [restaurante, cultural]
+    Três chamadas ao modelo, mas apenas duas em sequência.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
+
+
+@dataclass
+class Etapa:
+    """
+    Uma etapa do pipeline.
+
+    - nome: chave em que a saída da etapa é guardada no resultado combinado
+    - cadeia: Runnable executado pela etapa
+    - consome: campos do estado passados como entrada para a cadeia
+    - produz: campos da saída (dict) copiados para o nível superior do estado,
+      ficando disponíveis para as etapas seguintes
+    """
+    nome: str
+    cadeia: Runnable
+    consome: Sequence[str]
+    produz: Sequence[str] = field(default_factory=list)
+
+
+def ordenar_em_camadas(etapas: Sequence[Etapa], entradas: Sequence[str]) -> List[List[Etapa]]:
+    """
+    Agrupa as etapas em camadas executáveis em paralelo.
+
+    Uma etapa entra na primeira camada em que todos os campos consumidos já
+    foram fornecidos pelas entradas ou por etapas de camadas anteriores.
+    """
+    disponiveis = set(entradas)
+    pendentes = list(etapas)
+    camadas: List[List[Etapa]] = []
+
+    while pendentes:
+        camada = [etapa for etapa in pendentes if set(etapa.consome) <= disponiveis]
+        if not camada:
+            faltando = {
+                etapa.nome: sorted(set(etapa.consome) - disponiveis) for etapa in pendentes
+            }
+            raise ValueError(f"Dependências não satisfeitas no pipeline: {faltando}")
+        camadas.append(camada)
+        for etapa in camada:
+            disponiveis.add(etapa.nome)
+            disponiveis.update(etapa.produz)
+        pendentes = [etapa for etapa in pendentes if etapa not in camada]
+
+    return camadas
+
+
+def _selecionar(campos: Sequence[str]):
+    """Cria uma função que extrai do estado apenas os campos consumidos."""
+    return RunnableLambda(lambda estado: {campo: estado[campo] for campo in campos})
+
+
+def _expandir(camada: Sequence[Etapa]):
+    """Copia os campos produzidos por cada etapa para o nível superior do estado."""
+    def expandir(estado: Dict[str, Any]) -> Dict[str, Any]:
+        novo_estado = dict(estado)
+        for etapa in camada:
+            saida = estado[etapa.nome]
+            for campo in etapa.produz:
+                novo_estado[campo] = saida[campo]
+        return novo_estado
+    return RunnableLambda(expandir)
+
+
+def montar_pipeline(etapas: Sequence[Etapa], entradas: Sequence[str]) -> Runnable:
+    """
+    Monta o pipeline LCEL para as etapas informadas.
+
+    O Runnable retornado recebe um dict com os campos `entradas` e devolve o
+    estado combinado: entradas + saída de cada etapa (pelo nome) + campos
+    produzidos. Suporta invoke, ainvoke, batch e abatch.
+    """
+    pipeline: Runnable = RunnablePassthrough()
+    for camada in ordenar_em_camadas(etapas, entradas):
+        # assign() executa todas as etapas da camada em paralelo
+        pipeline = pipeline | RunnablePassthrough.assign(
+            **{etapa.nome: _selecionar(etapa.consome) | etapa.cadeia for etapa in camada}
+        )
+        if any(etapa.produz for etapa in camada):
+            pipeline = pipeline | _expandir(camada)
+    return pipeline
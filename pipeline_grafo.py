@@ -0,0 +1,225 @@
+"""
+Pipeline de Cadeias como Grafo do LangGraph, com Checkpoints
+============================================================
+
+O pipeline_dag.py executa as etapas em paralelo, mas sem memória: se a
+etapa "cultural" da aula005 falha, uma nova tentativa paga de novo pelas
+etapas "destino" e "restaurante". Este módulo monta as mesmas etapas
+(pipeline_dag.Etapa) como um StateGraph do LangGraph com um checkpointer:
+o estado é gravado a cada passo, e as saídas das etapas concluídas ficam
+registradas mesmo quando uma etapa paralela falha. Ao retomar a execução
+(mesmo thread_id), só a etapa que falhou é executada de novo.
+
+Conceitos abordados:
+- StateGraph: cada etapa é um nó; as arestas saem das etapas que produzem
+  os campos consumidos (sem dependências, a aresta sai de START)
+- Nós sem dependência entre si executam no mesmo passo, em paralelo
+  (threads no invoke, tarefas asyncio no ainvoke)
+- Checkpointer: InMemorySaver (padrão) ou SqliteSaver em arquivo, que
+  sobrevive ao fim do processo (pacote langgraph-checkpoint-sqlite)
+- Retomada: invoke(None, config) continua do último checkpoint do thread
+- RetryPolicy opcional por nó (`tentativas`)
+- Tempo de cada nó no estado ("tempos") e no histograma
+  `grafo_etapa_segundos{etapa}` das métricas
+
+O resultado tem o mesmo formato do pipeline_dag (entradas + saída de cada
+etapa pelo nome + campos produzidos), mais os tempos por etapa. Os nós se
+chamam `etapa_<nome>`, porque o LangGraph não aceita nós com o nome de um
+campo do estado.
+
+Uso:
+    from pipeline_grafo import criar_checkpointer, invocar_retomavel, montar_grafo
+
+    grafo = montar_grafo(etapas, entradas=["interesse"], checkpointer=criar_checkpointer())
+    config = {"configurable": {"thread_id": "pedido-42"}}
+    invocar_retomavel(grafo, {"interesse": "praias"}, config)  # falhou?
+    invocar_retomavel(grafo, {"interesse": "praias"}, config)  # refaz só a etapa que falhou
+
+    python aula005.py --fake --grafo --checkpoint dados/grafo.sqlite --thread pedido-42
+    python pipeline_grafo.py   # demonstração: falha na etapa cultural e retomada
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Annotated, Any, Dict, Optional, Sequence, TypedDict
+
+from langchain_core.runnables import RunnableLambda
+
+from instrumentacao import METRICAS, Metricas
+from pipeline_dag import Etapa, ordenar_em_camadas
+
+
+def _juntar(atual: Optional[dict], novo: Optional[dict]) -> dict:
+    """Redutor do campo "tempos": nós paralelos acrescentam as suas chaves."""
+    return {**(atual or {}), **(novo or {})}
+
+
+def _no(nome: str) -> str:
+    return f"etapa_{nome}"
+
+
+def _criar_no(etapa: Etapa, metricas: Metricas) -> RunnableLambda:
+    """Nó do grafo: executa a cadeia da etapa com os campos consumidos e mede o tempo."""
+
+    def atualizacao(saida: Any, inicio: float) -> Dict[str, Any]:
+        duracao = time.perf_counter() - inicio
+        metricas.observar("grafo_etapa_segundos", duracao, etapa=etapa.nome)
+        metricas.incrementar("grafo_etapa_execucoes_total", etapa=etapa.nome)
+        return {etapa.nome: saida, **{campo: saida[campo] for campo in etapa.produz}, "tempos": {etapa.nome: duracao}}
+
+    def executar(estado: dict, config) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        saida = etapa.cadeia.invoke({campo: estado[campo] for campo in etapa.consome}, config)
+        return atualizacao(saida, inicio)
+
+    async def aexecutar(estado: dict, config) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        saida = await etapa.cadeia.ainvoke({campo: estado[campo] for campo in etapa.consome}, config)
+        return atualizacao(saida, inicio)
+
+    return RunnableLambda(executar, afunc=aexecutar, name=_no(etapa.nome))
+
+
+def montar_grafo(
+    etapas: Sequence[Etapa],
+    entradas: Sequence[str],
+    checkpointer=None,
+    tentativas: int = 1,
+    metricas: Metricas = METRICAS,
+):
+    """
+    Compila o grafo do LangGraph para as etapas informadas.
+
+    - checkpointer: InMemorySaver, SqliteSaver... (ver criar_checkpointer);
+      sem checkpointer o grafo não guarda estado e não pode ser retomado
+    - tentativas: execuções de cada nó antes de a falha interromper o grafo
+    """
+    from langgraph.graph import END, START, StateGraph
+    from langgraph.types import RetryPolicy
+
+    # Valida as dependências (mesmas regras do pipeline_dag)
+    ordenar_em_camadas(etapas, entradas)
+
+    campos = dict.fromkeys(entradas, Any)
+    for etapa in etapas:
+        campos[etapa.nome] = Any
+        campos.update(dict.fromkeys(etapa.produz, Any))
+    campos["tempos"] = Annotated[dict, _juntar]
+    Estado = TypedDict("Estado", campos, total=False)
+
+    grafo = StateGraph(Estado)
+    politica = RetryPolicy(max_attempts=tentativas) if tentativas > 1 else None
+    for etapa in etapas:
+        grafo.add_node(_no(etapa.nome), _criar_no(etapa, metricas), retry=politica)
+
+    # Quem fornece cada campo: START (entradas) ou a etapa que o produz
+    fornecedores = dict.fromkeys(entradas, START)
+    for etapa in etapas:
+        fornecedores[etapa.nome] = _no(etapa.nome)
+        fornecedores.update(dict.fromkeys(etapa.produz, _no(etapa.nome)))
+    consumidas = set()
+    for etapa in etapas:
+        origens = sorted({fornecedores[campo] for campo in etapa.consome}) or [START]
+        consumidas.update(origens)
+        # Com várias origens, o nó espera todas terminarem
+        grafo.add_edge(origens[0] if len(origens) == 1 else origens, _no(etapa.nome))
+    for etapa in etapas:
+        if _no(etapa.nome) not in consumidas:
+            grafo.add_edge(_no(etapa.nome), END)
+
+    return grafo.compile(checkpointer=checkpointer)
+
+
+def criar_checkpointer(caminho: Optional[str] = None):
+    """
+    Checkpointer do grafo: em memória (padrão) ou em um arquivo SQLite.
+
+    O SqliteSaver atende apenas a invoke/stream (síncronos); para ainvoke
+    com SQLite use o AsyncSqliteSaver do mesmo pacote.
+    """
+    if caminho is None:
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return InMemorySaver()
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as erro:
+        raise ImportError(
+            "Checkpoints em SQLite precisam do pacote langgraph-checkpoint-sqlite "
+            "(pip install -r requirements.txt)"
+        ) from erro
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    # check_same_thread=False: os nós paralelos gravam a partir de outras threads
+    return SqliteSaver(sqlite3.connect(caminho, check_same_thread=False))
+
+
+def invocar_retomavel(grafo, entrada: dict, config: dict) -> dict:
+    """
+    Executa o grafo no thread de `config`; se a última execução desse
+    thread parou no meio (falha ou interrupção), retoma de onde parou.
+    """
+    if grafo.get_state(config).next:
+        return grafo.invoke(None, config)
+    return grafo.invoke(entrada, config)
+
+
+async def ainvocar_retomavel(grafo, entrada: dict, config: dict) -> dict:
+    """Versão assíncrona de invocar_retomavel()."""
+    if (await grafo.aget_state(config)).next:
+        return await grafo.ainvoke(None, config)
+    return await grafo.ainvoke(entrada, config)
+
+
+def main():
+    """Falha na etapa cultural da aula005 e retomada, contando as execuções de cada etapa."""
+    parser = argparse.ArgumentParser(description="Pipeline da aula005 como grafo com checkpoints")
+    parser.add_argument("--checkpoint", help="Arquivo SQLite dos checkpoints (padrão: em memória)")
+    args = parser.parse_args()
+
+    import aula005
+    from modelo_fake import ModeloChatFake
+
+    metricas = Metricas()
+    etapas = aula005.criar_etapas(ModeloChatFake(latencia_s=0.5, tokens_por_segundo=200))
+
+    # A etapa cultural falha na primeira execução (ex.: timeout do provedor)
+    falhas = {"restantes": 1}
+
+    def talvez_falhar(entrada):
+        if falhas["restantes"]:
+            falhas["restantes"] -= 1
+            raise TimeoutError("provedor não respondeu")
+        return entrada
+
+    etapas = [
+        Etapa(etapa.nome, RunnableLambda(talvez_falhar) | etapa.cadeia, etapa.consome, etapa.produz)
+        if etapa.nome == "cultural" else etapa
+        for etapa in etapas
+    ]
+    grafo = montar_grafo(etapas, ["interesse"], criar_checkpointer(args.checkpoint), metricas=metricas)
+    config = {"configurable": {"thread_id": "demonstracao"}}
+
+    for tentativa in (1, 2):
+        inicio = time.perf_counter()
+        try:
+            resultado = invocar_retomavel(grafo, {"interesse": "praias"}, config)
+        except Exception as erro:
+            pendentes = ", ".join(grafo.get_state(config).next)
+            print(f"Tentativa {tentativa}: {type(erro).__name__}: {erro} (pendente: {pendentes}) "
+                  f"em {time.perf_counter() - inicio:.2f}s")
+            continue
+        print(f"Tentativa {tentativa}: concluída em {time.perf_counter() - inicio:.2f}s")
+        print("Tempos por etapa:", {nome: round(valor, 3) for nome, valor in resultado["tempos"].items()})
+
+    execucoes = {
+        contador["rotulos"]["etapa"]: int(contador["valor"])
+        for contador in metricas.exportar_json()["contadores"]
+        if contador["nome"] == "grafo_etapa_execucoes_total"
+    }
+    print("Execuções concluídas por etapa:", execucoes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Pool de Conexões HTTP Compartilhado pelos Modelos
+=================================================
+
+Cada ChatOpenAI cria (ou reaproveita, por URL e timeout) seus próprios
+clientes HTTP, com os limites padrão do SDK da OpenAI. Este módulo mantém
+um único pool keep-alive por processo, com tamanho, timeouts e HTTP/2
+configuráveis, entregue pela fabrica_modelo a todos os modelos criados.
+
+Conceitos abordados:
+- httpx.Client / httpx.AsyncClient com limites de conexões e keep-alive
+- Um cliente síncrono e um assíncrono com a mesma configuração; o
+  assíncrono mantém um transporte por loop de eventos, pois as conexões
+  assíncronas ficam presas ao loop em que foram abertas
+- Extensão "trace" do httpcore para medir o tempo de abertura de conexão
+  (TCP + TLS)
+- Métricas do pool: conexões em uso, ociosas, abertas e tempo de conexão
+- Retentativas do SDK da OpenAI: cada nova tentativa sai com o cabeçalho
+  x-stainless-retry-count > 0 e é contada em
+  `llm_retentativas_total{runnable="sdk_openai"}` (as retentativas do SDK
+  não passam pelos callbacks do LangChain)
+
+Configuração por variáveis de ambiente (lidas por `obter_pool()`):
+- LLM_POOL=0                    desativa o pool compartilhado
+- LLM_POOL_MAX_CONEXOES         conexões simultâneas por cliente (padrão: 100)
+- LLM_POOL_MAX_OCIOSAS          conexões keep-alive mantidas ociosas (padrão: 100)
+- LLM_POOL_KEEPALIVE_S          tempo máximo de uma conexão ociosa (padrão: 30)
+- LLM_POOL_TIMEOUT_CONEXAO_S    timeout de conexão (padrão: 5)
+- LLM_POOL_TIMEOUT_S            timeout de leitura/escrita (padrão: 60)
+- LLM_POOL_HTTP2=1              ativa HTTP/2 (requer o pacote h2)
+
+Uso:
+    python pool_conexoes.py --requisicoes 200 --concorrencia 32
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+import warnings
+import weakref
+from typing import Optional
+
+import httpx
+
+from instrumentacao import BUCKETS_SEGUNDOS, Histograma, METRICAS, Metricas
+
+
+class _TransporteAssincronoPorLoop(httpx.AsyncBaseTransport):
+    """Transporte assíncrono que mantém um pool de conexões para cada loop de eventos."""
+
+    def __init__(self, **opcoes):
+        self._opcoes = opcoes
+        self._transportes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _transporte(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transporte = self._transportes.get(loop)
+        if transporte is None:
+            transporte = self._transportes[loop] = httpx.AsyncHTTPTransport(**self._opcoes)
+        return transporte
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transporte().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        transporte = self._transportes.pop(asyncio.get_running_loop(), None)
+        if transporte is not None:
+            await transporte.aclose()
+
+    def fechar_todos(self) -> None:
+        """Fecha os transportes de todos os loops ainda abertos, a partir de código síncrono."""
+        for loop, transporte in list(self._transportes.items()):
+            del self._transportes[loop]
+            if loop.is_closed():
+                continue
+            if not loop.is_running():
+                loop.run_until_complete(transporte.aclose())
+            elif _loop_atual() is loop:
+                loop.create_task(transporte.aclose())
+            else:
+                asyncio.run_coroutine_threadsafe(transporte.aclose(), loop)
+
+    def transportes(self):
+        """Transportes dos loops ainda abertos (os de loops encerrados são descartados)."""
+        for loop in [loop for loop in self._transportes if loop.is_closed()]:
+            del self._transportes[loop]
+        return list(self._transportes.values())
+
+
+def _loop_atual() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _conexoes(transporte) -> list:
+    # O pool do httpcore fica em um atributo interno do transporte do httpx
+    pool = getattr(transporte, "_pool", None)
+    return list(getattr(pool, "connections", []))
+
+
+class PoolConexoes:
+    """
+    Clientes HTTP síncrono e assíncrono compartilhados, com métricas.
+
+    - max_conexoes: conexões simultâneas por cliente (e por loop, no assíncrono)
+    - max_ociosas: conexões keep-alive mantidas abertas sem uso
+    - keepalive_s: tempo máximo de vida de uma conexão ociosa
+    - timeout_conexao_s / timeout_s: timeouts de conexão e de leitura/escrita
+    - http2: usa HTTP/2 quando o pacote h2 está instalado
+    """
+
+    def __init__(
+        self,
+        max_conexoes: int = 100,
+        max_ociosas: int = 100,
+        keepalive_s: float = 30.0,
+        timeout_conexao_s: float = 5.0,
+        timeout_s: float = 60.0,
+        http2: bool = False,
+        metricas: Metricas = METRICAS,
+    ):
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                warnings.warn("Pacote h2 não instalado; o pool usará HTTP/1.1 (pip install httpx[http2])")
+                http2 = False
+        self.http2 = http2
+        self.metricas = metricas
+        self.timeout = httpx.Timeout(timeout_s, connect=timeout_conexao_s)
+        self.tempo_conexao = Histograma(BUCKETS_SEGUNDOS)
+
+        opcoes = dict(
+            limits=httpx.Limits(
+                max_connections=max_conexoes,
+                max_keepalive_connections=max_ociosas,
+                keepalive_expiry=keepalive_s,
+            ),
+            http2=http2,
+        )
+        self._transporte = httpx.HTTPTransport(**opcoes)
+        self._transporte_assincrono = _TransporteAssincronoPorLoop(**opcoes)
+        self.cliente = httpx.Client(
+            transport=self._transporte,
+            timeout=self.timeout,
+            follow_redirects=True,
+            event_hooks={"request": [self._rastrear]},
+        )
+        self.cliente_assincrono = httpx.AsyncClient(
+            transport=self._transporte_assincrono,
+            timeout=self.timeout,
+            follow_redirects=True,
+            event_hooks={"request": [self._arastrear]},
+        )
+
+    # ------------------------------------------------------------------
+    # Tempo de conexão (extensão "trace" do httpcore)
+    # ------------------------------------------------------------------
+
+    def _registrar_evento(self, inicio: list, evento: str) -> None:
+        if evento == "connection.connect_tcp.started":
+            inicio.append(time.perf_counter())
+        elif inicio and evento in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            # Em HTTPS a conexão só termina após o TLS: o evento do TLS substitui o do TCP
+            inicio.append(time.perf_counter())
+
+    def _concluir_conexao(self, inicio: list) -> None:
+        if len(inicio) > 1:
+            duracao = inicio[-1] - inicio[0]
+            self.tempo_conexao.observar(duracao)
+            self.metricas.observar("llm_pool_tempo_conexao_segundos", duracao)
+            self.metricas.incrementar("llm_pool_conexoes_abertas_total")
+
+    def _contar_retentativa(self, request: httpx.Request) -> None:
+        if request.headers.get("x-stainless-retry-count", "0") not in ("", "0"):
+            self.metricas.incrementar("llm_retentativas_total", runnable="sdk_openai")
+
+    def _rastrear(self, request: httpx.Request) -> None:
+        self._contar_retentativa(request)
+        inicio: list = []
+
+        def trace(evento: str, info: dict) -> None:
+            self._registrar_evento(inicio, evento)
+            if evento.endswith("send_request_headers.started"):
+                self._concluir_conexao(inicio)
+                inicio.clear()
+
+        request.extensions["trace"] = trace
+
+    async def _arastrear(self, request: httpx.Request) -> None:
+        self._contar_retentativa(request)
+        inicio: list = []
+
+        async def trace(evento: str, info: dict) -> None:
+            self._registrar_evento(inicio, evento)
+            if evento.endswith("send_request_headers.started"):
+                self._concluir_conexao(inicio)
+                inicio.clear()
+
+        request.extensions["trace"] = trace
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def estatisticas(self) -> dict:
+        """Conexões em uso e ociosas (clientes síncrono e assíncrono) e tempo de conexão."""
+        conexoes = _conexoes(self._transporte)
+        for transporte in self._transporte_assincrono.transportes():
+            conexoes.extend(_conexoes(transporte))
+        abertas = [conexao for conexao in conexoes if not conexao.is_closed()]
+        ociosas = sum(1 for conexao in abertas if conexao.is_idle())
+        total = self.tempo_conexao.total
+        return {
+            "conexoes_em_uso": len(abertas) - ociosas,
+            "conexoes_ociosas": ociosas,
+            "conexoes_abertas_total": total,
+            "tempo_conexao_medio_ms": self.tempo_conexao.soma / total * 1000 if total else 0.0,
+            "tempo_conexao_p99_ms": self.tempo_conexao.quantil(0.99) * 1000,
+            "http2": self.http2,
+        }
+
+    def fechar(self) -> None:
+        """Fecha o cliente síncrono e as conexões assíncronas de todos os loops."""
+        self.cliente.close()
+        self._transporte_assincrono.fechar_todos()
+
+    async def afechar(self) -> None:
+        """Como fechar(), de dentro de um loop: aguarda o fechamento do cliente assíncrono."""
+        await self.cliente_assincrono.aclose()
+        self.fechar()
+
+
+_pool_global: Optional[PoolConexoes] = None
+_trava_global = threading.Lock()
+
+
+def obter_pool() -> Optional[PoolConexoes]:
+    """
+    Retorna o pool compartilhado do processo, criado a partir das variáveis
+    de ambiente na primeira chamada (ou None se LLM_POOL=0).
+    """
+    global _pool_global
+    if os.getenv("LLM_POOL", "1") == "0":
+        return None
+    with _trava_global:
+        if _pool_global is None:
+            _pool_global = PoolConexoes(
+                max_conexoes=int(os.getenv("LLM_POOL_MAX_CONEXOES", 100)),
+                max_ociosas=int(os.getenv("LLM_POOL_MAX_OCIOSAS", 100)),
+                keepalive_s=float(os.getenv("LLM_POOL_KEEPALIVE_S", 30)),
+                timeout_conexao_s=float(os.getenv("LLM_POOL_TIMEOUT_CONEXAO_S", 5)),
+                timeout_s=float(os.getenv("LLM_POOL_TIMEOUT_S", 60)),
+                http2=os.getenv("LLM_POOL_HTTP2", "0") == "1",
+            )
+    return _pool_global
+
+
+def main():
+    """Compara clientes independentes por modelo com o pool compartilhado, no servidor fake local."""
+    parser = argparse.ArgumentParser(description="Pool de conexões compartilhado")
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--max-conexoes", type=int, default=100)
+    parser.add_argument("--max-ociosas", type=int, default=100)
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    from fabrica_modelo import criar_modelo
+    from servidor_fake import ServidorFake
+
+    def medir(servidor: ServidorFake, pool: Optional[PoolConexoes]) -> None:
+        # Quatro modelos (como aulas diferentes em um mesmo worker), chamadas síncronas e assíncronas.
+        # Sem pool, cada modelo recebe os seus clientes: sem http_client, a fabrica_modelo
+        # usaria o pool do processo e as duas medições seriam iguais
+        def clientes() -> dict:
+            if pool:
+                return {"http_client": pool.cliente, "http_async_client": pool.cliente_assincrono}
+            return {"http_client": httpx.Client(), "http_async_client": httpx.AsyncClient()}
+
+        modelos = [
+            criar_modelo(
+                model_name=f"gpt-fake-{i}",
+                openai_api_key="fake",
+                base_url=servidor.url,
+                cache=False,
+                agrupar=False,  # chamadas iguais agrupadas esconderiam as conexões
+                **clientes(),
+            )
+            for i in range(4)
+        ]
+        conexoes_antes = servidor.estatisticas["conexoes"]
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.concorrencia) as executor:
+            list(executor.map(lambda i: modelos[i % 4].invoke("Olá"), range(args.requisicoes)))
+
+        async def assincrono():
+            semaforo = asyncio.Semaphore(args.concorrencia)
+
+            async def uma(i):
+                async with semaforo:
+                    await modelos[i % 4].ainvoke("Olá")
+
+            await asyncio.gather(*(uma(i) for i in range(args.requisicoes)))
+
+        asyncio.run(assincrono())
+        print(
+            f"{'Pool compartilhado' if pool else 'Clientes por modelo'}: "
+            f"{2 * args.requisicoes} requisições em {time.perf_counter() - inicio:.2f}s, "
+            f"{servidor.estatisticas['conexoes'] - conexoes_antes} conexões abertas"
+        )
+
+    with ServidorFake(latencia_s=0.05, tamanho_resposta=10) as servidor:
+        medir(servidor, None)
+        pool = PoolConexoes(max_conexoes=args.max_conexoes, max_ociosas=args.max_ociosas)
+        medir(servidor, pool)
+        print("Métricas do pool:", pool.estatisticas())
+        pool.fechar()
+
+
+if __name__ == "__main__":
+    main()
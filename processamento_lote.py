@@ -0,0 +1,225 @@
+"""
+Processamento em Lote Concorrente de Cadeias LCEL
+=================================================
+
+Este módulo executa uma cadeia LCEL sobre muitas entradas ao mesmo tempo,
+em vez de uma chamada de rede por vez em um laço serial.
+
+Conceitos abordados:
+- Limite de concorrência configurável (threads ou asyncio)
+- Entradas como lista ou iterador (consumidas sob demanda)
+- Resultados na mesma ordem das entradas
+- Isolamento de erros: a falha de um item não interrompe o lote
+- Relatório de vazão (itens/s) e latência p50/p99
+
+Uso:
+    from processamento_lote import executar_em_lote, aexecutar_em_lote
+
+    relatorio = executar_em_lote(cadeia, entradas, max_concorrencia=16)
+    print(relatorio.resumo())
+
+    relatorio = await aexecutar_em_lote(cadeia, entradas, max_concorrencia=64)
+"""
+
+import asyncio
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, List, Optional, Union
+
+
+@dataclass
+class ResultadoItem:
+    """Resultado da execução da cadeia para uma única entrada."""
+    indice: int
+    entrada: Any
+    saida: Any = None
+    erro: Optional[BaseException] = None
+    latencia_s: float = 0.0
+
+    @property
+    def sucesso(self) -> bool:
+        return self.erro is None
+
+
+@dataclass
+class RelatorioLote:
+    """Resultados de um lote (em ordem de entrada) e estatísticas de desempenho."""
+    resultados: List[ResultadoItem] = field(default_factory=list)
+    duracao_s: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.resultados)
+
+    @property
+    def falhas(self) -> int:
+        return sum(1 for resultado in self.resultados if not resultado.sucesso)
+
+    @property
+    def vazao(self) -> float:
+        """Itens processados por segundo."""
+        return self.total / self.duracao_s if self.duracao_s > 0 else 0.0
+
+    def latencia(self, p: float) -> float:
+        """Latência (em segundos) no percentil p, entre 0 e 100."""
+        return percentil([resultado.latencia_s for resultado in self.resultados], p)
+
+    @property
+    def saidas(self) -> List[Any]:
+        return [resultado.saida for resultado in self.resultados]
+
+    def resumo(self) -> str:
+        return (
+            f"{self.total} itens ({self.falhas} falhas) em {self.duracao_s:.2f}s | "
+            f"vazão {self.vazao:.1f} itens/s | "
+            f"p50 {self.latencia(50) * 1000:.0f}ms | p99 {self.latencia(99) * 1000:.0f}ms"
+        )
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método do posto mais próximo (0.0 se a lista for vazia)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[min(posicao, len(ordenados) - 1)]
+
+
+# ----------------------------------------------------------------------
+# Execução síncrona (threads)
+# ----------------------------------------------------------------------
+
+def _executar_item(cadeia, indice: int, entrada: Any, config: Optional[dict]) -> ResultadoItem:
+    resultado = ResultadoItem(indice=indice, entrada=entrada)
+    inicio = time.perf_counter()
+    try:
+        resultado.saida = cadeia.invoke(entrada, config=config)
+    except Exception as erro:
+        resultado.erro = erro
+    resultado.latencia_s = time.perf_counter() - inicio
+    return resultado
+
+
+def executar_em_lote(
+    cadeia,
+    entradas: Iterable[Any],
+    max_concorrencia: int = 8,
+    config: Optional[dict] = None,
+) -> RelatorioLote:
+    """
+    Executa `cadeia.invoke` para cada entrada usando até `max_concorrencia` threads.
+
+    As entradas são lidas do iterador sob demanda pelas threads de trabalho,
+    então no máximo `max_concorrencia` itens estão em andamento ao mesmo tempo.
+    """
+    iterador = enumerate(entradas)
+    trava = threading.Lock()
+    resultados: List[ResultadoItem] = []
+
+    def trabalhador():
+        while True:
+            with trava:
+                try:
+                    indice, entrada = next(iterador)
+                except StopIteration:
+                    return
+            resultado = _executar_item(cadeia, indice, entrada, config)
+            with trava:
+                resultados.append(resultado)
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador, daemon=True) for _ in range(max(1, max_concorrencia))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    resultados.sort(key=lambda resultado: resultado.indice)
+    return RelatorioLote(resultados=resultados, duracao_s=time.perf_counter() - inicio)
+
+
+# ----------------------------------------------------------------------
+# Execução assíncrona (asyncio)
+# ----------------------------------------------------------------------
+
+async def afluxo_em_lote(
+    cadeia,
+    entradas: Union[Iterable[Any], AsyncIterable[Any]],
+    max_concorrencia: int = 32,
+    config: Optional[dict] = None,
+) -> AsyncIterator[ResultadoItem]:
+    """
+    Executa `cadeia.ainvoke` para cada entrada e produz os resultados à medida
+    que ficam prontos (ordem de conclusão, não de entrada).
+    """
+    if hasattr(entradas, "__aiter__"):
+        iterador_assincrono = entradas.__aiter__()
+    else:
+        iterador_sincrono = iter(entradas)
+    trava = asyncio.Lock()
+    contador = 0
+    fila: asyncio.Queue = asyncio.Queue()
+
+    async def proxima_entrada():
+        nonlocal contador
+        async with trava:
+            try:
+                if hasattr(entradas, "__aiter__"):
+                    entrada = await iterador_assincrono.__anext__()
+                else:
+                    entrada = next(iterador_sincrono)
+            except (StopIteration, StopAsyncIteration):
+                return None
+            contador += 1
+            return contador - 1, entrada
+
+    async def trabalhador():
+        while True:
+            item = await proxima_entrada()
+            if item is None:
+                return
+            indice, entrada = item
+            resultado = ResultadoItem(indice=indice, entrada=entrada)
+            inicio = time.perf_counter()
+            try:
+                resultado.saida = await cadeia.ainvoke(entrada, config=config)
+            except Exception as erro:
+                resultado.erro = erro
+            resultado.latencia_s = time.perf_counter() - inicio
+            await fila.put(resultado)
+
+    async def coordenador():
+        try:
+            await asyncio.gather(*(trabalhador() for _ in range(max(1, max_concorrencia))))
+        finally:
+            await fila.put(None)
+
+    tarefa = asyncio.create_task(coordenador())
+    try:
+        while True:
+            resultado = await fila.get()
+            if resultado is None:
+                break
+            yield resultado
+        await tarefa
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
+
+
+async def aexecutar_em_lote(
+    cadeia,
+    entradas: Union[Iterable[Any], AsyncIterable[Any]],
+    max_concorrencia: int = 32,
+    config: Optional[dict] = None,
+) -> RelatorioLote:
+    """Versão assíncrona de `executar_em_lote` (resultados em ordem de entrada)."""
+    inicio = time.perf_counter()
+    resultados = [
+        resultado
+        async for resultado in afluxo_em_lote(cadeia, entradas, max_concorrencia, config)
+    ]
+    resultados.sort(key=lambda resultado: resultado.indice)
+    return RelatorioLote(resultados=resultados, duracao_s=time.perf_counter() - inicio)
@@ -0,0 +1,461 @@
+"""
+Recuperação de Contexto com FAISS (Índice em Disco, Memory-Mapped)
+==================================================================
+
+As sugestões de cidade e de restaurante da aula005 vêm apenas do que o
+modelo "lembra", sem nenhuma base de dados. Este módulo indexa um corpus
+local de documentos com FAISS e injeta os trechos mais relevantes nos
+prompts, para que as respostas se apoiem em informação conhecida.
+
+Conceitos abordados:
+- Embeddings: textos convertidos em vetores; documentos parecidos ficam
+  próximos (similaridade do cosseno = produto interno de vetores normalizados)
+- FAISS IndexFlatIP: busca exata pelos k vizinhos mais próximos
+- Índice em disco aberto com memory-map (IO_FLAG_MMAP_IFC): a abertura não
+  lê os vetores para a memória, o sistema operacional carrega as páginas
+  sob demanda
+- Adições incrementais em segmentos: cada adição grava um segmento novo,
+  sem reconstruir os anteriores; `compactar()` une os segmentos
+- Remoção por fonte: os trechos somem das buscas na hora e os vetores são
+  descartados na compactação
+- Consultas em lote: uma chamada de embedding e uma busca por segmento
+  para todas as consultas
+- EmbeddingsDeterministicos: embedding local (hashing de palavras) para
+  testes e execução sem chave de API
+
+Estrutura do diretório do índice:
+    manifesto.json        dimensão, segmentos (id inicial, total) e trechos removidos
+    segmento_00000.faiss  vetores de cada adição
+    documentos.sqlite     texto e metadados de cada trecho, por id
+
+Uso:
+    python recuperacao.py indexar corpus/
+    python recuperacao.py buscar "praias com ostras" "museus barrocos" -k 2
+    python recuperacao.py compactar
+    python aula005.py --fake --recuperacao
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import warnings
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+DIRETORIO_PADRAO = os.path.join("dados", "indice_cidades")
+CORPUS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+# ----------------------------------------------------------------------
+# Embedding determinístico local
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=100_000)
+def _posicao_e_sinal(termo: str, dimensao: int) -> Tuple[int, float]:
+    # crc32 é estável entre execuções (ao contrário de hash() do Python)
+    valor = zlib.crc32(termo.encode("utf-8"))
+    return valor % dimensao, 1.0 if (valor >> 31) & 1 else -1.0
+
+
+# Palavras frequentes demais para distinguir um trecho de outro
+PALAVRAS_VAZIAS = frozenset(
+    "com como das dos uma umas uns para pela pelas pelo pelos por que sao mais muito "
+    "esta este essa esse isso nas nos nao tem ser seu sua seus suas ate entre sobre".split()
+)
+
+
+def _normalizar_palavras(texto: str) -> List[str]:
+    sem_acentos = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+    return [palavra for palavra in re.findall(r"\w{3,}", sem_acentos) if palavra not in PALAVRAS_VAZIAS]
+
+
+class EmbeddingsDeterministicos(Embeddings):
+    """
+    Embedding local por hashing de palavras e pares de palavras.
+
+    Não entende sinônimos como um modelo real, mas textos que compartilham
+    palavras ficam próximos; o resultado é idêntico em qualquer execução.
+    """
+
+    def __init__(self, dimensao: int = 1024):
+        self.dimensao = dimensao
+
+    def vetorizar(self, textos: Sequence[str]) -> np.ndarray:
+        """Matriz float32 (len(textos) x dimensao) com linhas normalizadas."""
+        vetores = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            palavras = _normalizar_palavras(texto)
+            termos = palavras + [f"{a} {b}" for a, b in zip(palavras, palavras[1:])]
+            for termo in termos:
+                posicao, sinal = _posicao_e_sinal(termo, self.dimensao)
+                vetores[linha, posicao] += sinal
+        faiss.normalize_L2(vetores)
+        return vetores
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.vetorizar(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vetorizar([text])[0].tolist()
+
+
+def _vetorizar(embeddings: Embeddings, textos: Sequence[str]) -> np.ndarray:
+    """Embeddings de um lote de textos como matriz float32 normalizada."""
+    if isinstance(embeddings, EmbeddingsDeterministicos):
+        return embeddings.vetorizar(textos)
+    vetores = np.asarray(embeddings.embed_documents(list(textos)), dtype=np.float32)
+    faiss.normalize_L2(vetores)
+    return vetores
+
+
+# ----------------------------------------------------------------------
+# Índice em disco
+# ----------------------------------------------------------------------
+
+class IndiceVetorial:
+    """
+    Índice FAISS em segmentos no disco, abertos com memory-map.
+
+    - diretorio: onde ficam o manifesto, os segmentos e os documentos
+    - embeddings: qualquer Embeddings do LangChain (padrão: determinístico)
+    - tamanho_lote: textos por chamada de embedding na indexação
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_PADRAO, embeddings: Optional[Embeddings] = None, tamanho_lote: int = 256):
+        self.diretorio = diretorio
+        self.embeddings = embeddings or EmbeddingsDeterministicos()
+        self.tamanho_lote = tamanho_lote
+        os.makedirs(diretorio, exist_ok=True)
+
+        # Escrita (adições e compactação) serializada; o SQLite tem trava própria para as buscas
+        self._trava = threading.RLock()  # reentrante: o gerador de adicionar_lotes pode chamar remover_fonte
+        self._trava_banco = threading.Lock()
+        self._conexao = sqlite3.connect(os.path.join(diretorio, "documentos.sqlite"), check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._criar_tabela("documentos")
+
+        caminho_manifesto = os.path.join(diretorio, "manifesto.json")
+        if os.path.exists(caminho_manifesto):
+            with open(caminho_manifesto, encoding="utf-8") as arquivo:
+                self._manifesto = json.load(arquivo)
+        else:
+            self._manifesto = {"dimensao": None, "segmentos": []}
+        # (id inicial, índice FAISS) de cada segmento, abertos sem copiar os vetores
+        self._segmentos = [
+            (segmento["inicio"], self._abrir(segmento["arquivo"])) for segmento in self._manifesto["segmentos"]
+        ]
+        self._descartar_orfaos()
+
+    def _criar_tabela(self, nome: str) -> None:
+        self._conexao.execute(
+            f"CREATE TABLE IF NOT EXISTS {nome} (id INTEGER PRIMARY KEY, texto TEXT NOT NULL, metadados TEXT NOT NULL)"
+        )
+        # Índice por fonte: remover_fonte sem varrer a tabela inteira
+        self._conexao.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{nome}_fonte ON {nome} (json_extract(metadados, '$.fonte'))"
+        )
+
+    def _descartar_orfaos(self) -> None:
+        """
+        Remove as linhas sem vetores gravados. Os documentos de um lote são
+        gravados no SQLite antes de o segmento em memória ir para o disco:
+        se o processo morre nesse intervalo (kill, falta de memória), as
+        linhas ficam com ids >= total, que seriam reusados na próxima adição.
+        """
+        with self._trava_banco, self._conexao:
+            orfaos = self._conexao.execute("DELETE FROM documentos WHERE id >= ?", (self.total,)).rowcount
+        if orfaos:
+            warnings.warn(f"{orfaos} trechos sem vetores (indexação interrompida) descartados de {self.diretorio}")
+
+    def _abrir(self, arquivo: str):
+        return faiss.read_index(os.path.join(self.diretorio, arquivo), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+
+    def _gravar_manifesto(self) -> None:
+        caminho = os.path.join(self.diretorio, "manifesto.json")
+        with open(caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+            json.dump(self._manifesto, arquivo, indent=2)
+        # Troca atômica: leitores nunca veem um manifesto pela metade
+        os.replace(caminho + ".tmp", caminho)
+
+    @property
+    def total(self) -> int:
+        return sum(segmento.ntotal for _, segmento in self._segmentos)
+
+    @property
+    def quantidade_segmentos(self) -> int:
+        return len(self._segmentos)
+
+    def adicionar(self, textos: Iterable[str], metadados: Optional[Iterable[dict]] = None) -> List[int]:
+        """Adiciona textos em um novo segmento (sem reconstruir os existentes); retorna os ids."""
+        textos = list(textos)
+        metadados = list(metadados) if metadados is not None else [{} for _ in textos]
+        lotes = (
+            (textos[inicio:inicio + self.tamanho_lote], metadados[inicio:inicio + self.tamanho_lote])
+            for inicio in range(0, len(textos), self.tamanho_lote)
+        )
+        return self.adicionar_lotes(lotes)
+
+    def adicionar_lotes(self, lotes: Iterable[Tuple[List[str], List[dict]]], max_por_segmento: int = 50_000) -> List[int]:
+        """
+        Adiciona lotes (textos, metadados) vindos de um gerador, um de cada vez.
+
+        Os vetores se acumulam em um segmento em memória, gravado ao atingir
+        `max_por_segmento`: a memória fica limitada mesmo para fontes enormes.
+        """
+        ids: List[int] = []
+        with self._trava:
+            pendente = None
+            proximo_id = self.total
+            try:
+                for textos, metadados in lotes:
+                    if not textos:
+                        continue
+                    vetores = _vetorizar(self.embeddings, textos)
+                    dimensao = vetores.shape[1]
+                    if self._manifesto["dimensao"] not in (None, dimensao):
+                        raise ValueError(f"Dimensão {dimensao} diferente da do índice ({self._manifesto['dimensao']})")
+                    self._manifesto["dimensao"] = dimensao
+                    if pendente is None:
+                        pendente = (proximo_id, faiss.IndexFlatIP(dimensao))
+                    pendente[1].add(vetores)
+
+                    novos = list(range(proximo_id, proximo_id + len(textos)))
+                    with self._trava_banco, self._conexao:
+                        self._conexao.executemany(
+                            "INSERT INTO documentos (id, texto, metadados) VALUES (?, ?, ?)",
+                            [(id_, texto, json.dumps(meta, ensure_ascii=False)) for id_, texto, meta in zip(novos, textos, metadados)],
+                        )
+                    ids.extend(novos)
+                    proximo_id += len(textos)
+                    if pendente[1].ntotal >= max_por_segmento:
+                        self._gravar_segmento(*pendente)
+                        pendente = None
+            finally:
+                # Mesmo se o gerador falhar, o que já foi gravado no SQLite ganha seus vetores
+                if pendente is not None:
+                    self._gravar_segmento(*pendente)
+        return ids
+
+    def _gravar_segmento(self, inicio: int, segmento) -> None:
+        numero = self._manifesto.get("proximo_segmento", len(self._manifesto["segmentos"]))
+        arquivo = f"segmento_{numero:05d}.faiss"
+        faiss.write_index(segmento, os.path.join(self.diretorio, arquivo))
+        self._manifesto["proximo_segmento"] = numero + 1
+        self._manifesto["segmentos"].append({"arquivo": arquivo, "inicio": inicio, "total": segmento.ntotal})
+        self._gravar_manifesto()
+        self._segmentos.append((inicio, self._abrir(arquivo)))
+
+    def remover_fonte(self, fonte: str) -> int:
+        """
+        Remove os trechos de uma fonte (metadata["fonte"]); retorna quantos.
+
+        Os vetores continuam nos segmentos até a próxima compactação, mas
+        deixam de aparecer nas buscas.
+        """
+        with self._trava, self._trava_banco, self._conexao:
+            removidos = self._conexao.execute(
+                "DELETE FROM documentos WHERE json_extract(metadados, '$.fonte') = ?", (fonte,)
+            ).rowcount
+            if removidos:
+                self._manifesto["removidos"] = self._manifesto.get("removidos", 0) + removidos
+                self._gravar_manifesto()
+        return removidos
+
+    def buscar(self, consultas: Sequence[str], k: int = 4) -> List[List[Document]]:
+        """Os k trechos mais similares a cada consulta (score em metadata["score"])."""
+        segmentos = list(self._segmentos)
+        if not consultas:
+            return []
+        if not segmentos:
+            return [[] for _ in consultas]
+
+        # Com trechos removidos ainda nos segmentos, busca a mais para completar k
+        k_busca = k + self._manifesto.get("removidos", 0)
+        vetores = _vetorizar(self.embeddings, consultas)
+        scores, ids = [], []
+        for inicio, segmento in segmentos:
+            distancias, posicoes = segmento.search(vetores, min(k_busca, segmento.ntotal))
+            scores.append(distancias)
+            ids.append(np.where(posicoes >= 0, posicoes + inicio, -1))
+        scores = np.concatenate(scores, axis=1)
+        ids = np.concatenate(ids, axis=1)
+        # Os melhores entre todos os segmentos, por consulta
+        ordem = np.argsort(-scores, axis=1)[:, :k_busca]
+        melhores_ids = np.take_along_axis(ids, ordem, axis=1)
+        melhores_scores = np.take_along_axis(scores, ordem, axis=1)
+
+        documentos = self._carregar_documentos({int(id_) for id_ in melhores_ids.ravel() if id_ >= 0})
+        resultados = []
+        for linha_ids, linha_scores in zip(melhores_ids, melhores_scores):
+            encontrados = [
+                Document(page_content=documentos[int(id_)][0], metadata={**documentos[int(id_)][1], "id": int(id_), "score": float(score)})
+                for id_, score in zip(linha_ids, linha_scores)
+                if int(id_) in documentos
+            ]
+            resultados.append(encontrados[:k])
+        return resultados
+
+    def _carregar_documentos(self, ids: set) -> Dict[int, Tuple[str, dict]]:
+        if not ids:
+            return {}
+        marcadores = ",".join("?" * len(ids))
+        with self._trava_banco:
+            linhas = self._conexao.execute(
+                f"SELECT id, texto, metadados FROM documentos WHERE id IN ({marcadores})", tuple(ids)
+            ).fetchall()
+        return {id_: (texto, json.loads(metadados)) for id_, texto, metadados in linhas}
+
+    def compactar(self) -> None:
+        """
+        Une os segmentos em um só e descarta os vetores de trechos removidos.
+
+        Os ids são renumerados: execute fora dos horários de busca.
+        """
+        with self._trava:
+            removidos = self._manifesto.get("removidos", 0)
+            if len(self._segmentos) <= 1 and not removidos:
+                return
+            with self._trava_banco:
+                linhas = self._conexao.execute("SELECT id FROM documentos ORDER BY id").fetchall()
+            vivos = np.array([linha[0] for linha in linhas], dtype=np.int64)
+            vetores = np.concatenate([segmento.reconstruct_n(0, segmento.ntotal) for _, segmento in self._segmentos])
+            antigos = [segmento["arquivo"] for segmento in self._manifesto["segmentos"]]
+            self._manifesto["segmentos"] = []
+            self._manifesto["removidos"] = 0
+            self._segmentos = []
+
+            with self._trava_banco, self._conexao:
+                # Ids renumerados na mesma ordem: 0..n-1, como as posições no novo segmento
+                self._conexao.execute("DROP TABLE IF EXISTS documentos_novos")
+                self._conexao.execute(
+                    "CREATE TABLE documentos_novos (id INTEGER PRIMARY KEY, texto TEXT NOT NULL, metadados TEXT NOT NULL)"
+                )
+                self._conexao.execute(
+                    "INSERT INTO documentos_novos SELECT ROW_NUMBER() OVER (ORDER BY id) - 1, texto, metadados FROM documentos"
+                )
+                self._conexao.execute("DROP TABLE documentos")
+                self._conexao.execute("ALTER TABLE documentos_novos RENAME TO documentos")
+                self._criar_tabela("documentos")
+            if len(vivos):
+                unico = faiss.IndexFlatIP(vetores.shape[1])
+                unico.add(vetores[vivos])
+                self._gravar_segmento(0, unico)
+            else:
+                self._gravar_manifesto()
+        for antigo in antigos:
+            os.remove(os.path.join(self.diretorio, antigo))
+
+    def contexto(self, campo: str, k: int = 3) -> "ContextoRecuperado":
+        """Runnable que busca trechos para entrada[campo] e devolve o contexto em texto."""
+        return ContextoRecuperado(indice=self, campo=campo, k=k)
+
+    def fechar(self) -> None:
+        with self._trava, self._trava_banco:
+            self._conexao.close()
+
+
+class ContextoRecuperado(Runnable[dict, str]):
+    """
+    Etapa de recuperação para LCEL: dict -> trechos relevantes em texto.
+
+    Em `batch`, todas as consultas do lote são buscadas de uma só vez.
+    """
+
+    def __init__(self, indice: IndiceVetorial, campo: str, k: int = 3):
+        self.indice = indice
+        self.campo = campo
+        self.k = k
+
+    @staticmethod
+    def _formatar(documentos: List[Document]) -> str:
+        return "\n\n".join(documento.page_content for documento in documentos)
+
+    def invoke(self, input: dict, config: Optional[RunnableConfig] = None, **kwargs) -> str:
+        return self._formatar(self.indice.buscar([str(input[self.campo])], self.k)[0])
+
+    def batch(self, inputs: List[dict], config=None, *, return_exceptions: bool = False, **kwargs) -> List[str]:
+        resultados = self.indice.buscar([str(entrada[self.campo]) for entrada in inputs], self.k)
+        return [self._formatar(documentos) for documentos in resultados]
+
+
+# ----------------------------------------------------------------------
+# Corpus
+# ----------------------------------------------------------------------
+
+def dividir_texto(texto: str, tamanho: int = 400, sobreposicao: int = 50) -> List[str]:
+    """Divide um texto em trechos, preferindo quebras de seção, parágrafo e linha."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    divisor = RecursiveCharacterTextSplitter(
+        chunk_size=tamanho, chunk_overlap=sobreposicao, separators=["\n## ", "\n\n", "\n", " ", ""]
+    )
+    return divisor.split_text(texto)
+
+
+def indexar_diretorio(indice: IndiceVetorial, diretorio: str, extensoes=(".md", ".txt")) -> int:
+    """Indexa os arquivos de texto do diretório; retorna o número de trechos adicionados."""
+    textos, metadados = [], []
+    for raiz, _, arquivos in os.walk(diretorio):
+        for nome in sorted(arquivos):
+            if not nome.endswith(extensoes):
+                continue
+            caminho = os.path.join(raiz, nome)
+            with open(caminho, encoding="utf-8") as arquivo:
+                for posicao, trecho in enumerate(dividir_texto(arquivo.read())):
+                    textos.append(trecho)
+                    metadados.append({"fonte": caminho, "trecho": posicao})
+    return len(indice.adicionar(textos, metadados))
+
+
+def abrir_indice(diretorio: str = DIRETORIO_PADRAO, corpus: str = CORPUS_PADRAO) -> IndiceVetorial:
+    """Abre o índice; se estiver vazio, indexa o corpus local primeiro."""
+    indice = IndiceVetorial(diretorio)
+    if not indice.total and os.path.isdir(corpus):
+        indexar_diretorio(indice, corpus)
+    return indice
+
+
+def main():
+    """Indexa documentos, busca trechos ou compacta o índice."""
+    parser = argparse.ArgumentParser(description="Índice FAISS do corpus local")
+    parser.add_argument("--indice", default=DIRETORIO_PADRAO, help="Diretório do índice")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    indexar = comandos.add_parser("indexar", help="Adiciona os arquivos .md/.txt de diretórios ao índice")
+    indexar.add_argument("diretorios", nargs="+")
+    buscar = comandos.add_parser("buscar", help="Busca os trechos mais similares às consultas")
+    buscar.add_argument("consultas", nargs="+")
+    buscar.add_argument("-k", type=int, default=3)
+    comandos.add_parser("compactar", help="Une os segmentos do índice em um só")
+    args = parser.parse_args()
+
+    indice = IndiceVetorial(args.indice)
+    if args.comando == "indexar":
+        for diretorio in args.diretorios:
+            print(f"{diretorio}: {indexar_diretorio(indice, diretorio)} trechos")
+        print(f"Total no índice: {indice.total} trechos em {indice.quantidade_segmentos} segmento(s)")
+    elif args.comando == "buscar":
+        for consulta, documentos in zip(args.consultas, indice.buscar(args.consultas, args.k)):
+            print(f"== {consulta}")
+            for documento in documentos:
+                primeira_linha = documento.page_content.strip().splitlines()[0]
+                print(f"  {documento.metadata['score']:.3f}  {documento.metadata['fonte']}  {primeira_linha}")
+    else:
+        indice.compactar()
+        print(f"Índice compactado: {indice.total} trechos em 1 segmento")
+    indice.fechar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+Requisições Redundantes (Hedged Requests) contra Lentidões na Cauda
+===================================================================
+
+O p99 das cadeias das aulas 003 e 006 não vem da latência típica, e sim
+de lentidões ocasionais de vários segundos no provedor, antes do primeiro
+token. Repetir a chamada depois de um tempo fixo desperdiça requisições;
+esperar a lenta custa segundos.
+
+Com a redundância, se uma chamada não produziu o primeiro token dentro de
+um limite adaptativo (o p95 observado do tempo até o primeiro token), uma
+cópia idêntica é disparada; a que responder primeiro é usada e a outra é
+cancelada. Um orçamento limita a fração de requisições extras.
+
+Conceitos abordados:
+- Limite adaptativo: percentil (padrão p95) de uma janela das últimas
+  latências até o primeiro token, com um mínimo de amostras antes de
+  disparar cópias
+- Orçamento: cada chamada acrescenta `orcamento` de crédito (ex.: 0.05) e
+  cada cópia consome 1; sem crédito, a chamada segue sem cópia
+- Cancelamento da perdedora: no asyncio a tarefa é cancelada e a conexão
+  fechada; nas threads o fluxo perdedor é fechado ao chegar o seu primeiro
+  pedaço, e uma chamada sem streaming termina em segundo plano
+- Nas chamadas sem streaming (_generate/_agenerate) o "primeiro token" é a
+  resposta inteira; no streaming (_stream/_astream), o primeiro pedaço, e
+  só os tokens da vencedora chegam aos callbacks
+- Threads: a original e a cópia rodam em um pool de `max_threads`; o
+  limite conta a partir do momento em que a original começa a rodar (a
+  espera na fila do pool não conta) e, com o pool cheio, nenhuma cópia é
+  disparada, pois ela também ficaria na fila. Use `max_threads` de pelo
+  menos 2x o número de chamadas síncronas simultâneas (ex.: a
+  --concorrencia do modo lote da aula003)
+- Contadores `llm_redundancia_total{resultado}`: copia_disparada,
+  venceu_copia, venceu_original, sem_orcamento, sem_threads
+
+A redundância fica entre o escalonador (cada cópia respeita os limites de
+RPM/TPM) e o agrupamento (chamadas agrupadas compartilham a mesma cópia).
+
+Configuração por variáveis de ambiente (lidas por `obter_redundancia()`):
+- LLM_REDUNDANCIA=1              ativa a redundância em criar_modelo (padrão: 0)
+- LLM_REDUNDANCIA_ORCAMENTO      fração máxima de requisições extras (padrão: 0.05)
+- LLM_REDUNDANCIA_PERCENTIL      percentil do limite adaptativo (padrão: 95)
+- LLM_REDUNDANCIA_MAX_THREADS    threads das chamadas síncronas (padrão: 64)
+
+Uso:
+    modelo = criar_modelo(model_name="gpt-3.5-turbo", redundancia=Redundancia(orcamento=0.05))
+
+    python requisicoes_redundantes.py --requisicoes 400   # cauda no servidor fake
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from instrumentacao import METRICAS, Metricas
+from processamento_lote import percentil
+
+
+def _primeiro(fluxo: Iterator) -> Tuple[Iterator, Any]:
+    """(fluxo, primeiro pedaço), ou (fluxo, None) se o fluxo estiver vazio."""
+    return fluxo, next(fluxo, None)
+
+
+class _Execucao:
+    """Tarefa no pool de threads e o instante em que ela começou a rodar."""
+
+    __slots__ = ("futuro", "iniciada", "inicio")
+
+    def __init__(self):
+        self.futuro: Optional[Future] = None
+        self.iniciada = threading.Event()
+        self.inicio = 0.0
+
+
+async def _aprimeiro(fluxo) -> Tuple[Any, Any]:
+    try:
+        return fluxo, await fluxo.__anext__()
+    except StopAsyncIteration:
+        return fluxo, None
+
+
+class Redundancia:
+    """
+    Executa chamadas com uma cópia redundante quando a original passa do
+    limite adaptativo, dentro do orçamento de requisições extras.
+
+    - orcamento: fração máxima de requisições extras (0.05 = 5%)
+    - percentil: percentil das latências observadas usado como limite
+    - minimo_amostras: latências observadas antes de disparar cópias
+    - limite_minimo_s: limite nunca abaixo deste valor
+    - janela: latências recentes consideradas no percentil, por tipo
+    - credito_maximo: cópias acumuladas que podem ser gastas em uma rajada
+    - max_threads: threads das chamadas síncronas (original e cópia); pelo
+      menos 2x as chamadas síncronas simultâneas
+    """
+
+    def __init__(
+        self,
+        orcamento: float = 0.05,
+        percentil: float = 95,
+        minimo_amostras: int = 20,
+        limite_minimo_s: float = 0.05,
+        janela: int = 500,
+        credito_maximo: float = 5.0,
+        max_threads: int = 64,
+        metricas: Metricas = METRICAS,
+    ):
+        self.orcamento = orcamento
+        self.percentil = percentil
+        self.minimo_amostras = minimo_amostras
+        self.limite_minimo_s = limite_minimo_s
+        self.credito_maximo = credito_maximo
+        self.max_threads = max_threads
+        self.metricas = metricas
+        self._janela = janela
+        self._latencias: Dict[str, deque] = {}
+        self._credito = 0.0
+        self._trava = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_threads, thread_name_prefix="redundancia")
+        self._ocupadas = 0  # threads do pool executando uma chamada
+        # Contadores do processo atual
+        self.chamadas = 0
+        self.copias = 0
+        self.vitorias_copia = 0
+        self.sem_orcamento = 0
+        self.sem_threads = 0
+
+    # ------------------------------------------------------------------
+    # Limite adaptativo e orçamento
+    # ------------------------------------------------------------------
+
+    def limite(self, tipo: str) -> Optional[float]:
+        """Tempo de espera pela original antes da cópia (None = ainda sem amostras)."""
+        with self._trava:
+            latencias = list(self._latencias.get(tipo, ()))
+        if len(latencias) < self.minimo_amostras:
+            return None
+        return max(self.limite_minimo_s, percentil(sorted(latencias), self.percentil))
+
+    def observar(self, tipo: str, segundos: float) -> None:
+        with self._trava:
+            self._latencias.setdefault(tipo, deque(maxlen=self._janela)).append(segundos)
+
+    def _nova_chamada(self) -> None:
+        with self._trava:
+            self.chamadas += 1
+            self._credito = min(self.credito_maximo, self._credito + self.orcamento)
+
+    def _autorizar_copia(self) -> bool:
+        with self._trava:
+            if self._credito >= 1:
+                self._credito -= 1
+                self.copias += 1
+                autorizada = True
+            else:
+                self.sem_orcamento += 1
+                autorizada = False
+        self.metricas.incrementar("llm_redundancia_total", resultado="copia_disparada" if autorizada else "sem_orcamento")
+        return autorizada
+
+    def _vencedora(self, copia: bool) -> None:
+        if copia:
+            with self._trava:
+                self.vitorias_copia += 1
+        self.metricas.incrementar("llm_redundancia_total", resultado="venceu_copia" if copia else "venceu_original")
+
+    # ------------------------------------------------------------------
+    # Execução com threads
+    # ------------------------------------------------------------------
+
+    def _submeter(self, funcao: Callable[[], Any]) -> _Execucao:
+        execucao = _Execucao()
+        # Cada tarefa com a sua cópia do contexto (callbacks, tracing)
+        contexto = copy_context()
+
+        def rodar():
+            with self._trava:
+                self._ocupadas += 1
+            execucao.inicio = time.perf_counter()
+            execucao.iniciada.set()
+            try:
+                return contexto.run(funcao)
+            finally:
+                with self._trava:
+                    self._ocupadas -= 1
+
+        execucao.futuro = self._executor.submit(rodar)
+        return execucao
+
+    def _threads_livres(self) -> bool:
+        """Se uma cópia começaria a rodar agora (e não ficaria na fila do pool)."""
+        with self._trava:
+            livres = self._ocupadas < self.max_threads
+            if not livres:
+                self.sem_threads += 1
+        if not livres:
+            self.metricas.incrementar("llm_redundancia_total", resultado="sem_threads")
+        return livres
+
+    def executar(self, tipo: str, funcao: Callable[[], Any], descartar: Callable[[Any], None] = None) -> Any:
+        """
+        Retorna `funcao()` (original ou cópia, a que terminar primeiro).
+        `descartar(resultado)` recebe o resultado da perdedora, se ele chegar.
+        """
+        self._nova_chamada()
+        limite = self.limite(tipo)
+        inicio = time.perf_counter()
+        if limite is None:
+            resultado = funcao()
+            self.observar(tipo, time.perf_counter() - inicio)
+            return resultado
+
+        execucao = self._submeter(funcao)
+        original = execucao.futuro
+        # O limite vale a partir do início real: a espera na fila do pool não conta
+        execucao.iniciada.wait()
+        inicio = execucao.inicio
+        concluidas, _ = wait([original], timeout=max(0.0, limite - (time.perf_counter() - inicio)))
+        if concluidas or not self._threads_livres() or not self._autorizar_copia():
+            resultado = original.result()
+            self.observar(tipo, time.perf_counter() - inicio)
+            return resultado
+
+        copia = self._submeter(funcao).futuro
+        pendentes = {original, copia}
+        erro = None
+        while pendentes:
+            concluidas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidas:
+                if futuro.exception() is not None:
+                    erro = futuro.exception()
+                    continue
+                # A original só é observada quando termina: a cópia vencedora
+                # registra o tempo já esperado pela original (limite inferior)
+                self.observar(tipo, time.perf_counter() - inicio)
+                self._vencedora(futuro is copia)
+                for perdedora in pendentes:
+                    if not perdedora.cancel() and descartar is not None:
+                        perdedora.add_done_callback(
+                            lambda f: descartar(f.result()) if f.exception() is None else None
+                        )
+                return futuro.result()
+        raise erro
+
+    # ------------------------------------------------------------------
+    # Execução com asyncio
+    # ------------------------------------------------------------------
+
+    async def aexecutar(self, tipo: str, funcao: Callable[[], Awaitable[Any]]) -> Any:
+        """Versão assíncrona de executar(): a perdedora é cancelada."""
+        self._nova_chamada()
+        limite = self.limite(tipo)
+        inicio = time.perf_counter()
+        if limite is None:
+            resultado = await funcao()
+            self.observar(tipo, time.perf_counter() - inicio)
+            return resultado
+
+        original = asyncio.ensure_future(funcao())
+        pendentes = {original}
+        try:
+            concluidas, _ = await asyncio.wait(pendentes, timeout=limite)
+            if concluidas or not self._autorizar_copia():
+                resultado = await original
+                self.observar(tipo, time.perf_counter() - inicio)
+                return resultado
+
+            copia = asyncio.ensure_future(funcao())
+            pendentes = {original, copia}
+            erro = None
+            while pendentes:
+                concluidas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in concluidas:
+                    if tarefa.exception() is not None:
+                        erro = tarefa.exception()
+                        continue
+                    self.observar(tipo, time.perf_counter() - inicio)
+                    self._vencedora(tarefa is copia)
+                    return tarefa.result()
+            raise erro
+        finally:
+            # Perdedora (ou todas, se esta chamada foi cancelada): cancela e fecha a conexão
+            for tarefa in pendentes:
+                tarefa.cancel()
+
+    def estatisticas(self) -> dict:
+        return {
+            "chamadas": self.chamadas,
+            "copias": self.copias,
+            "taxa_copias": self.copias / self.chamadas if self.chamadas else 0.0,
+            "vitorias_copia": self.vitorias_copia,
+            "sem_orcamento": self.sem_orcamento,
+            "sem_threads": self.sem_threads,
+            "limites_s": {tipo: self.limite(tipo) for tipo in list(self._latencias)},
+        }
+
+
+class RedundanciaMixin:
+    """
+    Mixin para modelos de chat do LangChain: _generate/_agenerate e
+    _stream/_astream com cópia redundante pela Redundancia da classe.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.redundancia().executar(
+            "geracao", lambda: super(RedundanciaMixin, self)._generate(messages, stop, run_manager, **kwargs)
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.redundancia().aexecutar(
+            "geracao", lambda: super(RedundanciaMixin, self)._agenerate(messages, stop, run_manager, **kwargs)
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Sem run_manager nas tentativas: só os tokens da vencedora vão aos callbacks
+        fluxo, pedaco = self.redundancia().executar(
+            "fluxo",
+            lambda: _primeiro(super(RedundanciaMixin, self)._stream(messages, stop, None, **kwargs)),
+            descartar=lambda perdedora: perdedora[0].close(),
+        )
+        while pedaco is not None:
+            if run_manager:
+                run_manager.on_llm_new_token(pedaco.text, chunk=pedaco)
+            yield pedaco
+            pedaco = next(fluxo, None)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        fluxo, pedaco = await self.redundancia().aexecutar(
+            "fluxo", lambda: _aprimeiro(super(RedundanciaMixin, self)._astream(messages, stop, None, **kwargs))
+        )
+        if pedaco is None:
+            return
+        if run_manager:
+            await run_manager.on_llm_new_token(pedaco.text, chunk=pedaco)
+        yield pedaco
+        async for pedaco in fluxo:
+            if run_manager:
+                await run_manager.on_llm_new_token(pedaco.text, chunk=pedaco)
+            yield pedaco
+
+
+@lru_cache(maxsize=None)
+def classe_redundante(classe: type, redundancia: Redundancia) -> type:
+    """
+    Subclasse de `classe` (ex.: ChatOpenAI) com requisições redundantes.
+    Mantém o nome da original, como classe_agrupada.
+    """
+    return type(
+        classe.__name__,
+        (RedundanciaMixin, classe),
+        {"__doc__": classe.__doc__, "redundancia": staticmethod(lambda: redundancia)},
+    )
+
+
+_redundancia_global: Optional[Redundancia] = None
+_trava_global = threading.Lock()
+
+
+def obter_redundancia() -> Optional[Redundancia]:
+    """
+    Retorna a Redundancia compartilhada do processo, criada a partir das
+    variáveis de ambiente (ou None se LLM_REDUNDANCIA não for 1).
+    """
+    global _redundancia_global
+    if os.getenv("LLM_REDUNDANCIA", "0") != "1":
+        return None
+    with _trava_global:
+        if _redundancia_global is None:
+            _redundancia_global = Redundancia(
+                orcamento=float(os.getenv("LLM_REDUNDANCIA_ORCAMENTO", 0.05)),
+                percentil=float(os.getenv("LLM_REDUNDANCIA_PERCENTIL", 95)),
+                max_threads=int(os.getenv("LLM_REDUNDANCIA_MAX_THREADS", 64)),
+            )
+    return _redundancia_global
+
+
+def main():
+    """Latência das aulas 003 (threads) e 006 (asyncio) com e sem redundância, no servidor fake."""
+    parser = argparse.ArgumentParser(description="Requisições redundantes contra lentidões na cauda")
+    parser.add_argument("--requisicoes", type=int, default=400, help="Chamadas por rodada")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--orcamento", type=float, default=0.05, help="Fração máxima de requisições extras")
+    parser.add_argument("--prob-lentidao", type=float, default=0.03, help="Chance de uma lentidão no servidor")
+    parser.add_argument("--lentidao", type=float, default=2.0, help="Duração da lentidão (s)")
+    args = parser.parse_args()
+
+    from concurrent.futures import ThreadPoolExecutor as Executor
+
+    from langchain_core.chat_history import InMemoryChatMessageHistory
+
+    import aula003
+    import aula006
+    from fabrica_modelo import criar_modelo
+    from servidor_fake import ServidorFake
+
+    def resumo(latencias) -> str:
+        latencias = sorted(latencias)
+        return " | ".join(f"p{p} {percentil(latencias, p):.3f}s" for p in (50, 95, 99)) + f" | máx {latencias[-1]:.3f}s"
+
+    for redundante in (False, True):
+        with ServidorFake(
+            latencia_s=0.1, dispersao=0.3, prob_lentidao=args.prob_lentidao, lentidao_s=args.lentidao,
+            tokens_por_segundo=400, semente=7,
+        ) as servidor:
+            redundancia = Redundancia(orcamento=args.orcamento, metricas=Metricas()) if redundante else False
+            modelo = criar_modelo(
+                model_name="gpt-fake", openai_api_key="fake", base_url=servidor.url,
+                cache=False, agrupar=False, escalonador=False, redundancia=redundancia, max_tokens=100,
+            )
+            nome = "Com" if redundante else "Sem"
+
+            # aula003: invoke síncrono em threads
+            cadeia = aula003.criar_cadeia(modelo)
+
+            def chamar(i: int) -> float:
+                inicio = time.perf_counter()
+                cadeia.invoke({"interesse": f"praias {i}"})
+                return time.perf_counter() - inicio
+
+            with Executor(args.concorrencia) as executor:
+                latencias = list(executor.map(chamar, range(args.requisicoes)))
+            print(f"{nome} redundância, aula003: {resumo(latencias)}")
+
+            # aula006: turnos assíncronos com histórico, em streaming
+            historicos = {}
+            cadeia_chat = aula006.criar_cadeia_com_memoria(
+                modelo, lambda sessao: historicos.setdefault(sessao, InMemoryChatMessageHistory())
+            )
+
+            async def conversar() -> list:
+                limite = asyncio.Semaphore(args.concorrencia)
+
+                async def turno(i: int) -> float:
+                    async with limite:
+                        inicio = time.perf_counter()
+                        primeiro = None
+                        async for _ in cadeia_chat.astream(
+                            {"query": "Sugira uma cidade com praias."},
+                            config={"configurable": {"session_id": f"sessao-{i}"}},
+                        ):
+                            primeiro = primeiro or time.perf_counter() - inicio
+                        return primeiro
+
+                return await asyncio.gather(*(turno(i) for i in range(args.requisicoes)))
+
+            latencias = asyncio.run(conversar())
+            print(f"{nome} redundância, aula006 (TTFT): {resumo(latencias)}")
+            extras = servidor.estatisticas["requisicoes"] / (2 * args.requisicoes) - 1
+            print(f"  requisições ao servidor: {servidor.estatisticas['requisicoes']} ({extras:+.1%})")
+            if redundancia:
+                print(f"  {redundancia.estatisticas()}")
+
+
+if __name__ == "__main__":
+    main()
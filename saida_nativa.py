@@ -0,0 +1,192 @@
+"""
+Saída Estruturada Nativa (Ferramentas / JSON Schema) no Lugar das Instruções
+============================================================================
+
+As aulas 004 e 005 pedem JSON colocando no prompt o texto de
+`JsonOutputParser.get_format_instructions()`: o schema inteiro, mais um
+exemplo e as explicações, em todas as chamadas. Além de custar tokens de
+entrada, nada obriga o modelo a seguir as instruções: às vezes vem um
+texto antes do JSON ou falta um campo.
+
+Com a saída estruturada nativa, o schema vai na própria requisição e o
+provedor restringe a geração a ele (strict):
+- function_calling: o schema é a definição de uma ferramenta, e o modelo
+  responde com uma chamada dessa ferramenta
+- json_schema: o schema vai no `response_format` e a resposta é o JSON
+
+O json_schema no response_format só é aceito pela OpenAI a partir do
+gpt-4o-mini e do gpt-4o-2024-08-06; o gpt-3.5-turbo das aulas (e o gpt-4 /
+gpt-4-turbo) responde com erro 400. Com --saida json_schema, as aulas
+usam MODELO_JSON_SCHEMA no lugar de um modelo sem suporte (ver
+modelo_para_saida); o function_calling estrito funciona no gpt-3.5-turbo.
+
+O ModeloChatFake (--fake) responde por chamada de ferramenta nos dois
+métodos; o servidor_fake.py implementa os dois formatos da API.
+
+A saída continua sendo um dicionário (com dicionários parciais no
+streaming), como a do JsonOutputParser, então as cadeias seguintes, o
+fluxo_validado e o modo antecipado da aula005 funcionam sem mudanças.
+
+Conceitos abordados:
+- with_structured_output(schema, method=..., strict=True)
+- Tokens de entrada: as definições de ferramentas e o response_format
+  também são cobrados, mas são bem mais curtos que as instruções
+- Taxa de falhas de análise/validação de cada abordagem
+
+Uso:
+    python aula004.py --saida function_calling
+    python aula005.py --fake --saida json_schema
+
+    # Compara as três abordagens no servidor fake local
+    python saida_nativa.py --requisicoes 200 --taxa-json-invalido 0.05
+"""
+
+import argparse
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Type
+
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, ValidationError
+
+from instrumentacao import Metricas, instrumentar
+
+# "instrucoes" é a abordagem original (schema no prompt + JsonOutputParser)
+METODOS = ("instrucoes", "function_calling", "json_schema")
+
+# Modelo usado com json_schema quando o modelo pedido não tem suporte
+MODELO_JSON_SCHEMA = "gpt-4o-mini"
+# Prefixos dos modelos da OpenAI sem json_schema no response_format
+_SEM_JSON_SCHEMA = ("gpt-3.5", "gpt-4-", "gpt-4o-2024-05-13")
+
+
+def suporta_json_schema(nome_modelo: str) -> bool:
+    """Se o modelo da OpenAI aceita response_format do tipo json_schema."""
+    return nome_modelo != "gpt-4" and not nome_modelo.startswith(_SEM_JSON_SCHEMA)
+
+
+def modelo_para_saida(nome_modelo: str, metodo: str) -> str:
+    """Nome do modelo a usar com o método de saída: troca por MODELO_JSON_SCHEMA se preciso."""
+    if metodo == "json_schema" and not suporta_json_schema(nome_modelo):
+        warnings.warn(
+            f"{nome_modelo} não aceita response_format json_schema; usando {MODELO_JSON_SCHEMA}"
+        )
+        return MODELO_JSON_SCHEMA
+    return nome_modelo
+
+
+@lru_cache(maxsize=None)
+def _schema(esquema: Type[BaseModel]) -> dict:
+    """JSON Schema do modelo Pydantic (gerado uma única vez)."""
+    return esquema.model_json_schema()
+
+
+def saida_nativa(modelo, esquema: Type[BaseModel], metodo: str = "function_calling") -> Runnable:
+    """
+    Modelo que responde no formato de `esquema` usando a saída estruturada
+    nativa: prompt -> dicionário.
+
+    - metodo: "function_calling" ou "json_schema"
+    """
+    if metodo not in METODOS[1:]:
+        raise ValueError(f"Método de saída nativa desconhecido: {metodo} (use {' ou '.join(METODOS[1:])})")
+    # Schema em dicionário (e não a classe): a saída é um dict, com parciais no streaming
+    return modelo.with_structured_output(_schema(esquema), method=metodo, strict=True)
+
+
+# ----------------------------------------------------------------------
+# Comparação no servidor fake
+# ----------------------------------------------------------------------
+
+def _valida(resposta, validacoes: Dict[str, Type[BaseModel]]) -> bool:
+    """True se cada parte estruturada da resposta segue o seu modelo Pydantic."""
+    try:
+        for campo, esquema in validacoes.items():
+            esquema.model_validate(resposta if campo == "" else resposta[campo])
+    except (ValidationError, KeyError, TypeError):
+        return False
+    return True
+
+
+def comparar(servidor, requisicoes: int = 100, concorrencia: int = 16) -> list:
+    """
+    Executa as cadeias das aulas 004 e 005 com cada método e retorna, por
+    cadeia e método: tokens de entrada por requisição, falhas e tempo.
+    """
+    import aula004
+    import aula005
+    from fabrica_modelo import criar_modelo
+
+    modelo = criar_modelo(model_name="gpt-fake", openai_api_key="fake", base_url=servidor.url, cache=False)
+    casos = [
+        # (nome, criar(saida), validações: campo da resposta -> modelo; "" = a resposta inteira)
+        ("aula004", lambda saida: aula004.criar_cadeia(modelo, saida=saida), {"": aula004.DestinoTuristico}),
+        ("aula005", lambda saida: aula005.criar_cadeia(modelo, saida=saida), {
+            "": aula005.DestinoTuristico, "restaurante": aula005.Restaurante,
+        }),
+    ]
+    entradas = [{"interesse": f"praias {i}"} for i in range(requisicoes)]
+
+    resultados = []
+    for nome, criar, validacoes in casos:
+        for metodo in METODOS:
+            metricas = Metricas()
+            cadeia = instrumentar(criar(metodo), metricas)
+
+            def executar(entrada):
+                try:
+                    return _valida(cadeia.invoke(entrada), validacoes)
+                except Exception:
+                    # OutputParserException (JSON malformado) e afins
+                    return False
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(concorrencia) as executor:
+                validas = sum(executor.map(executar, entradas))
+            duracao = time.perf_counter() - inicio
+            tokens_entrada = sum(
+                contador["valor"] for contador in metricas.exportar_json()["contadores"]
+                if contador["nome"] == "llm_tokens_total" and contador["rotulos"]["tipo"] == "entrada"
+            )
+            resultados.append({
+                "cadeia": nome,
+                "metodo": metodo,
+                "tokens_entrada_por_requisicao": tokens_entrada / requisicoes,
+                "taxa_falhas": 1 - validas / requisicoes,
+                "duracao_s": duracao,
+            })
+    return resultados
+
+
+def main():
+    """Compara instruções no prompt, function calling e JSON Schema no servidor fake."""
+    parser = argparse.ArgumentParser(description="Saída estruturada nativa x instruções de formato")
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument(
+        "--taxa-json-invalido", type=float, default=0.05,
+        help="Fração de JSON malformado do servidor fake quando o formato vem só do prompt",
+    )
+    args = parser.parse_args()
+
+    from servidor_fake import ServidorFake
+
+    with ServidorFake(latencia_s=0.01, semente=42, taxa_json_invalido=args.taxa_json_invalido) as servidor:
+        resultados = comparar(servidor, args.requisicoes, args.concorrencia)
+
+    print(f"{'cadeia':<9} {'método':<17} {'tokens entrada/req':>19} {'economia':>9} {'falhas':>8}")
+    base = {}
+    for resultado in resultados:
+        tokens = resultado["tokens_entrada_por_requisicao"]
+        base.setdefault(resultado["cadeia"], tokens)
+        economia = 1 - tokens / base[resultado["cadeia"]]
+        print(
+            f"{resultado['cadeia']:<9} {resultado['metodo']:<17} {tokens:>19.1f} "
+            f"{economia:>8.0%} {resultado['taxa_falhas']:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Serviço de Chat Assíncrono Multi-sessão
+=======================================
+
+A aula006 atende uma única sessão, pergunta por pergunta. Este módulo
+envolve a cadeia com memória da aula006 em um serviço asyncio que atende
+muitas sessões ao mesmo tempo.
+
+Conceitos abordados:
+- Ordem por sessão: os turnos de uma mesma sessão são serializados (o
+  histórico de um turno precisa do turno anterior), enquanto sessões
+  diferentes são atendidas em paralelo
+- Limite de chamadas simultâneas ao modelo (asyncio.Semaphore)
+- Contrapressão: com o modelo saturado, novos pedidos aguardam na fila
+  até `max_pendentes`; acima disso são recusados com ServicoSobrecarregado
+- Gerador de carga com relatório de sessões/s e latência p50/p95/p99
+
+Uso:
+    python servico_chat.py --fake --sessoes 500 --turnos 3 --concorrencia 64
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from aula006 import MAX_TOKENS_HISTORICO, criar_cadeia_com_memoria
+from fabrica_modelo import criar_modelo
+from historico_resumido import HistoricoResumido
+from modelo_fake import ModeloChatFake
+from processamento_lote import percentil
+
+
+class ServicoSobrecarregado(RuntimeError):
+    """Lançada quando a fila de pedidos atingiu `max_pendentes`."""
+
+
+class ServicoChat:
+    """
+    Atende turnos de conversa de várias sessões sobre uma cadeia com memória.
+
+    - cadeia_com_memoria: RunnableWithMessageHistory (config["session_id"])
+    - max_concorrencia: chamadas simultâneas à cadeia (ao modelo)
+    - max_pendentes: pedidos aceitos (em execução + aguardando) antes de recusar
+    """
+
+    def __init__(self, cadeia_com_memoria, max_concorrencia: int = 64, max_pendentes: int = 1000):
+        self.cadeia = cadeia_com_memoria
+        self.max_pendentes = max_pendentes
+        self._semaforo = asyncio.Semaphore(max_concorrencia)
+        # sessao_id -> [trava, pedidos usando a trava]; removida quando ninguém mais a usa
+        self._travas: Dict[str, list] = {}
+        self.pendentes = 0
+        self.atendidos = 0
+        self.recusados = 0
+
+    async def responder(self, sessao_id: str, pergunta: str) -> str:
+        """Processa um turno da sessão, respeitando a ordem dos turnos dela."""
+        if self.pendentes >= self.max_pendentes:
+            self.recusados += 1
+            raise ServicoSobrecarregado(
+                f"{self.pendentes} pedidos pendentes (limite {self.max_pendentes})"
+            )
+        self.pendentes += 1
+        entrada = self._travas.setdefault(sessao_id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                async with self._semaforo:
+                    resposta = await self.cadeia.ainvoke(
+                        {"query": pergunta},
+                        config={"session_id": sessao_id, "metadata": {"prioridade": "interativa"}},
+                    )
+            self.atendidos += 1
+            return resposta
+        finally:
+            self.pendentes -= 1
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._travas[sessao_id]
+
+
+# ----------------------------------------------------------------------
+# Gerador de carga
+# ----------------------------------------------------------------------
+
+PERGUNTAS = [
+    "Quero visitar cidades com muitas praias. Quais você recomenda?",
+    "Qual a melhor epoca do ano para visitar essas cidades?",
+    "E para quem gosta de museus?",
+    "Quais pratos típicos devo experimentar?",
+]
+
+
+async def gerar_carga(
+    servico: ServicoChat,
+    sessoes: int,
+    turnos: int,
+    intervalo_chegada_s: float = 0.0,
+    semente: Optional[int] = 42,
+) -> dict:
+    """
+    Simula `sessoes` usuários, cada um enviando `turnos` perguntas em sequência.
+    As sessões chegam com intervalos exponenciais de média `intervalo_chegada_s`.
+    """
+    aleatorio = random.Random(semente)
+    latencias: List[float] = []
+    erros = 0
+
+    async def usuario(indice: int, atraso: float):
+        nonlocal erros
+        await asyncio.sleep(atraso)
+        for turno in range(turnos):
+            inicio = time.perf_counter()
+            try:
+                await servico.responder(f"sessao-{indice}", PERGUNTAS[turno % len(PERGUNTAS)])
+            except Exception:
+                erros += 1
+                return
+            latencias.append(time.perf_counter() - inicio)
+
+    atraso = 0.0
+    tarefas = []
+    for indice in range(sessoes):
+        tarefas.append(usuario(indice, atraso))
+        if intervalo_chegada_s > 0:
+            atraso += aleatorio.expovariate(1 / intervalo_chegada_s)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*tarefas)
+    duracao = time.perf_counter() - inicio
+    return {
+        "sessoes": sessoes,
+        "turnos": len(latencias),
+        "erros": erros,
+        "duracao_s": duracao,
+        "sessoes_por_s": sessoes / duracao if duracao else 0.0,
+        "turnos_por_s": len(latencias) / duracao if duracao else 0.0,
+        "p50_s": percentil(latencias, 50),
+        "p95_s": percentil(latencias, 95),
+        "p99_s": percentil(latencias, 99),
+    }
+
+
+def main():
+    """Executa o gerador de carga contra o serviço de chat."""
+    parser = argparse.ArgumentParser(description="Serviço de chat multi-sessão (teste de carga)")
+    parser.add_argument("--fake", action="store_true", help="Usa o modelo fake local")
+    parser.add_argument("--sessoes", type=int, default=200, help="Número de sessões simuladas")
+    parser.add_argument("--turnos", type=int, default=3, help="Perguntas por sessão")
+    parser.add_argument("--concorrencia", type=int, default=64, help="Chamadas simultâneas ao modelo")
+    parser.add_argument("--max-pendentes", type=int, default=10_000, help="Limite da fila de pedidos")
+    parser.add_argument("--intervalo-chegada", type=float, default=0.0, help="Intervalo médio entre novas sessões (s)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.fake:
+        modelo = ModeloChatFake(latencia_s=0.2, desvio_latencia_s=0.3)
+    else:
+        modelo = criar_modelo(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            temperature=0.7,
+            max_tokens=500
+        )
+
+    memoria = {}
+
+    def historico_por_sessao(sessao_id: str) -> HistoricoResumido:
+        if sessao_id not in memoria:
+            memoria[sessao_id] = HistoricoResumido(modelo, max_tokens=MAX_TOKENS_HISTORICO)
+        return memoria[sessao_id]
+
+    async def executar():
+        servico = ServicoChat(
+            criar_cadeia_com_memoria(modelo, historico_por_sessao),
+            max_concorrencia=args.concorrencia,
+            max_pendentes=args.max_pendentes,
+        )
+        return await gerar_carga(servico, args.sessoes, args.turnos, args.intervalo_chegada)
+
+    relatorio = asyncio.run(executar())
+    print(
+        f"{relatorio['sessoes']} sessões, {relatorio['turnos']} turnos ({relatorio['erros']} erros) "
+        f"em {relatorio['duracao_s']:.2f}s"
+    )
+    print(f"Vazão: {relatorio['sessoes_por_s']:.1f} sessões/s | {relatorio['turnos_por_s']:.1f} turnos/s")
+    print(
+        f"Latência por turno: p50 {relatorio['p50_s'] * 1000:.0f}ms | "
+        f"p95 {relatorio['p95_s'] * 1000:.0f}ms | p99 {relatorio['p99_s'] * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Servidor Local Compatível com a API da OpenAI
+=============================================
+
+Servidor HTTP que imita o endpoint /v1/chat/completions da OpenAI. Com ele,
+o próprio ChatOpenAI (cliente HTTP, streaming, retentativas) é exercitado
+sem chave de API e sem acesso à rede, com latência e erros controlados.
+
+Conceitos abordados:
+- Endpoint /v1/chat/completions com e sem streaming (Server-Sent Events)
+- Latência até o primeiro token com distribuição log-normal (mediana e
+  dispersão configuráveis) e lentidões ocasionais na cauda
+- Velocidade de geração em tokens por segundo
+- Erros simulados: 500 (falha) e 429 (limite de taxa, com Retry-After)
+- Limites de requisições e de tokens por minuto (RPM/TPM), com 429 e
+  Retry-After quando excedidos
+- Saída estruturada nativa: chamada de ferramentas (`tools`) e
+  `response_format` do tipo json_schema
+- JSON malformado ou incompleto ocasional quando o formato é pedido
+  apenas por instruções no prompt (`taxa_json_invalido`)
+- Conexões keep-alive (HTTP/1.1 com Content-Length ou chunked)
+- Comportamento por modelo (`modelos`): ex. um modelo rápido que erra o
+  JSON com mais frequência e um modelo forte, mais lento
+
+As respostas são geradas por modelo_fake.resposta_padrao: JSON com os
+campos do schema quando o prompt traz instruções de formato, texto
+simples caso contrário.
+
+Uso:
+    python servidor_fake.py --porta 8765 --latencia 0.2 --tokens-por-segundo 50
+
+    # Em outro terminal, aponte o ChatOpenAI para o servidor:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python aula003.py
+
+    # Ou dentro do Python:
+    with ServidorFake(latencia_s=0.2) as servidor:
+        modelo = criar_modelo(base_url=servidor.url, api_key="fake", ...)
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modelo_fake import dividir_em_tokens, estimar_tokens, resposta_esquema, resposta_padrao
+
+
+@dataclass
+class ConfiguracaoServidor:
+    """Comportamento simulado do servidor."""
+    latencia_s: float = 0.2             # mediana da latência até o primeiro token
+    dispersao: float = 0.0              # sigma da distribuição log-normal (0 = constante)
+    prob_lentidao: float = 0.0          # probabilidade de uma lentidão extra (cauda)
+    lentidao_s: float = 2.0             # duração da lentidão extra
+    tokens_por_segundo: float = 0.0     # 0 = todos os tokens de uma vez
+    taxa_erro: float = 0.0              # fração de respostas 500
+    taxa_limite: float = 0.0            # fração de respostas 429
+    limite_rpm: float = 0.0             # requisições por minuto (0 = sem limite)
+    limite_tpm: float = 0.0             # tokens por minuto: entrada + max_tokens (0 = sem limite)
+    rajada_s: float = 1.0               # os limites valem em janelas curtas: rajada de rajada_s segundos
+    tamanho_resposta: int = 40          # palavras nas respostas em texto
+    taxa_json_invalido: float = 0.0     # fração de JSON malformado ou incompleto quando o
+                                        # formato vem só das instruções do prompt
+    modelos: Dict[str, dict] = field(default_factory=dict)
+                                        # nome do modelo -> campos acima com outros valores
+
+
+def _corromper_json(texto: str, sorteio: float) -> str:
+    """Falhas típicas de JSON pedido só por instruções: texto antes do objeto ou campo faltando."""
+    if sorteio < 0.5:
+        return "Claro! Aqui está a sugestão: " + texto
+    dados = json.loads(texto)
+    dados.pop(list(dados)[-1])
+    return json.dumps(dados, ensure_ascii=False)
+
+
+class _Manipulador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        # Silencia o log de acesso padrão (uma linha por requisição)
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.estatisticas_incrementar("conexoes")
+
+    def _responder_json(self, status: int, corpo: dict, cabecalhos: dict = None) -> None:
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _enviar_pedaco(self, evento: dict) -> None:
+        """Envia um evento SSE usando codificação chunked."""
+        dados = f"data: {json.dumps(evento, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(dados):x}\r\n".encode("ascii") + dados + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._responder_json(404, {"error": {"message": f"Rota desconhecida: {self.path}"}})
+            return
+
+        servidor = self.server
+        configuracao = servidor.configuracao_modelo(pedido.get("model"))
+        servidor.estatisticas_incrementar("requisicoes")
+        sorteio = servidor.sortear()
+        if sorteio < configuracao.taxa_limite:
+            servidor.estatisticas_incrementar("respostas_429")
+            self._responder_json(
+                429,
+                {"error": {"message": "Rate limit simulado", "type": "rate_limit_error"}},
+                {"Retry-After": "1"},
+            )
+            return
+        if sorteio < configuracao.taxa_limite + configuracao.taxa_erro:
+            servidor.estatisticas_incrementar("respostas_500")
+            self._responder_json(500, {"error": {"message": "Falha simulada", "type": "server_error"}})
+            return
+
+        prompt = "\n".join(str(mensagem.get("content") or "") for mensagem in pedido.get("messages", []))
+        # Saída estruturada nativa: o schema vem na ferramenta ou no response_format,
+        # e a geração restrita ao schema (strict) sempre produz um JSON válido
+        ferramenta = (pedido.get("tools") or [{}])[0].get("function")
+        formato = pedido.get("response_format") or {}
+        if ferramenta:
+            texto = resposta_esquema(ferramenta.get("parameters", {}), prompt)
+        elif formato.get("type") == "json_schema":
+            texto = resposta_esquema(formato["json_schema"].get("schema", {}), prompt)
+        else:
+            texto = resposta_padrao(prompt, configuracao.tamanho_resposta)
+            if texto.startswith("{") and servidor.sortear() < configuracao.taxa_json_invalido:
+                servidor.estatisticas_incrementar("json_invalido")
+                texto = _corromper_json(texto, servidor.sortear())
+        tokens = dividir_em_tokens(texto)
+        if pedido.get("max_tokens"):
+            tokens = tokens[: pedido["max_tokens"]]
+        # As definições de ferramentas e o schema também são cobrados como entrada
+        tokens_entrada = estimar_tokens(prompt)
+        if pedido.get("tools") or formato:
+            tokens_entrada += estimar_tokens(json.dumps([pedido.get("tools"), formato], ensure_ascii=False))
+        espera = servidor.consumir_limites(tokens_entrada + (pedido.get("max_tokens") or 0))
+        if espera is not None:
+            servidor.estatisticas_incrementar("respostas_429")
+            self._responder_json(
+                429,
+                {"error": {"message": "Limite de requisições/tokens por minuto excedido", "type": "rate_limit_error"}},
+                {"Retry-After": f"{espera:.3f}"},
+            )
+            return
+        uso = {
+            "prompt_tokens": tokens_entrada,
+            "completion_tokens": len(tokens),
+            "total_tokens": tokens_entrada + len(tokens),
+        }
+        modelo = pedido.get("model", "fake-gpt")
+        identificador = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        id_chamada = f"call_{uuid.uuid4().hex[:12]}"
+        intervalo = 1.0 / configuracao.tokens_por_segundo if configuracao.tokens_por_segundo > 0 else 0.0
+
+        time.sleep(servidor.sortear_latencia(configuracao))
+
+        if not pedido.get("stream"):
+            time.sleep(intervalo * len(tokens))
+            self._responder_json(200, {
+                "id": identificador,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "message": (
+                        {"role": "assistant", "content": None, "tool_calls": [
+                            {"id": id_chamada, "type": "function",
+                             "function": {"name": ferramenta["name"], "arguments": "".join(tokens)}},
+                        ]}
+                        if ferramenta else {"role": "assistant", "content": "".join(tokens)}
+                    ),
+                    "finish_reason": "tool_calls" if ferramenta else "stop",
+                }],
+                "usage": uso,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def evento(delta: dict, finish_reason=None, usage=None) -> dict:
+            return {
+                "id": identificador,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        if ferramenta:
+            # Argumentos da chamada de ferramenta chegam em pedaços, como o conteúdo
+            self._enviar_pedaco(evento({"role": "assistant", "content": None, "tool_calls": [
+                {"index": 0, "id": id_chamada, "type": "function",
+                 "function": {"name": ferramenta["name"], "arguments": ""}},
+            ]}))
+        else:
+            self._enviar_pedaco(evento({"role": "assistant", "content": ""}))
+        for posicao, token in enumerate(tokens):
+            if posicao and intervalo:
+                time.sleep(intervalo)
+            if ferramenta:
+                self._enviar_pedaco(evento({"tool_calls": [{"index": 0, "function": {"arguments": token}}]}))
+            else:
+                self._enviar_pedaco(evento({"content": token}))
+        self._enviar_pedaco(evento({}, finish_reason="tool_calls" if ferramenta else "stop"))
+        if (pedido.get("stream_options") or {}).get("include_usage"):
+            self._enviar_pedaco(evento({}, usage=uso))
+        fim = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(fim):x}\r\n".encode("ascii") + fim + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+class ServidorFake(ThreadingHTTPServer):
+    """
+    Servidor HTTP em uma thread de fundo. Use como gerenciador de contexto
+    ou chame iniciar()/parar(). A URL base para o cliente fica em `url`.
+    """
+
+    daemon_threads = True
+    # Fila de conexões pendentes: o padrão (5) descarta SYNs sob alta concorrência
+    request_queue_size = 1024
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = 0, semente: int = None, **configuracao):
+        super().__init__((host, porta), _Manipulador)
+        self.configuracao = ConfiguracaoServidor(**configuracao)
+        self._aleatorio = random.Random(semente)
+        self._trava = threading.Lock()
+        # Baldes de requisições e de tokens: [disponível, última reposição]
+        self._baldes = {"rpm": [None, time.monotonic()], "tpm": [None, time.monotonic()]}
+        self._configuracoes_modelos: Dict[str, ConfiguracaoServidor] = {}
+        self._thread = None
+        self.estatisticas = {
+            "requisicoes": 0, "conexoes": 0, "respostas_429": 0, "respostas_500": 0, "json_invalido": 0,
+        }
+
+    @property
+    def url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}/v1"
+
+    def estatisticas_incrementar(self, nome: str) -> None:
+        with self._trava:
+            self.estatisticas[nome] += 1
+
+    def sortear(self) -> float:
+        with self._trava:
+            return self._aleatorio.random()
+
+    def consumir_limites(self, tokens: int) -> Optional[float]:
+        """
+        Desconta a requisição dos limites RPM/TPM (baldes de tokens com rajada
+        de `rajada_s` segundos). Retorna None se ela cabe nos limites, ou os
+        segundos até caber (Retry-After) sem descontar nada.
+        """
+        configuracao = self.configuracao
+        custos = {"rpm": (configuracao.limite_rpm, 1), "tpm": (configuracao.limite_tpm, tokens)}
+        agora = time.monotonic()
+        with self._trava:
+            espera = 0.0
+            for nome, (limite, custo) in custos.items():
+                if limite <= 0:
+                    continue
+                taxa = limite / 60
+                capacidade = max(taxa * configuracao.rajada_s, custo)
+                balde = self._baldes[nome]
+                disponivel = capacidade if balde[0] is None else min(capacidade, balde[0] + (agora - balde[1]) * taxa)
+                balde[:] = [disponivel, agora]
+                espera = max(espera, (custo - disponivel) / taxa)
+            if espera > 0:
+                return espera
+            for nome, (limite, custo) in custos.items():
+                if limite > 0:
+                    self._baldes[nome][0] -= custo
+        return None
+
+    def configuracao_modelo(self, modelo: Optional[str]) -> ConfiguracaoServidor:
+        """Configuração para o modelo pedido: a geral, com as diferenças de `modelos`."""
+        diferencas = self.configuracao.modelos.get(modelo)
+        if not diferencas:
+            return self.configuracao
+        with self._trava:
+            if modelo not in self._configuracoes_modelos:
+                self._configuracoes_modelos[modelo] = replace(self.configuracao, **diferencas)
+            return self._configuracoes_modelos[modelo]
+
+    def sortear_latencia(self, configuracao: ConfiguracaoServidor = None) -> float:
+        """Latência até o primeiro token: log-normal em torno da mediana, mais lentidões ocasionais."""
+        configuracao = configuracao or self.configuracao
+        with self._trava:
+            latencia = configuracao.latencia_s
+            if configuracao.dispersao > 0 and latencia > 0:
+                latencia = math.exp(self._aleatorio.gauss(math.log(latencia), configuracao.dispersao))
+            if configuracao.prob_lentidao and self._aleatorio.random() < configuracao.prob_lentidao:
+                latencia += configuracao.lentidao_s
+        return latencia
+
+    def handle_error(self, request, client_address) -> None:
+        # Cliente que desistiu da resposta (ex.: cópia redundante cancelada): não é um erro do servidor
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def iniciar(self) -> "ServidorFake":
+        self._thread = threading.Thread(target=self.serve_forever, name="servidor-fake", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "ServidorFake":
+        return self.iniciar()
+
+    def __exit__(self, *excecao) -> None:
+        self.parar()
+
+
+def main():
+    """Executa o servidor fake em primeiro plano."""
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a API da OpenAI")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2, help="Mediana da latência até o primeiro token (s)")
+    parser.add_argument("--dispersao", type=float, default=0.3, help="Sigma da distribuição log-normal")
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 500")
+    parser.add_argument("--taxa-limite", type=float, default=0.0, help="Fração de respostas 429")
+    parser.add_argument("--limite-rpm", type=float, default=0.0, help="Requisições por minuto (0 = sem limite)")
+    parser.add_argument("--limite-tpm", type=float, default=0.0, help="Tokens por minuto (0 = sem limite)")
+    parser.add_argument(
+        "--taxa-json-invalido", type=float, default=0.0,
+        help="Fração de JSON malformado quando o formato vem só das instruções do prompt",
+    )
+    args = parser.parse_args()
+
+    servidor = ServidorFake(
+        porta=args.porta,
+        latencia_s=args.latencia,
+        dispersao=args.dispersao,
+        tokens_por_segundo=args.tokens_por_segundo,
+        taxa_erro=args.taxa_erro,
+        taxa_limite=args.taxa_limite,
+        taxa_json_invalido=args.taxa_json_invalido,
+        limite_rpm=args.limite_rpm,
+        limite_tpm=args.limite_tpm,
+    )
+    print(f"Servidor fake em {servidor.url} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Templates de Prompt Compilados para Renderização em Massa
+=========================================================
+
+O PromptTemplate e o ChatPromptTemplate validam as variáveis, mesclam as
+partial_variables, percorrem o template com o string.Formatter (em Python)
+e, no caso do chat, criam objetos de mensagem a cada chamada. Em jobs que
+renderizam milhões de prompts, esse custo aparece no perfil, assim como a
+geração das instruções de formato a partir do schema Pydantic.
+
+Este módulo compila cada template uma única vez em uma string de formato
+do Python (com as partial_variables fixas já embutidas) e renderiza com
+str.format_map, implementado em C. A saída é idêntica ao `.format()` do
+template original.
+
+Conceitos abordados:
+- Compilação única: partial_variables fixas embutidas no texto; mensagens
+  de um ChatPromptTemplate unidas com os prefixos de get_buffer_string
+- Registro de templates por nome, compilados no primeiro uso
+- Instruções de formato memoizadas por modelo Pydantic
+- format_many: renderiza um lote de dicionários de variáveis com uma
+  única chamada em C por item
+
+Uso:
+    from templates_compilados import TEMPLATES, instrucoes_formato
+
+    template = TEMPLATES.obter("plano", aula002.criar_template)
+    prompts = template.format_many([{"numero_dias": 7, ...}, ...])
+
+    partial_variables={"formato_de_saida": instrucoes_formato(DestinoTuristico)}
+
+    python templates_compilados.py --quantidade 100000   # compara com o .format()
+"""
+
+import argparse
+import threading
+import time
+from functools import lru_cache
+from string import Formatter
+from typing import Callable, Dict, Iterable, List, Optional, Type, Union
+
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from pydantic import BaseModel
+
+
+@lru_cache(maxsize=None)
+def instrucoes_formato(modelo: Type[BaseModel]) -> str:
+    """Instruções de formato JSON do JsonOutputParser para o modelo (geradas uma única vez)."""
+    return JsonOutputParser(pydantic_object=modelo).get_format_instructions()
+
+
+def _escapar(texto: str) -> str:
+    """Protege as chaves de um texto fixo para uso em uma string de formato."""
+    return texto.replace("{", "{{").replace("}", "}}")
+
+
+def _compilar_prompt(template: PromptTemplate, parciais: Dict[str, object]) -> str:
+    """String de formato equivalente a um PromptTemplate f-string, com as parciais fixas embutidas."""
+    if template.template_format != "f-string":
+        raise ValueError(f"Apenas templates f-string podem ser compilados (recebido: {template.template_format})")
+    fixas = {
+        nome: valor for nome, valor in {**parciais, **template.partial_variables}.items() if not callable(valor)
+    }
+    partes = []
+    for literal, campo, especificacao, conversao in Formatter().parse(template.template):
+        partes.append(_escapar(literal))
+        if campo is None:
+            continue
+        if campo in fixas and not especificacao and not conversao:
+            partes.append(_escapar(str(fixas[campo])))
+        else:
+            partes.append(
+                "{" + campo + (f"!{conversao}" if conversao else "") + (f":{especificacao}" if especificacao else "") + "}"
+            )
+    return "".join(partes)
+
+
+class TemplateCompilado:
+    """
+    Versão compilada de um PromptTemplate ou ChatPromptTemplate.
+
+    - format(**variaveis): mesmo texto do .format() do template original
+    - format_many(lote): lista de textos, um por dicionário de variáveis
+    - format_messages(**variaveis): mensagens (apenas para templates de chat)
+    """
+
+    __slots__ = ("template", "input_variables", "_formato", "_mensagens", "_parciais_dinamicas")
+
+    def __init__(self, template: Union[PromptTemplate, ChatPromptTemplate]):
+        self.template = template
+        self.input_variables = list(template.input_variables)
+        # Parciais calculadas a cada chamada (ex.: data atual) não podem ser embutidas
+        self._parciais_dinamicas = {
+            nome: valor for nome, valor in template.partial_variables.items() if callable(valor)
+        }
+        # (formato, classe da mensagem, argumentos extras) para cada mensagem do chat
+        self._mensagens = None
+
+        if isinstance(template, PromptTemplate):
+            self._formato = _compilar_prompt(template, {})
+        elif isinstance(template, ChatPromptTemplate):
+            self._mensagens = []
+            for mensagem in template.messages:
+                if isinstance(mensagem, BaseMessage):
+                    formato = _escapar(mensagem.content)
+                    exemplo = mensagem
+                elif isinstance(getattr(mensagem, "prompt", None), PromptTemplate):
+                    formato = _compilar_prompt(mensagem.prompt, template.partial_variables)
+                    # Uma mensagem vazia do mesmo tipo fornece a classe e o prefixo (System, Human, AI...)
+                    exemplo = mensagem.format(**{nome: "" for nome in mensagem.input_variables})
+                else:
+                    raise ValueError(f"Mensagem não suportada na compilação: {type(mensagem).__name__}")
+                extras = {"role": exemplo.role} if hasattr(exemplo, "role") else {}
+                self._mensagens.append((formato, type(exemplo), extras))
+            # O .format() do chat une as mensagens com os prefixos de get_buffer_string
+            linhas = []
+            for formato, classe, extras in self._mensagens:
+                prefixo = get_buffer_string([classe(content="", **extras)])
+                linhas.append(_escapar(prefixo) + formato)
+            self._formato = "\n".join(linhas)
+        else:
+            raise TypeError(f"Template não suportado: {type(template).__name__}")
+
+    def _variaveis(self, variaveis: dict) -> dict:
+        if not self._parciais_dinamicas:
+            return variaveis
+        return {**{nome: funcao() for nome, funcao in self._parciais_dinamicas.items()}, **variaveis}
+
+    def format(self, **variaveis) -> str:
+        return self._formato.format_map(self._variaveis(variaveis))
+
+    def format_many(self, lote: Iterable[dict]) -> List[str]:
+        """Renderiza um lote de dicionários de variáveis."""
+        formatar = self._formato.format_map
+        if self._parciais_dinamicas:
+            return [formatar(self._variaveis(variaveis)) for variaveis in lote]
+        return [formatar(variaveis) for variaveis in lote]
+
+    def format_messages(self, **variaveis) -> List[BaseMessage]:
+        if self._mensagens is None:
+            raise TypeError("format_messages está disponível apenas para templates de chat")
+        variaveis = self._variaveis(variaveis)
+        return [
+            classe(content=formato.format_map(variaveis), **extras)
+            for formato, classe, extras in self._mensagens
+        ]
+
+
+class RegistroTemplates:
+    """Templates compilados por nome; cada um é compilado uma única vez."""
+
+    def __init__(self):
+        self._templates: Dict[str, TemplateCompilado] = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, nome: str, template: Union[PromptTemplate, ChatPromptTemplate]) -> TemplateCompilado:
+        compilado = TemplateCompilado(template)
+        with self._trava:
+            self._templates[nome] = compilado
+        return compilado
+
+    def obter(self, nome: str, criar: Optional[Callable[[], Union[PromptTemplate, ChatPromptTemplate]]] = None) -> TemplateCompilado:
+        """Retorna o template `nome`; se ainda não existir, compila o resultado de `criar()`."""
+        compilado = self._templates.get(nome)
+        if compilado is not None:
+            return compilado
+        if criar is None:
+            raise KeyError(f"Template não registrado: {nome}")
+        with self._trava:
+            if nome not in self._templates:
+                self._templates[nome] = TemplateCompilado(criar())
+            return self._templates[nome]
+
+    def __contains__(self, nome: str) -> bool:
+        return nome in self._templates
+
+
+# Registro padrão do processo
+TEMPLATES = RegistroTemplates()
+
+
+def main():
+    """Compara o .format() do LangChain com a versão compilada nos templates das aulas."""
+    parser = argparse.ArgumentParser(description="Templates de prompt compilados")
+    parser.add_argument("--quantidade", type=int, default=100_000, help="Prompts renderizados por template")
+    args = parser.parse_args()
+
+    import aula002
+    import aula004
+
+    prompt_cidade = PromptTemplate(
+        template="Sugira uma cidade dado o meu interesse por {interesse}.{formato_de_saida}",
+        input_variables=["interesse"],
+        partial_variables={"formato_de_saida": instrucoes_formato(aula004.DestinoTuristico)}
+    )
+    casos = {
+        "aula002 (ChatPromptTemplate)": (
+            aula002.criar_template(),
+            [{"numero_dias": i % 10 + 1, "numero_criancas": i % 4 + 1, "atividade": "música"} for i in range(args.quantidade)],
+        ),
+        "aula004 (PromptTemplate + formato)": (
+            prompt_cidade,
+            [{"interesse": f"praias {i}"} for i in range(args.quantidade)],
+        ),
+    }
+    for nome, (template, lote) in casos.items():
+        inicio = time.perf_counter()
+        originais = [template.format(**variaveis) for variaveis in lote]
+        tempo_original = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        compilado = TEMPLATES.registrar(nome, template)
+        compilados = compilado.format_many(lote)
+        tempo_compilado = time.perf_counter() - inicio
+
+        assert compilados == originais, "saída compilada diferente do .format() original"
+        print(
+            f"{nome}: .format() {len(lote) / tempo_original:,.0f}/s | "
+            f"format_many {len(lote) / tempo_compilado:,.0f}/s "
+            f"({tempo_original / tempo_compilado:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()